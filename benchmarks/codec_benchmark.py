@@ -0,0 +1,86 @@
+"""
+Benchmarks encoding queries and decoding SELECT responses with each installed codec.
+
+# Notes
+Run from the root of the repository with:
+```
+PYTHONPATH=src python benchmarks/codec_benchmark.py --rows 20000 --repeat 20
+```
+Install orjson or msgspec to include them in the benchmark.
+"""
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+from sblpy.cbor import RecordID
+from sblpy.codec import CborCodec, Codec, JsonCodec, available_json_backends
+
+
+def select_response(rows: int, record_ids: bool) -> Dict[str, Any]:
+    """
+    Builds the response of a SELECT returning the rows of a user table.
+
+    :param rows: (int) the number of rows in the response
+    :param record_ids: (bool) whether the IDs are RecordIDs as returned over CBOR, else strings as returned over JSON
+    :return: (Dict[str, Any]) the raw response
+    """
+    result = []
+    for i in range(rows):
+        result.append({
+            "id": RecordID("user", i) if record_ids is True else f"user:{i}",
+            "name": f"user {i}",
+            "email": f"user{i}@example.com",
+            "age": i % 90,
+            "score": i * 1.5,
+            "active": i % 2 == 0,
+            "tags": ["admin", "beta"] if i % 10 == 0 else ["member"],
+            "address": {"city": "London", "postcode": f"E{i % 20} 1AA"},
+        })
+    return {"id": "request", "result": [{"status": "OK", "time": "12.3ms", "result": result}]}
+
+
+def best_of(repeat: int, function: Callable[[], Any]) -> float:
+    """
+    Times a function several times.
+
+    :param repeat: (int) the number of times to run the function
+    :param function: (Callable[[], Any]) the function to time
+    :return: (float) the fastest run in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="benchmark the codecs of the RPC messages")
+    parser.add_argument("--rows", type=int, default=20000, help="the number of rows in the SELECT response")
+    parser.add_argument("--repeat", type=int, default=20, help="the number of times each measurement is taken")
+    args = parser.parse_args()
+
+    codecs: List[Codec] = [JsonCodec(backend) for backend in reversed(available_json_backends())]
+    codecs.append(CborCodec())
+
+    print(f"SELECT response of {args.rows} rows, best of {args.repeat}")
+    print(f"{'codec':<16}{'size (KiB)':>12}{'encode (ms)':>14}{'decode (ms)':>14}{'decode speedup':>16}")
+    baseline = None
+    for codec in codecs:
+        response = select_response(args.rows, record_ids=isinstance(codec, CborCodec))
+        encoded = codec.encode(response)
+        frame = encoded.encode("utf-8") if isinstance(encoded, str) else encoded
+        encode_time = best_of(args.repeat, lambda: codec.encode(response))
+        decode_time = best_of(args.repeat, lambda: codec.decode(frame))
+        if baseline is None:
+            baseline = decode_time
+        name = codec.backend if isinstance(codec, JsonCodec) else codec.protocol
+        print(
+            f"{name:<16}{len(frame) / 1024:>12.1f}{encode_time * 1000:>14.2f}"
+            f"{decode_time * 1000:>14.2f}{baseline / decode_time:>15.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,25 @@
 """
 A basic async connection to a SurrealDB instance.
 """
-import json
-from typing import Optional, Dict, Any
+import asyncio
+from types import TracebackType
+from typing import Optional, Dict, Any, AsyncIterator, Type, Union
 import uuid
 
 import websockets
+from websockets.asyncio.client import connect as streaming_connect
 
+from sblpy.auth import TokenCache, authenticate_params
+from sblpy.cache import QueryCache, cache_scope, succeeded
+from sblpy.codec import Codec, get_codec
+from sblpy.errors import ConnectionDroppedError, QueryError
 from sblpy.query import Query
+from sblpy.rpc import RpcCall, RpcMethods, unpack_result
+from sblpy.scan import TableScan
+from sblpy.stream import open_record_stream
 
 
-class AsyncSurrealConnection:
+class AsyncSurrealConnection(RpcMethods):
     """
     A single async connection to a SurrealDB instance. To be used once and discarded.
 
@@ -18,6 +27,25 @@ class AsyncSurrealConnection:
     A new connection is created for each query. This is because the async websocket connection is
     dropped
 
+    If `persistent` is set, the connection is opened and authenticated once on the first query and
+    kept open. Concurrent queries are multiplexed over the socket and matched to their responses by
+    the request id. If the socket drops, the queries in flight fail with a `ConnectionDroppedError`
+    and the next query reconnects.
+
+    If a `token_cache` is passed, each socket authenticates with the token cached by an earlier
+    connection with the same credentials and only signs in with the password if there is no token
+    or the token is rejected. This matters most without `persistent` as every query opens a socket.
+
+    With `protocol="cbor"` the messages are sent as CBOR in binary frames rather than JSON text, and
+    record IDs, datetimes, UUIDs, decimals and durations are returned as python types, see `sblpy.cbor`.
+
+    If a `query_cache` is passed, `query` answers read only queries from the cache and drops the
+    cached queries reading the tables it writes to, see `sblpy.cache`.
+
+    `select`, `create`, `insert`, `update`, `merge`, `patch` and `delete` call the RPC methods of
+    the same name that work on a table or record ID without a SurrealQL query, see `sblpy.rpc`.
+    They have to be awaited.
+
     Attributes:
         url: The URL of the database to process queries for.
         user: The username to login on.
@@ -26,6 +54,12 @@ class AsyncSurrealConnection:
         database: The database that the connection will stick to.
         max_size: The maximum size of the connection.
         id: The ID of the connection.
+        persistent: Whether the connection is kept open between queries.
+        socket: The open websocket of a persistent connection, None if it is not connected.
+        token: The token of the connection, None before it has signed in.
+        token_cache: The cache of auth tokens shared with other connections, None to always sign in.
+        codec: Encodes and decodes the messages of the protocol of the connection.
+        query_cache: The cache of the responses of read only queries, None to send every query.
     """
     def __init__(
             self,
@@ -36,7 +70,11 @@ class AsyncSurrealConnection:
             namespace: str = "default",
             database: str = "default",
             max_size: int = 2 ** 20,
-            encrypted: bool = False
+            encrypted: bool = False,
+            persistent: bool = False,
+            token_cache: Optional[TokenCache] = None,
+            protocol: Union[str, Codec] = "json",
+            query_cache: Optional[QueryCache] = None
     ) -> None:
         """
         The constructor for the AsyncSurrealConnection class.
@@ -49,6 +87,10 @@ class AsyncSurrealConnection:
         :param database: (str) The database that the connection will stick to
         :param max_size: (int) The maximum size of the connection
         :param encrypted: (bool) Whether the connection is encrypted
+        :param persistent: (bool) Whether to keep the connection open and multiplex queries over it
+        :param token_cache: (Optional[TokenCache]) the cache of auth tokens shared with other connections
+        :param protocol: (Union[str, Codec]) the protocol of the messages, "json", "cbor" or a codec
+        :param query_cache: (Optional[QueryCache]) the cache of the responses of read only queries
         """
         if encrypted is True:
             self.url: str = f"wss://{host}:{port}/rpc"
@@ -62,15 +104,57 @@ class AsyncSurrealConnection:
         self.database: str = database
         self.max_size: int = max_size
         self.id: str = str(uuid.uuid4())
+        self.persistent: bool = persistent
+        self.token: Optional[str] = None
+        self.token_cache: Optional[TokenCache] = token_cache
+        self.codec: Codec = get_codec(protocol)
+        self.query_cache: Optional[QueryCache] = query_cache
+        self._cache_scope: str = cache_scope(self.url, namespace, database)
+        self.socket = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._reader: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
 
     async def signin(self, socket) -> None:
         """
-        Signs in to the SurrealDB instance.
+        Signs in to the SurrealDB instance, with the cached token if there is a token cache.
+
+        :return: None
+        """
+        if self.token_cache is None:
+            await self.signin_with_password(socket)
+            return
+        key = TokenCache.key(self.url, self.user, self.password)
+        async with self.token_cache.async_lock(key):
+            token = self.token_cache.get(key)
+            if token is not None and await self.authenticate(socket, token) is True:
+                return
+            self.token_cache.invalidate(key)
+            await self.signin_with_password(socket)
+            self.token_cache.put(key, self.token)
+
+    async def authenticate(self, socket, token: str) -> bool:
+        """
+        Authenticates the socket with a token from an earlier signin.
+
+        :param token: (str) the token to authenticate with
+        :return: (bool) True if the database accepted the token
+        """
+        await socket.send(self.codec.encode(authenticate_params(self.id, token)))
+        response = self.codec.decode(await socket.recv())
+        if response.get("error") is not None:
+            return False
+        self.token = token
+        return True
+
+    async def signin_with_password(self, socket) -> None:
+        """
+        Signs in to the SurrealDB instance with the username and password.
 
         :return: None
         """
-        await socket.send(json.dumps(self.sign_params, ensure_ascii=False))
-        response = json.loads(await socket.recv())
+        await socket.send(self.codec.encode(self.sign_params))
+        response = self.codec.decode(await socket.recv())
         if response.get("error") is not None:
             raise Exception(f"error signing in: {response.get('error')}")
         if response.get("result") is None:
@@ -86,8 +170,8 @@ class AsyncSurrealConnection:
 
         :return: None
         """
-        await socket.send(json.dumps(self.use_params, ensure_ascii=False))
-        _ = json.loads(await socket.recv())
+        await socket.send(self.codec.encode(self.use_params))
+        _ = self.codec.decode(await socket.recv())
 
     async def query(self, query: str, vars: Optional[Dict[str, Any]] = None) -> dict:
         """
@@ -98,22 +182,254 @@ class AsyncSurrealConnection:
         :return: The result of the query
         """
         query = Query(query, vars)
+        if self.query_cache is not None:
+            frame = self.query_cache.get(query.sql, query.vars, self._cache_scope)
+            if frame is not None:
+                return self._unpack(self.codec.decode(frame))
+            generation = self.query_cache.generation(query.sql, self._cache_scope)
+
+        frame = None
+        if self.persistent is True:
+            response = await self._send_persistent(query.query_params)
+        else:
+            async with websockets.connect(
+                    self.url, max_size=self.max_size, subprotocols=self.codec.subprotocols
+            ) as websocket:
+                self.codec.verify(websocket)
+                # login and set the space
+                await self.signin(websocket)
+                await self.set_space(websocket)
+
+                # send and receive the query
+                await websocket.send(self.codec.encode(query.query_params))
+                frame = await websocket.recv()
+                response = self.codec.decode(frame)
+
+        if self.query_cache is not None:
+            self.query_cache.observe(query.sql, self._cache_scope)
+            if self.query_cache.cacheable(query.sql) and succeeded(response):
+                if frame is None:
+                    # the persistent reader hands over the decoded response so it is encoded again
+                    frame = self.codec.encode(response)
+                self.query_cache.put(query.sql, query.vars, frame, generation, self._cache_scope)
+        return self._unpack(response)
+
+    async def call(self, rpc: RpcCall) -> Any:
+        """
+        Calls a direct RPC method of the SurrealDB instance.
+
+        :param rpc: (RpcCall) the method and its parameters
+        :return: (Any) the result of the method
+        """
+        message = rpc.for_protocol(self.codec.protocol).query_params
+        if self.persistent is True:
+            response = await self._send_persistent(message)
+        else:
+            async with websockets.connect(
+                    self.url, max_size=self.max_size, subprotocols=self.codec.subprotocols
+            ) as websocket:
+                self.codec.verify(websocket)
+                await self.signin(websocket)
+                await self.set_space(websocket)
+                await websocket.send(self.codec.encode(message))
+                response = self.codec.decode(await websocket.recv())
+        if self.query_cache is not None and rpc.writes is True:
+            self.query_cache.invalidate([rpc.table], self._cache_scope)
+        return unpack_result(response, rpc.method)
 
-        async with websockets.connect(self.url, max_size=self.max_size) as websocket:
-            # login and set the space
+    async def query_stream(
+            self,
+            query: str,
+            vars: Optional[Dict[str, Any]] = None,
+            max_size: Optional[int] = None
+    ) -> AsyncIterator[Any]:
+        """
+        Queries the SurrealDB instance, yielding the records of the first statement as they are decoded.
+
+        # Notes
+        The query is always sent on a socket of its own, even if the connection is persistent, so the
+        size limit of the response can be lifted with `max_size` without lifting it for every query.
+        The response is read in the fragments it arrives in, like on the blocking connection, and each
+        record is decoded as soon as it has been read, so the records of a large SELECT are never all
+        held at once and a response sent in several fragments is never held whole either.
+        The socket stays open while the records are iterated over and is closed once the iteration
+        ends, also if it is stopped early.
+
+        :param query: (str) the query to run
+        :param vars: (Optional[Dict[str, Any]]) the variables to use in the query
+        :param max_size: (Optional[int]) the maximum size of the response (defaults to the max_size of the connection)
+        :return: (AsyncIterator[Any]) the records of the first statement
+        """
+        query = Query(query, vars)
+        # the legacy client of websockets can only read a frame whole, the asyncio client reads it in fragments
+        async with streaming_connect(
+                self.url,
+                max_size=self.max_size if max_size is None else max_size,
+                subprotocols=self.codec.subprotocols
+        ) as websocket:
+            self.codec.verify(websocket)
             await self.signin(websocket)
             await self.set_space(websocket)
+            await websocket.send(self.codec.encode(query.query_params))
+            stream = open_record_stream(self.codec)
+            async for fragment in websocket.recv_streaming():
+                for record in stream.feed(fragment):
+                    yield record
+        for record in stream.close():
+            yield record
 
-            # send and receive the query
-            await websocket.send(json.dumps(query.query_params, ensure_ascii=False))
-            response = json.loads(await websocket.recv())
-            if response.get("result") is None:
-                raise Exception(f"error querying no result: {response}")
-            response = response["result"]
-            if response[0].get("status") is not None and response[0].get("status") == "ERR":
-                raise Exception(f"error querying: {response[0].get('result')}")
+    async def stream(
+            self,
+            table: str,
+            batch_size: int = 1000,
+            where: Optional[str] = None,
+            order_by: Optional[str] = None,
+            vars: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields every record of a table, selecting them a page at a time with keyset pagination.
+
+        # Notes
+        The query of the next page runs in a task while the records of the current page are yielded,
+        so the database selects the next page while the caller handles the current one. See `TableScan`.
+
+        :param table: (str) the name of the table to stream
+        :param batch_size: (int) the number of records selected in each page
+        :param where: (Optional[str]) the SurrealQL condition the records have to meet, such as "age > $age"
+        :param order_by: (Optional[str]) the field to order the records by, optionally followed by ASC or DESC
+        :param vars: (Optional[Dict[str, Any]]) the variables used in the condition
+        :return: (AsyncIterator[Dict[str, Any]]) the records of the table
+        """
+        scan = TableScan(table, batch_size, where, order_by, vars)
+        query = scan.query()
+        page = asyncio.ensure_future(self.query(query.sql, query.vars))
+        try:
+            while page is not None:
+                records = scan.advance(await page)
+                page = None
+                if scan.done is False:
+                    query = scan.query()
+                    page = asyncio.ensure_future(self.query(query.sql, query.vars))
+                for record in records:
+                    yield record
+        finally:
+            if page is not None:
+                page.cancel()
+                await asyncio.gather(page, return_exceptions=True)
+
+    @staticmethod
+    def _unpack(response: dict) -> Any:
+        """
+        Extracts the result of the first statement from the response of a query.
+
+        :param response: (dict) the raw response from the database
+        :return: The result of the query
+        """
+        if response.get("result") is None:
+            raise QueryError(f"error querying no result: {response}")
+        response = response["result"]
+        if response[0].get("status") is not None and response[0].get("status") == "ERR":
+            raise QueryError(f"error querying: {response[0].get('result')}")
         return response[0]["result"]
 
+    async def connect(self):
+        """
+        Opens and authenticates the socket of a persistent connection if it is not already open.
+
+        :return: (Websocket) the open socket
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.socket is not None:
+                return self.socket
+            socket = await websockets.connect(self.url, max_size=self.max_size, subprotocols=self.codec.subprotocols)
+            try:
+                self.codec.verify(socket)
+                await self.signin(socket)
+                await self.set_space(socket)
+            except BaseException:
+                await socket.close()
+                raise
+            self.socket = socket
+            self._reader = asyncio.create_task(self._read_responses(socket))
+            return socket
+
+    async def _read_responses(self, socket) -> None:
+        """
+        Hands the responses read off a persistent socket to the queries waiting on them.
+
+        :param socket: (Websocket) the socket of the persistent connection
+        :return: None
+        """
+        error: Exception = ConnectionDroppedError(f"the connection to {self.url} was closed")
+        try:
+            async for raw_response in socket:
+                response = self.codec.decode(raw_response)
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except websockets.ConnectionClosed as closed:
+            error = ConnectionDroppedError(f"the connection to {self.url} dropped: {closed}")
+        finally:
+            # the next query reconnects
+            if self.socket is socket:
+                self.socket = None
+            pending = self._pending
+            self._pending = {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _send_persistent(self, message: dict) -> dict:
+        """
+        Sends a message over the persistent socket and waits for its response.
+
+        :param message: (dict) the RPC message to send, its id is replaced with a unique request id
+        :return: (dict) the raw response from the database
+        """
+        socket = await self.connect()
+        request_id = str(uuid.uuid4())
+        message["id"] = request_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await socket.send(self.codec.encode(message))
+            return await future
+        except (websockets.ConnectionClosed, OSError) as closed:
+            raise ConnectionDroppedError(f"the connection to {self.url} dropped: {closed}") from None
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self) -> None:
+        """
+        Closes the socket of a persistent connection.
+
+        :return: None
+        """
+        socket = self.socket
+        self.socket = None
+        if socket is not None:
+            await socket.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+
+    async def __aenter__(self) -> "AsyncSurrealConnection":
+        """Opens the socket when entering the context manager if the connection is persistent."""
+        if self.persistent is True:
+            await self.connect()
+        return self
+
+    async def __aexit__(
+            self,
+            exc_type: Optional[Type[BaseException]],
+            exc_value: Optional[BaseException],
+            traceback: Optional[TracebackType]
+    ) -> None:
+        """Closes the socket of a persistent connection when exiting the context manager."""
+        await self.close()
+
     @property
     def sign_params(self) -> dict:
         return {
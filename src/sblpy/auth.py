@@ -0,0 +1,169 @@
+"""
+Defines the cache of auth tokens shared between connections so they can skip signing in with a password.
+
+# Notes
+Signing in makes the server verify the password hash, which is deliberately expensive. A connection
+with a cache signs in once, caches the token it gets back, and later connections send the cached token
+with the `authenticate` RPC instead. A token is treated as expired `refresh_margin` seconds before the
+`exp` claim of the JWT so the next connection signs in again and refreshes it before the server would
+reject it.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+import time
+import weakref
+from typing import Dict, Optional, Tuple
+
+
+class TokenCache:
+    """
+    A thread-safe cache of auth tokens keyed by the URL, user and password they were signed in with.
+
+    # Notes
+    The `lock` and `async_lock` of a key are held while signing in so that when many connections open
+    at once, only the first signs in and the rest authenticate with the token it cached.
+
+    Attributes:
+        refresh_margin: The seconds before the expiry of a token that it stops being handed out.
+        default_ttl: The seconds a token is cached for if its expiry cannot be read from it.
+    """
+    def __init__(self, refresh_margin: float = 60.0, default_ttl: float = 3600.0) -> None:
+        """
+        The constructor for the TokenCache class.
+
+        :param refresh_margin: (float) the seconds before the expiry of a token that it stops being handed out
+        :param default_ttl: (float) the seconds a token is cached for if its expiry cannot be read from it
+        """
+        self.refresh_margin: float = refresh_margin
+        self.default_ttl: float = default_ttl
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        # keyed on the loop itself so the locks of a loop go with it and are never handed to a later loop
+        self._async_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._guard = threading.Lock()
+
+    @staticmethod
+    def key(url: str, user: str, password: str) -> str:
+        """
+        Builds the cache key of a set of credentials without keeping the password in memory.
+
+        :param url: (str) the URL of the database
+        :param user: (str) the username signed in with
+        :param password: (str) the password signed in with
+        :return: (str) the cache key
+        """
+        return hashlib.sha256(f"{url}\x00{user}\x00{password}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def token_expiry(token: str) -> Optional[float]:
+        """
+        Reads the `exp` claim of a JWT without verifying it.
+
+        :param token: (str) the token to read
+        :return: (Optional[float]) the unix time the token expires, None if it cannot be read
+        """
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            expiry = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        except (IndexError, ValueError, AttributeError, TypeError):
+            return None
+        if isinstance(expiry, (int, float)):
+            return float(expiry)
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Gets the cached token of a key if it is not about to expire.
+
+        :param key: (str) the cache key built by `TokenCache.key`
+        :return: (Optional[str]) the token, None if there is no token or it is about to expire
+        """
+        with self._guard:
+            cached = self._tokens.get(key)
+            if cached is None:
+                return None
+            token, expires_at = cached
+            if time.time() >= expires_at - self.refresh_margin:
+                del self._tokens[key]
+                return None
+            return token
+
+    def put(self, key: str, token: str) -> None:
+        """
+        Caches a token that was just returned by a signin.
+
+        :param key: (str) the cache key built by `TokenCache.key`
+        :param token: (str) the token to cache
+        :return: None
+        """
+        expires_at = self.token_expiry(token)
+        if expires_at is None:
+            expires_at = time.time() + self.default_ttl
+        with self._guard:
+            self._tokens[key] = (token, expires_at)
+
+    def invalidate(self, key: str) -> None:
+        """
+        Drops the cached token of a key, for instance after the server rejected it.
+
+        :param key: (str) the cache key built by `TokenCache.key`
+        :return: None
+        """
+        with self._guard:
+            self._tokens.pop(key, None)
+
+    def lock(self, key: str) -> threading.Lock:
+        """
+        Gets the lock that blocking connections hold while signing in with the credentials of a key.
+
+        :param key: (str) the cache key built by `TokenCache.key`
+        :return: (threading.Lock) the lock of the key
+        """
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[key] = lock
+            return lock
+
+    def async_lock(self, key: str) -> asyncio.Lock:
+        """
+        Gets the lock that async connections on the running loop hold while signing in with the credentials of a key.
+
+        :param key: (str) the cache key built by `TokenCache.key`
+        :return: (asyncio.Lock) the lock of the key for the running loop
+        """
+        loop = asyncio.get_running_loop()
+        with self._guard:
+            locks = self._async_locks.get(loop)
+            if locks is None:
+                locks = {}
+                self._async_locks[loop] = locks
+            lock = locks.get(key)
+            if lock is None:
+                lock = asyncio.Lock()
+                locks[key] = lock
+            return lock
+
+
+def authenticate_params(id: str, token: str) -> dict:
+    """
+    Builds the RPC message that authenticates a connection with a token.
+
+    :param id: (str) the ID of the message
+    :param token: (str) the token to authenticate with
+    :return: (dict) the RPC message
+    """
+    return {
+        "id": id,
+        "method": "authenticate",
+        "params": [
+            token
+        ]
+    }
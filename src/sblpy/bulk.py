@@ -0,0 +1,159 @@
+"""
+Defines how records are split into chunks that are inserted into a table one statement per chunk.
+"""
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from sblpy.query import Priority, Query
+
+# A table name, interpolated into the statement so nothing else is allowed
+TABLE_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# The room left in each message for the statement and the envelope of the request
+MESSAGE_OVERHEAD = 1024
+
+
+def chunk_records(
+        records: Iterable[Any],
+        chunk_size: int,
+        max_bytes: int,
+        encode: Callable[[Any], Union[str, bytes]],
+        overhead: int = 0
+) -> Iterator[Tuple[int, List[Any]]]:
+    """
+    Splits records into chunks of at most `chunk_size` records and about `max_bytes` once encoded.
+
+    # Notes
+    The records are read one at a time so they can come from a generator that never holds them all.
+    A record that is larger than `max_bytes` on its own gets a chunk of its own.
+
+    :param records: (Iterable[Any]) the records to split
+    :param chunk_size: (int) the maximum number of records in a chunk
+    :param max_bytes: (int) the maximum encoded size of the records of a chunk
+    :param encode: (Callable[[Any], Union[str, bytes]]) encodes a record the way it is sent
+    :param overhead: (int) the size each record adds to the message on top of its encoding, such as its statement
+    :return: (Iterator[Tuple[int, List[Any]]]) the position of the first record of each chunk and its records
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size has to be at least 1, not {chunk_size}")
+    chunk: List[Any] = []
+    size = 0
+    offset = 0
+    for record in records:
+        # the separator between records is counted too
+        record_size = len(encode(record)) + 1 + overhead
+        if len(chunk) > 0 and (len(chunk) >= chunk_size or size + record_size > max_bytes):
+            yield offset, chunk
+            offset += len(chunk)
+            chunk = []
+            size = 0
+        chunk.append(record)
+        size += record_size
+    if len(chunk) > 0:
+        yield offset, chunk
+
+
+def insert_query(
+        table: str,
+        records: List[Dict[str, Any]],
+        ignore: bool = False,
+        priority: int = Priority.BATCH
+) -> Query:
+    """
+    Builds the statement inserting a chunk of records into a table.
+
+    # Notes
+    The records are sent as a variable so they are never interpolated into the SQL, and nothing is
+    returned so the response stays small however large the chunk is.
+
+    :param table: (str) the name of the table
+    :param records: (List[Dict[str, Any]]) the records to insert
+    :param ignore: (bool) whether records with an ID that already exists are skipped rather than failing the chunk
+    :param priority: (int) the priority class of the query in the connection pool
+    :return: (Query) the query inserting the records
+    """
+    if TABLE_PATTERN.fullmatch(table) is None:
+        raise ValueError(f"table {table!r} is not a table name")
+    statement = "INSERT IGNORE INTO" if ignore is True else "INSERT INTO"
+    return Query(f"{statement} {table} $sblpy_records RETURN NONE;", {"sblpy_records": records}, priority)
+
+
+class ChunkFailure:
+    """
+    A chunk of records that could not be inserted.
+
+    Attributes:
+        index: The position of the chunk among the chunks.
+        offset: The position of the first record of the chunk among the records.
+        records: The records of the chunk, so they can be inserted again.
+        error: The error the database or the pool failed the chunk with.
+    """
+    __slots__ = ("index", "offset", "records", "error")
+
+    def __init__(self, index: int, offset: int, records: List[Dict[str, Any]], error: Any) -> None:
+        """
+        The constructor for the ChunkFailure class.
+
+        :param index: (int) the position of the chunk among the chunks
+        :param offset: (int) the position of the first record of the chunk among the records
+        :param records: (List[Dict[str, Any]]) the records of the chunk
+        :param error: (Any) the error message of the database or the exception raised by the pool
+        """
+        self.index: int = index
+        self.offset: int = offset
+        self.records: List[Dict[str, Any]] = records
+        self.error: Any = error
+
+    def __repr__(self) -> str:
+        return f"ChunkFailure(index={self.index}, offset={self.offset}, records={len(self.records)}, error={self.error!r})"
+
+
+class BulkInsertResult:
+    """
+    The outcome of a bulk insert.
+
+    Attributes:
+        chunks: The number of chunks sent.
+        inserted: The number of records in the chunks that succeeded.
+        failures: The chunks that failed in the order they failed.
+    """
+    def __init__(self) -> None:
+        """
+        The constructor for the BulkInsertResult class.
+        """
+        self.chunks: int = 0
+        self.inserted: int = 0
+        self.failures: List[ChunkFailure] = []
+
+    @property
+    def ok(self) -> bool:
+        """
+        Whether every chunk was inserted.
+
+        :return: (bool) True if no chunk failed
+        """
+        return len(self.failures) == 0
+
+    @property
+    def failed(self) -> int:
+        """
+        The number of records in the chunks that failed.
+
+        :return: (int) the number of records not inserted
+        """
+        return sum(len(failure.records) for failure in self.failures)
+
+    def __repr__(self) -> str:
+        return f"BulkInsertResult(chunks={self.chunks}, inserted={self.inserted}, failures={self.failures!r})"
+
+
+def chunk_error(response: Any) -> Optional[Any]:
+    """
+    Reads why the statement of a chunk failed from its response.
+
+    :param response: (Any) the response of the statement
+    :return: (Optional[Any]) the error of the request or of its statement, None if it succeeded
+    """
+    if response.error is not None:
+        return response.error
+    errors = response.errors
+    return errors[0] if len(errors) > 0 else None
@@ -0,0 +1,544 @@
+"""
+Defines the client side cache of the results of read only queries.
+
+# Notes
+A query is only cached if every statement of it is a `SELECT` that reads named tables and calls no
+function that can return something different each time, such as `rand` or `time::now`. A query
+that writes to a table, with `CREATE`, `UPDATE`, `UPSERT`, `DELETE`, `INSERT` or `RELATE`, drops the
+cached queries that read the table. A query that writes somewhere that cannot be worked out from its
+text, such as a table in a variable, or that defines, removes or calls a custom function drops the
+whole cache.
+
+Every connection and pool keys its entries and table versions with the scope of its URL, namespace
+and database, so one cache can be shared between databases and tenants without a query of one being
+answered with the rows of another. Connections of users with different permissions on the same
+database share a scope, so give them caches of their own.
+
+Only the writes sent through a connection or pool using the cache are seen, so writes by other
+clients, and reads of other tables through record links, are only picked up once the entry
+expires. Keep the TTL as short as the data can be stale.
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+# String literals are blanked before a query is read so their content is not mistaken for SurrealQL
+STRING_LITERAL = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*\"""", re.DOTALL)
+LITERAL_OR_SPACE = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|\s+""", re.DOTALL)
+IDENTIFIER = r"(?:[A-Za-z_][A-Za-z0-9_]*|`[^`]+`|⟨[^⟩]+⟩)"
+# The targets of each FROM up to the clause after them, and the table of each step of a graph traversal
+FROM_TARGETS = re.compile(
+    r"\bFROM\s+(?:ONLY\s+)?(.*?)(?=\s+(?:WHERE|SPLIT|GROUP|ORDER|LIMIT|START|FETCH|TIMEOUT|PARALLEL|"
+    r"EXPLAIN|WITH|TEMPFILES)\b|\)|;|$)",
+    re.IGNORECASE | re.DOTALL
+)
+TRAVERSED_TABLE = re.compile(rf"(?:->|<-)\s*\(?\s*({IDENTIFIER}|\S)")
+TARGET_TABLE = re.compile(rf"({IDENTIFIER})(?::.*)?", re.DOTALL)
+# The table written by each write statement, wherever it is nested
+WRITE_TABLE = re.compile(
+    rf"\b(?:(?:CREATE|UPDATE|UPSERT)\s+(?:ONLY\s+)?|DELETE\s+(?:FROM\s+)?(?:ONLY\s+)?|"
+    rf"INSERT\s+(?:IGNORE\s+)?(?:RELATION\s+)?INTO\s+)({IDENTIFIER}|\S)",
+    re.IGNORECASE
+)
+RELATE_TABLE = re.compile(rf"\bRELATE\s+(?:ONLY\s+)?[^;]*?->\s*({IDENTIFIER}|\S)", re.IGNORECASE)
+# Statements that change what every cached query might return
+WRITES_ANYTHING = re.compile(r"\b(?:DEFINE|REMOVE|ALTER|IMPORT)\b|\bfn::", re.IGNORECASE)
+# Calls that do not return the same result each time
+NON_DETERMINISTIC = re.compile(r"\b(?:rand|time::now|sleep)\b|\$(?:auth|session|token|scope)\b", re.IGNORECASE)
+STATEMENT_KEYWORD = re.compile(r"\s*\(?\s*([A-Za-z]+)")
+
+
+def cache_scope(url: str, namespace: str, database: str) -> str:
+    """
+    Builds the scope that a connection keys its cache entries and table versions with.
+
+    :param url: (str) the URL of the database
+    :param namespace: (str) the namespace of the connection
+    :param database: (str) the database of the connection
+    :return: (str) the scope, the same for every connection to the same database
+    """
+    return json.dumps([url, namespace, database])
+
+
+def normalize(sql: str) -> str:
+    """
+    Normalizes the whitespace of a query outside of its string literals so equivalent queries share a key.
+
+    :param sql: (str) the query to normalize
+    :return: (str) the query with runs of whitespace collapsed and without the trailing semicolon
+    """
+    collapsed = LITERAL_OR_SPACE.sub(lambda match: match.group(1) or " ", sql).strip()
+    while collapsed.endswith(";"):
+        collapsed = collapsed[:-1].rstrip()
+    return collapsed
+
+
+def split_statements(sql: str) -> List[str]:
+    """
+    Splits a query with its string literals blanked into its top level statements.
+
+    :param sql: (str) the query with its string literals blanked
+    :return: (List[str]) the statements of the query that are not empty
+    """
+    statements = []
+    depth = 0
+    start = 0
+    for position, character in enumerate(sql):
+        if character in "({[":
+            depth += 1
+        elif character in ")}]":
+            depth -= 1
+        elif character == ";" and depth == 0:
+            statements.append(sql[start:position])
+            start = position + 1
+    statements.append(sql[start:])
+    return [statement for statement in statements if statement.strip() != ""]
+
+
+def split_targets(targets: str) -> List[str]:
+    """
+    Splits the targets of a FROM on the commas outside of brackets.
+
+    :param targets: (str) the targets, such as "user, post:1"
+    :return: (List[str]) each target
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for position, character in enumerate(targets):
+        if character in "({[":
+            depth += 1
+        elif character in ")}]":
+            depth -= 1
+        elif character == "," and depth == 0:
+            parts.append(targets[start:position])
+            start = position + 1
+    parts.append(targets[start:])
+    return parts
+
+
+def _table(name: str) -> Optional[str]:
+    """
+    Reads the name of a table from the target of a statement.
+
+    :param name: (str) the identifier matched as the target
+    :return: (Optional[str]) the name of the table, None if the target is not a named table
+    """
+    if name[:1] in ("`", "⟨"):
+        return name[1:-1]
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name) is None or name.lower() == "type":
+        return None
+    return name
+
+
+@lru_cache(maxsize=1024)
+def analyse(sql: str) -> Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]]]:
+    """
+    Works out the tables a query reads if it can be cached and the tables it writes.
+
+    :param sql: (str) the query to analyse
+    :return: (Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]]]) the tables read, None if the query
+             cannot be cached, and the tables written, None if it could write anywhere
+    """
+    blanked = STRING_LITERAL.sub("''", sql)
+    writes: Optional[Set[str]] = set()
+    if WRITES_ANYTHING.search(blanked) is not None:
+        writes = None
+    else:
+        for match in list(WRITE_TABLE.finditer(blanked)) + list(RELATE_TABLE.finditer(blanked)):
+            table = _table(match.group(1))
+            if table is None:
+                writes = None
+                break
+            writes.add(table)
+    reads: Optional[Set[str]] = set()
+    for statement in split_statements(blanked):
+        keyword = STATEMENT_KEYWORD.match(statement)
+        if keyword is None or keyword.group(1).upper() != "SELECT":
+            reads = None
+            break
+    if reads is not None and (writes != set() or NON_DETERMINISTIC.search(blanked) is not None):
+        reads = None
+    if reads is not None:
+        targets = [
+            target.strip() for match in FROM_TARGETS.finditer(blanked) for target in split_targets(match.group(1))
+        ]
+        for target in targets:
+            match = TARGET_TABLE.fullmatch(target)
+            table = _table(match.group(1)) if match is not None else None
+            if table is None:
+                reads = None
+                break
+            reads.add(table)
+    if reads is not None:
+        for match in TRAVERSED_TABLE.finditer(blanked):
+            table = _table(match.group(1))
+            if table is None:
+                reads = None
+                break
+            reads.add(table)
+    if reads is not None and len(reads) == 0:
+        reads = None
+    return (
+        frozenset(reads) if reads is not None else None,
+        frozenset(writes) if writes is not None else None
+    )
+
+
+def succeeded(response: Mapping) -> bool:
+    """
+    Checks that a request ran and none of its statements failed.
+
+    :param response: (Mapping) the raw response from the database
+    :return: (bool) True if the response can be cached
+    """
+    ok = getattr(response, "ok", None)
+    if isinstance(ok, bool):
+        return ok
+    if response.get("error") is not None or not isinstance(response.get("result"), list):
+        return False
+    return all(
+        not isinstance(statement, dict) or statement.get("status") != "ERR" for statement in response["result"]
+    )
+
+
+class TableVersions:
+    """
+    Counts the writes seen to each table, so a read can tell whether a table it reads was written while it was in flight.
+
+    # Notes
+    Each write takes the next value of a counter shared by every table and stamps it on the tables it
+    writes, or on every table if its tables cannot be worked out. The version of a read is the
+    highest stamp of the tables it reads, so it only moves on when one of them is written. Tables are
+    counted per scope (see `cache_scope`), so a write to a table of one database leaves the table of
+    the same name in another alone.
+    """
+    def __init__(self) -> None:
+        """
+        The constructor for the TableVersions class.
+        """
+        self._clock: int = 0
+        self._every_scope: int = 0
+        self._every_table: Dict[str, int] = {}
+        self._tables: Dict[Tuple[Optional[str], str], int] = {}
+        self._lock = threading.Lock()
+
+    def version(self, tables: Iterable[str], scope: str = "") -> int:
+        """
+        Reads the version of a set of tables.
+
+        :param tables: (Iterable[str]) the tables a query reads
+        :param scope: (str) the scope of the tables
+        :return: (int) the stamp of the latest write seen to any of the tables
+        """
+        with self._lock:
+            stamps = [self._every_scope, self._every_table.get(scope, 0)]
+            for table in tables:
+                stamps.append(self._tables.get((scope, table), 0))
+                stamps.append(self._tables.get((None, table), 0))
+            return max(stamps)
+
+    def bump(self, tables: Optional[Iterable[str]] = None, scope: Optional[str] = None) -> None:
+        """
+        Records a write to some tables.
+
+        :param tables: (Optional[Iterable[str]]) the tables written, None if every table may have changed
+        :param scope: (Optional[str]) the scope of the tables, None for the tables of every scope
+        :return: None
+        """
+        with self._lock:
+            self._clock += 1
+            if tables is None:
+                if scope is None:
+                    self._every_scope = self._clock
+                    self._every_table.clear()
+                    self._tables.clear()
+                    return
+                self._every_table[scope] = self._clock
+                for key in [key for key in self._tables if key[0] == scope]:
+                    del self._tables[key]
+                return
+            for table in tables:
+                self._tables[(scope, table)] = self._clock
+
+    def observe(self, sql: str, scope: str = "") -> None:
+        """
+        Records the writes of a query sent to the database.
+
+        :param sql: (str) the query that was sent
+        :param scope: (str) the scope the query was sent in
+        :return: None
+        """
+        writes = analyse(sql)[1]
+        if writes is None:
+            self.bump(scope=scope)
+        elif len(writes) > 0:
+            self.bump(writes, scope)
+
+
+class CacheEntry:
+    """
+    A cached response.
+
+    Attributes:
+        frame: The encoded response.
+        size: The size of the frame in bytes, or characters for a text frame.
+        expires_at: The monotonic time the entry expires at.
+        tables: The tables the query reads.
+    """
+    __slots__ = ("frame", "size", "expires_at", "tables")
+
+    def __init__(self, frame: Union[str, bytes], expires_at: float, tables: FrozenSet[str]) -> None:
+        """
+        The constructor for the CacheEntry class.
+
+        :param frame: (Union[str, bytes]) the encoded response
+        :param expires_at: (float) the monotonic time the entry expires at
+        :param tables: (FrozenSet[str]) the tables the query reads
+        """
+        self.frame: Union[str, bytes] = frame
+        self.size: int = len(frame)
+        self.expires_at: float = expires_at
+        self.tables: FrozenSet[str] = tables
+
+
+class QueryCache:
+    """
+    A least recently used cache of the responses of read only queries, bounded by their size.
+
+    # Notes
+    The responses are cached encoded, as they were read off the socket, and decoded again on each
+    hit so callers never share the objects of a result. The key is the scope of the connection (see
+    `cache_scope`), the query with its whitespace normalized and its variables. Each entry expires
+    after the `ttl` of the tables it reads, the shortest one if it reads several, or `ttl` for the
+    tables that are not in `table_ttls`. The cache can be shared between connections and pools, also
+    of different databases, and used from several threads.
+
+    A read can still be in flight when a write to its tables completes and invalidates them, so its
+    response may predate the write. Take the `generation` of the query before sending it and pass it
+    to `put`, which then refuses the response if any of the tables was written in the meantime.
+
+    Attributes:
+        max_bytes: The maximum total size of the cached responses.
+        ttl: The seconds an entry is kept for.
+        table_ttls: Maps tables to the seconds the entries reading them are kept for.
+        hits: The number of lookups that found a fresh entry.
+        misses: The number of lookups of cacheable queries that did not.
+        evictions: The number of entries dropped to make room.
+        invalidations: The number of entries dropped because a table they read was written.
+        stale: The number of responses not cached because a table they read was written while they were in flight.
+        versions: The writes seen to each table.
+    """
+    def __init__(
+            self,
+            max_bytes: int = 64 * 2 ** 20,
+            ttl: float = 60.0,
+            table_ttls: Optional[Dict[str, float]] = None
+    ) -> None:
+        """
+        The constructor for the QueryCache class.
+
+        :param max_bytes: (int) the maximum total size of the cached responses
+        :param ttl: (float) the seconds an entry is kept for
+        :param table_ttls: (Optional[Dict[str, float]]) maps tables to the seconds the entries reading them
+                                                        are kept for, such as longer for reference tables
+        """
+        self.max_bytes: int = max_bytes
+        self.ttl: float = ttl
+        self.table_ttls: Dict[str, float] = dict(table_ttls) if table_ttls is not None else {}
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+        self.stale: int = 0
+        self.versions: TableVersions = TableVersions()
+        self._entries: "OrderedDict[Tuple[str, str, str], CacheEntry]" = OrderedDict()
+        self._by_table: Dict[Tuple[str, str], Set[Tuple[str, str, str]]] = {}
+        self._bytes: int = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(sql: str, vars: Optional[Dict[str, Any]] = None, scope: str = "") -> Tuple[str, str, str]:
+        """
+        Builds the key of a query.
+
+        :param sql: (str) the query
+        :param vars: (Optional[Dict[str, Any]]) the variables of the query
+        :param scope: (str) the scope of the connection the query is sent on
+        :return: (Tuple[str, str, str]) the scope, the normalized query and its encoded variables
+        """
+        return scope, normalize(sql), json.dumps(vars or {}, sort_keys=True, default=repr)
+
+    @staticmethod
+    def cacheable(sql: str) -> bool:
+        """
+        Checks whether the response of a query can be cached.
+
+        :param sql: (str) the query
+        :return: (bool) True if every statement only reads named tables
+        """
+        return analyse(sql)[0] is not None
+
+    def generation(self, sql: str, scope: str = "") -> int:
+        """
+        Reads the version of the tables a query reads, to be passed to `put` with its response.
+
+        :param sql: (str) the query about to be sent
+        :param scope: (str) the scope of the connection the query is sent on
+        :return: (int) the version of the tables the query reads
+        """
+        return self.versions.version(analyse(sql)[0] or (), scope)
+
+    def get(
+            self,
+            sql: str,
+            vars: Optional[Dict[str, Any]] = None,
+            scope: str = ""
+    ) -> Optional[Union[str, bytes]]:
+        """
+        Looks up the cached response of a query.
+
+        :param sql: (str) the query
+        :param vars: (Optional[Dict[str, Any]]) the variables of the query
+        :param scope: (str) the scope of the connection the query is sent on
+        :return: (Optional[Union[str, bytes]]) the encoded response, None if it is not cached or the query
+                                               cannot be cached
+        """
+        if analyse(sql)[0] is None:
+            return None
+        key = self.key(sql, vars, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.frame
+
+    def put(
+            self,
+            sql: str,
+            vars: Optional[Dict[str, Any]],
+            frame: Union[str, bytes],
+            generation: Optional[int] = None,
+            scope: str = ""
+    ) -> bool:
+        """
+        Caches the response of a query, evicting the least recently used entries to make room.
+
+        :param sql: (str) the query
+        :param vars: (Optional[Dict[str, Any]]) the variables of the query
+        :param frame: (Union[str, bytes]) the encoded response of a query that succeeded
+        :param generation: (Optional[int]) the `generation` of the query taken before it was sent, the
+                                           response is not cached if a table it reads was written since
+        :param scope: (str) the scope of the connection the query was sent on
+        :return: (bool) True if the response was cached
+        """
+        tables = analyse(sql)[0]
+        if tables is None or len(frame) > self.max_bytes:
+            return False
+        ttl = min([self.table_ttls.get(table, self.ttl) for table in tables])
+        key = self.key(sql, vars, scope)
+        entry = CacheEntry(frame, time.monotonic() + ttl, tables)
+        with self._lock:
+            # checked under the lock so an invalidation cannot land between the check and the insert
+            if generation is not None and self.versions.version(tables, scope) != generation:
+                self.stale += 1
+                return False
+            if key in self._entries:
+                self._drop(key)
+            while self._bytes + entry.size > self.max_bytes and len(self._entries) > 0:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = entry
+            self._bytes += entry.size
+            for table in tables:
+                self._by_table.setdefault((scope, table), set()).add(key)
+        return True
+
+    def observe(self, sql: str, scope: str = "") -> None:
+        """
+        Drops the entries reading the tables a query sent to the database writes.
+
+        :param sql: (str) the query that was sent
+        :param scope: (str) the scope of the connection the query was sent on
+        :return: None
+        """
+        writes = analyse(sql)[1]
+        if writes is None:
+            self.invalidate(scope=scope)
+        elif len(writes) > 0:
+            self.invalidate(writes, scope)
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None, scope: Optional[str] = None) -> None:
+        """
+        Drops the entries reading some tables.
+
+        :param tables: (Optional[Iterable[str]]) the tables that changed, None to drop every entry of the scope
+        :param scope: (Optional[str]) the scope of the tables, None for the tables of every scope
+        :return: None
+        """
+        if tables is not None:
+            tables = list(tables)
+        with self._lock:
+            self.versions.bump(tables, scope)
+            if tables is None:
+                keys = [key for key in self._entries if scope is None or key[0] == scope]
+            elif scope is not None:
+                keys = list({key for table in tables for key in self._by_table.get((scope, table), ())})
+            else:
+                keys = list({
+                    key for (_, table), table_keys in self._by_table.items() if table in tables for key in table_keys
+                })
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+
+    def _drop(self, key: Tuple[str, str, str]) -> None:
+        """
+        Removes an entry, the lock has to be held.
+
+        :param key: (Tuple[str, str, str]) the key of the entry
+        :return: None
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get((key[0], table))
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self._by_table[(key[0], table)]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Takes a snapshot of the counters of the cache.
+
+        :return: (Dict[str, Any]) the hits, misses, hit ratio, evictions, invalidations, stale responses,
+                                  entries and bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale": self.stale,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
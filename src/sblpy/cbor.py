@@ -0,0 +1,709 @@
+"""
+A pure python CBOR encoder and decoder for the SurrealDB RPC protocol.
+
+# Notes
+SurrealDB extends CBOR with tags for its own types. Record IDs, tables, durations, ranges and
+geometry points are decoded into the classes of this module, datetimes into timezone aware
+`datetime`s, UUIDs into `uuid.UUID` and decimals into `decimal.Decimal`. `NONE` is decoded as `None`.
+Tags that are not known are decoded into a `TaggedValue` so they can be sent back unchanged.
+"""
+import re
+import struct
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, List, Optional, Tuple
+
+# the tags of the SurrealDB types
+TAG_DATETIME_STRING = 0
+TAG_DATETIME_EPOCH = 1
+TAG_POSITIVE_BIGNUM = 2
+TAG_NEGATIVE_BIGNUM = 3
+TAG_NONE = 6
+TAG_TABLE = 7
+TAG_RECORD_ID = 8
+TAG_UUID_STRING = 9
+TAG_DECIMAL_STRING = 10
+TAG_DATETIME_COMPACT = 12
+TAG_DURATION_STRING = 13
+TAG_DURATION_COMPACT = 14
+TAG_UUID_BINARY = 37
+TAG_RANGE = 49
+TAG_BOUND_INCLUDED = 50
+TAG_BOUND_EXCLUDED = 51
+TAG_GEOMETRY_POINT = 88
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# the nanoseconds in each unit of a SurrealDB duration from the largest to the smallest
+DURATION_UNITS = (
+    ("y", 365 * 86400 * 10 ** 9),
+    ("w", 7 * 86400 * 10 ** 9),
+    ("d", 86400 * 10 ** 9),
+    ("h", 3600 * 10 ** 9),
+    ("m", 60 * 10 ** 9),
+    ("s", 10 ** 9),
+    ("ms", 10 ** 6),
+    ("µs", 10 ** 3),
+    ("ns", 1),
+)
+DURATION_PATTERN = re.compile(r"(\d+)(ns|us|µs|ms|s|m|h|d|w|y)")
+
+
+class CborError(ValueError):
+    """
+    Raised when a value cannot be encoded or a message cannot be decoded.
+    """
+
+
+class CborIncompleteError(CborError):
+    """
+    Raised when a message ends part way through an item, so more of it has to be read before it can be decoded.
+    """
+
+
+class _Value:
+    """
+    Compares, hashes and prints the SurrealDB values by their slots.
+    """
+    __slots__ = ()
+
+    def _fields(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and other._fields() == self._fields()
+
+    def __hash__(self) -> int:
+        return hash((type(self).__name__,) + self._fields())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class RecordID(_Value):
+    """
+    The ID of a record, printed as `table:id`.
+
+    Attributes:
+        table_name: The table of the record.
+        id: The ID of the record in the table, a string, number, list or dictionary.
+    """
+    __slots__ = ("table_name", "id")
+
+    def __init__(self, table_name: str, id: Any) -> None:
+        """
+        The constructor for the RecordID class.
+
+        :param table_name: (str) the table of the record
+        :param id: (Any) the ID of the record in the table
+        """
+        self.table_name: str = table_name
+        self.id: Any = id
+
+    @staticmethod
+    def parse(record_id: str) -> "RecordID":
+        """
+        Creates a RecordID from a `table:id` string.
+
+        :param record_id: (str) the record ID to parse
+        :return: (RecordID) the record ID
+        """
+        table_name, _, id = record_id.partition(":")
+        if id == "":
+            raise ValueError(f"{record_id} is not a record ID of the form table:id")
+        return RecordID(table_name, id)
+
+    def __str__(self) -> str:
+        return f"{self.table_name}:{self.id}"
+
+
+class Table(_Value):
+    """
+    The name of a table, sent so that the database does not mistake it for a string.
+
+    Attributes:
+        name: The name of the table.
+    """
+    __slots__ = ("name",)
+
+    def __init__(self, name: str) -> None:
+        """
+        The constructor for the Table class.
+
+        :param name: (str) the name of the table
+        """
+        self.name: str = name
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Duration(_Value):
+    """
+    A SurrealDB duration with nanosecond precision.
+
+    Attributes:
+        seconds: The whole seconds of the duration.
+        nanoseconds: The nanoseconds of the duration on top of the seconds.
+    """
+    __slots__ = ("seconds", "nanoseconds")
+
+    def __init__(self, seconds: int = 0, nanoseconds: int = 0) -> None:
+        """
+        The constructor for the Duration class.
+
+        :param seconds: (int) the whole seconds of the duration
+        :param nanoseconds: (int) the nanoseconds of the duration on top of the seconds
+        """
+        self.seconds: int = seconds + nanoseconds // 10 ** 9
+        self.nanoseconds: int = nanoseconds % 10 ** 9
+
+    @staticmethod
+    def parse(duration: str) -> "Duration":
+        """
+        Creates a Duration from a SurrealQL duration string such as `1h30m`.
+
+        :param duration: (str) the duration to parse
+        :return: (Duration) the duration
+        """
+        units = dict(DURATION_UNITS)
+        units["us"] = units["µs"]
+        total = 0
+        end = 0
+        for match in DURATION_PATTERN.finditer(duration):
+            if match.start() != end:
+                break
+            total += int(match.group(1)) * units[match.group(2)]
+            end = match.end()
+        if end == 0 or end != len(duration):
+            raise ValueError(f"{duration} is not a duration")
+        return Duration(0, total)
+
+    @staticmethod
+    def from_timedelta(delta: timedelta) -> "Duration":
+        """
+        Creates a Duration from a timedelta.
+
+        :param delta: (timedelta) the timedelta to convert
+        :return: (Duration) the duration
+        """
+        return Duration(delta.days * 86400 + delta.seconds, delta.microseconds * 1000)
+
+    def to_timedelta(self) -> timedelta:
+        """
+        Converts the duration to a timedelta, losing precision below a microsecond.
+
+        :return: (timedelta) the duration as a timedelta
+        """
+        return timedelta(seconds=self.seconds, microseconds=self.nanoseconds // 1000)
+
+    def __str__(self) -> str:
+        remaining = self.seconds * 10 ** 9 + self.nanoseconds
+        if remaining == 0:
+            return "0ns"
+        parts = []
+        for unit, size in DURATION_UNITS:
+            count, remaining = divmod(remaining, size)
+            if count > 0:
+                parts.append(f"{count}{unit}")
+        return "".join(parts)
+
+
+class BoundIncluded(_Value):
+    """
+    A bound of a range that includes its value.
+
+    Attributes:
+        value: The value of the bound.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        """
+        The constructor for the BoundIncluded class.
+
+        :param value: (Any) the value of the bound
+        """
+        self.value: Any = value
+
+
+class BoundExcluded(_Value):
+    """
+    A bound of a range that excludes its value.
+
+    Attributes:
+        value: The value of the bound.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        """
+        The constructor for the BoundExcluded class.
+
+        :param value: (Any) the value of the bound
+        """
+        self.value: Any = value
+
+
+class Range(_Value):
+    """
+    A range of values, for instance the IDs of a record range.
+
+    Attributes:
+        begin: The lower bound of the range, None if it is unbounded.
+        end: The upper bound of the range, None if it is unbounded.
+    """
+    __slots__ = ("begin", "end")
+
+    def __init__(self, begin: Optional[_Value] = None, end: Optional[_Value] = None) -> None:
+        """
+        The constructor for the Range class.
+
+        :param begin: (Optional[BoundIncluded | BoundExcluded]) the lower bound of the range
+        :param end: (Optional[BoundIncluded | BoundExcluded]) the upper bound of the range
+        """
+        self.begin: Optional[_Value] = begin
+        self.end: Optional[_Value] = end
+
+
+class GeometryPoint(_Value):
+    """
+    A geometry point.
+
+    Attributes:
+        longitude: The x coordinate of the point.
+        latitude: The y coordinate of the point.
+    """
+    __slots__ = ("longitude", "latitude")
+
+    def __init__(self, longitude: float, latitude: float) -> None:
+        """
+        The constructor for the GeometryPoint class.
+
+        :param longitude: (float) the x coordinate of the point
+        :param latitude: (float) the y coordinate of the point
+        """
+        self.longitude: float = longitude
+        self.latitude: float = latitude
+
+
+class TaggedValue(_Value):
+    """
+    A value with a CBOR tag this module does not know, kept so it can be sent back unchanged.
+
+    Attributes:
+        tag: The CBOR tag of the value.
+        value: The tagged value.
+    """
+    __slots__ = ("tag", "value")
+
+    def __init__(self, tag: int, value: Any) -> None:
+        """
+        The constructor for the TaggedValue class.
+
+        :param tag: (int) the CBOR tag of the value
+        :param value: (Any) the tagged value
+        """
+        self.tag: int = tag
+        self.value: Any = value
+
+
+def _head(major: int, argument: int, out: bytearray) -> None:
+    """
+    Writes the initial byte of an item and its argument in the fewest bytes.
+
+    :param major: (int) the major type of the item
+    :param argument: (int) the length or value of the item
+    :param out: (bytearray) the buffer to write to
+    :return: None
+    """
+    major <<= 5
+    if argument < 24:
+        out.append(major | argument)
+    elif argument < 0x100:
+        out.append(major | 24)
+        out.append(argument)
+    elif argument < 0x10000:
+        out.append(major | 25)
+        out += struct.pack(">H", argument)
+    elif argument < 0x100000000:
+        out.append(major | 26)
+        out += struct.pack(">I", argument)
+    else:
+        out.append(major | 27)
+        out += struct.pack(">Q", argument)
+
+
+def _encode(value: Any, out: bytearray) -> None:
+    """
+    Writes a value to the buffer.
+
+    :param value: (Any) the value to encode
+    :param out: (bytearray) the buffer to write to
+    :return: None
+    """
+    if value is None:
+        out.append(0xf6)
+    elif value is True:
+        out.append(0xf5)
+    elif value is False:
+        out.append(0xf4)
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8")
+        _head(3, len(encoded), out)
+        out += encoded
+    elif isinstance(value, int):
+        if 0 <= value < 2 ** 64:
+            _head(0, value, out)
+        elif -2 ** 64 <= value < 0:
+            _head(1, -1 - value, out)
+        else:
+            tag, magnitude = (TAG_POSITIVE_BIGNUM, value) if value >= 0 else (TAG_NEGATIVE_BIGNUM, -1 - value)
+            _head(6, tag, out)
+            _encode(magnitude.to_bytes((magnitude.bit_length() + 7) // 8, "big"), out)
+    elif isinstance(value, float):
+        out.append(0xfb)
+        out += struct.pack(">d", value)
+    elif isinstance(value, dict):
+        _head(5, len(value), out)
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    elif isinstance(value, (list, tuple)):
+        _head(4, len(value), out)
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _head(2, len(value), out)
+        out += value
+    elif isinstance(value, RecordID):
+        _head(6, TAG_RECORD_ID, out)
+        _encode([value.table_name, value.id], out)
+    elif isinstance(value, Table):
+        _head(6, TAG_TABLE, out)
+        _encode(value.name, out)
+    elif isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        delta = value - EPOCH
+        _head(6, TAG_DATETIME_COMPACT, out)
+        _encode([delta.days * 86400 + delta.seconds, delta.microseconds * 1000], out)
+    elif isinstance(value, uuid.UUID):
+        _head(6, TAG_UUID_BINARY, out)
+        _encode(value.bytes, out)
+    elif isinstance(value, Decimal):
+        _head(6, TAG_DECIMAL_STRING, out)
+        _encode(str(value), out)
+    elif isinstance(value, Duration):
+        _head(6, TAG_DURATION_COMPACT, out)
+        _encode([value.seconds, value.nanoseconds], out)
+    elif isinstance(value, timedelta):
+        _encode(Duration.from_timedelta(value), out)
+    elif isinstance(value, Range):
+        _head(6, TAG_RANGE, out)
+        _encode([value.begin, value.end], out)
+    elif isinstance(value, BoundIncluded):
+        _head(6, TAG_BOUND_INCLUDED, out)
+        _encode(value.value, out)
+    elif isinstance(value, BoundExcluded):
+        _head(6, TAG_BOUND_EXCLUDED, out)
+        _encode(value.value, out)
+    elif isinstance(value, GeometryPoint):
+        _head(6, TAG_GEOMETRY_POINT, out)
+        _encode([value.longitude, value.latitude], out)
+    elif isinstance(value, TaggedValue):
+        _head(6, value.tag, out)
+        _encode(value.value, out)
+    else:
+        raise CborError(f"cannot encode {type(value).__name__} to CBOR")
+
+
+def encode(value: Any) -> bytes:
+    """
+    Encodes a value to CBOR.
+
+    :param value: (Any) the value to encode
+    :return: (bytes) the encoded value
+    """
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def _parse_datetime(value: str) -> datetime:
+    """
+    Parses an RFC 3339 datetime string, truncating the fraction to microseconds.
+
+    :param value: (str) the datetime to parse
+    :return: (datetime) the timezone aware datetime
+    """
+    match = re.match(r"^(.*?T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:\d{2})?$", value)
+    if match is None:
+        raise CborError(f"{value} is not a datetime")
+    base, fraction, offset = match.groups()
+    if fraction is not None:
+        base += "." + fraction[:6].ljust(6, "0")
+    if offset is None or offset == "Z":
+        offset = "+00:00"
+    return datetime.fromisoformat(base + offset)
+
+
+def _tagged(tag: int, value: Any) -> Any:
+    """
+    Converts a tagged value into the python type of its tag.
+
+    :param tag: (int) the tag of the value
+    :param value: (Any) the decoded value of the tag
+    :return: (Any) the converted value
+    """
+    if tag == TAG_RECORD_ID:
+        return RecordID(value[0], value[1])
+    if tag == TAG_NONE:
+        return None
+    if tag == TAG_DATETIME_COMPACT:
+        seconds = value[0] if len(value) > 0 else 0
+        nanoseconds = value[1] if len(value) > 1 else 0
+        return EPOCH + timedelta(seconds=seconds, microseconds=nanoseconds // 1000)
+    if tag == TAG_TABLE:
+        return Table(value)
+    if tag == TAG_UUID_BINARY:
+        return uuid.UUID(bytes=bytes(value))
+    if tag == TAG_UUID_STRING:
+        return uuid.UUID(value)
+    if tag == TAG_DECIMAL_STRING:
+        return Decimal(value)
+    if tag == TAG_DURATION_COMPACT:
+        return Duration(value[0] if len(value) > 0 else 0, value[1] if len(value) > 1 else 0)
+    if tag == TAG_DURATION_STRING:
+        return Duration.parse(value)
+    if tag == TAG_DATETIME_STRING:
+        return _parse_datetime(value)
+    if tag == TAG_DATETIME_EPOCH:
+        return EPOCH + timedelta(seconds=value)
+    if tag == TAG_POSITIVE_BIGNUM:
+        return int.from_bytes(value, "big")
+    if tag == TAG_NEGATIVE_BIGNUM:
+        return -1 - int.from_bytes(value, "big")
+    if tag == TAG_RANGE:
+        return Range(value[0], value[1])
+    if tag == TAG_BOUND_INCLUDED:
+        return BoundIncluded(value)
+    if tag == TAG_BOUND_EXCLUDED:
+        return BoundExcluded(value)
+    if tag == TAG_GEOMETRY_POINT:
+        return GeometryPoint(value[0], value[1])
+    return TaggedValue(tag, value)
+
+
+class _Decoder:
+    """
+    Decodes the items of a CBOR message one after another.
+
+    Attributes:
+        data: The message being decoded.
+        position: The index of the next byte to decode.
+    """
+    __slots__ = ("data", "position")
+
+    def __init__(self, data: bytes) -> None:
+        """
+        The constructor for the _Decoder class.
+
+        :param data: (bytes) the message to decode
+        """
+        self.data: bytes = data
+        self.position: int = 0
+
+    def _take(self, length: int) -> bytes:
+        """
+        Reads the next bytes of the message.
+
+        :param length: (int) the number of bytes to read
+        :return: (bytes) the bytes read
+        """
+        start = self.position
+        end = start + length
+        if end > len(self.data):
+            raise CborIncompleteError("the CBOR message ended before its last item")
+        self.position = end
+        return self.data[start:end]
+
+    def _argument(self, info: int) -> int:
+        """
+        Reads the argument of an item from its additional information.
+
+        :param info: (int) the low five bits of the initial byte
+        :return: (int) the length or value of the item
+        """
+        if info < 24:
+            return info
+        if info == 24:
+            return self._take(1)[0]
+        if info == 25:
+            return struct.unpack(">H", self._take(2))[0]
+        if info == 26:
+            return struct.unpack(">I", self._take(4))[0]
+        if info == 27:
+            return struct.unpack(">Q", self._take(8))[0]
+        raise CborError(f"invalid additional information {info}")
+
+    def _at_break(self) -> bool:
+        """
+        Consumes the break byte that ends an indefinite length item if it is next.
+
+        :return: (bool) True if the break byte was consumed
+        """
+        if self.position < len(self.data) and self.data[self.position] == 0xff:
+            self.position += 1
+            return True
+        return False
+
+    def decode(self) -> Any:
+        """
+        Decodes the next item of the message.
+
+        # Notes
+        Short strings, small integers, arrays and maps make up most of a response so they are
+        decoded without the method calls of the general path.
+
+        :return: (Any) the decoded item
+        """
+        data = self.data
+        position = self.position
+        try:
+            initial = data[position]
+        except IndexError:
+            raise CborIncompleteError("the CBOR message ended before its last item") from None
+        major = initial >> 5
+        info = initial & 0x1f
+
+        if info < 24:
+            self.position = position + 1
+            if major == 3:
+                end = position + 1 + info
+                if end > len(data):
+                    raise CborIncompleteError("the CBOR message ended before its last item")
+                self.position = end
+                return data[position + 1:end].decode("utf-8")
+            if major == 0:
+                return info
+            if major == 5:
+                decode = self.decode
+                mapping = {}
+                for _ in range(info):
+                    key = decode()
+                    mapping[key] = decode()
+                return mapping
+            if major == 4:
+                decode = self.decode
+                return [decode() for _ in range(info)]
+        self.position = position + 1
+
+        if major == 7:
+            if info == 20:
+                return False
+            if info == 21:
+                return True
+            if info == 22 or info == 23:
+                return None
+            if info == 25:
+                return struct.unpack(">e", self._take(2))[0]
+            if info == 26:
+                return struct.unpack(">f", self._take(4))[0]
+            if info == 27:
+                return struct.unpack(">d", self._take(8))[0]
+            raise CborError(f"unsupported simple value {info}")
+
+        if info == 31:
+            if major == 2:
+                chunks = []
+                while not self._at_break():
+                    chunks.append(self.decode())
+                return b"".join(chunks)
+            if major == 3:
+                chunks = []
+                while not self._at_break():
+                    chunks.append(self.decode())
+                return "".join(chunks)
+            if major == 4:
+                items = []
+                while not self._at_break():
+                    items.append(self.decode())
+                return items
+            if major == 5:
+                mapping = {}
+                while not self._at_break():
+                    key = self.decode()
+                    mapping[key] = self.decode()
+                return mapping
+            raise CborError(f"major type {major} cannot have an indefinite length")
+
+        argument = self._argument(info)
+        if major == 0:
+            return argument
+        if major == 1:
+            return -1 - argument
+        if major == 2:
+            return self._take(argument)
+        if major == 3:
+            return self._take(argument).decode("utf-8")
+        if major == 4:
+            decode = self.decode
+            return [decode() for _ in range(argument)]
+        if major == 5:
+            decode = self.decode
+            mapping = {}
+            for _ in range(argument):
+                key = decode()
+                mapping[key] = decode()
+            return mapping
+        return _tagged(argument, self.decode())
+
+
+def decode(data: bytes) -> Any:
+    """
+    Decodes a CBOR message.
+
+    :param data: (bytes) the message to decode
+    :return: (Any) the decoded value
+    """
+    decoder = _Decoder(bytes(data))
+    value = decoder.decode()
+    if decoder.position != len(decoder.data):
+        raise CborError("the CBOR message has trailing bytes after its first item")
+    return value
+
+
+def decode_items(data: bytes, start: int, count: int) -> Tuple[List[Any], int]:
+    """
+    Decodes a number of consecutive items from the middle of a CBOR message without decoding the rest.
+
+    :param data: (bytes) the message to decode from
+    :param start: (int) the index of the first byte of the first item
+    :param count: (int) the number of items to decode
+    :return: (Tuple[List[Any], int]) the decoded items and the index of the byte after the last item
+    """
+    decoder = _Decoder(data)
+    decoder.position = start
+    items = [decoder.decode() for _ in range(count)]
+    return items, decoder.position
+
+
+def decode_head(data: bytes, start: int) -> Tuple[int, Optional[int], int]:
+    """
+    Decodes the head of an item without decoding its content, for instance to step into an array.
+
+    :param data: (bytes) the message to decode from
+    :param start: (int) the index of the initial byte of the item
+    :return: (Tuple[int, Optional[int], int]) the major type, the argument (None for an indefinite length)
+                                              and the index of the byte after the head
+    """
+    decoder = _Decoder(data)
+    decoder.position = start
+    initial = decoder._take(1)[0]
+    info = initial & 0x1f
+    if info == 31:
+        return initial >> 5, None, decoder.position
+    return initial >> 5, decoder._argument(info), decoder.position
@@ -3,7 +3,6 @@ This module contains the entrypoint for the command line tool.
 """
 import argparse
 import os
-import json
 
 from sblpy.connection import SurrealSyncConnection
 from sblpy.migrations.db_processes import get_latest_version
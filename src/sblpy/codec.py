@@ -0,0 +1,310 @@
+"""
+Defines how RPC messages are encoded and decoded on the wire.
+
+# Notes
+The protocol of a connection is negotiated with the websocket subprotocol when it connects. A JSON
+connection does not ask for a subprotocol so it works with every version of SurrealDB, and its
+messages are sent as text frames. A CBOR connection asks for the "cbor" subprotocol and its messages
+are sent as binary frames.
+
+JSON is encoded and decoded with orjson or msgspec when one of them is installed, falling back to
+the standard library `json` module otherwise. Neither is a dependency of this package, install one
+with `pip install orjson` to speed up decoding large responses.
+"""
+import json
+import re
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+from sblpy import cbor
+from sblpy.errors import SurrealLiteError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# The JSON backends in the order they are preferred
+JSON_BACKENDS = ("orjson", "msgspec", "json")
+
+# SurrealDB sorts the keys of a response so a successful one starts with its id and then its result
+JSON_ENVELOPE = re.compile(r'\{\s*"id"\s*:\s*"([^"\\]*)"\s*,\s*"result"\s*:\s*')
+JSON_ENVELOPE_BYTES = re.compile(JSON_ENVELOPE.pattern.encode("utf-8"))
+# The status of a statement that failed, with and without the whitespace of pretty encoders
+JSON_ERROR_MARKERS = ('"status":"ERR"', '"status": "ERR"')
+CBOR_ERROR_MARKER = cbor.encode("status") + cbor.encode("ERR")
+
+
+class Codec:
+    """
+    The interface of the codecs that encode and decode RPC messages.
+
+    Attributes:
+        protocol: The name of the protocol.
+        subprotocols: The websocket subprotocols asked for when connecting, None to ask for none.
+    """
+    protocol: str = ""
+    subprotocols: Optional[List[str]] = None
+
+    def encode(self, message: Any) -> Union[str, bytes]:
+        """
+        Encodes a message, str is sent as a text frame and bytes as a binary frame.
+
+        :param message: (Any) the message to encode
+        :return: (Union[str, bytes]) the encoded message
+        """
+        raise NotImplementedError
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        """
+        Decodes a message read off the socket.
+
+        :param data: (Union[str, bytes]) the frame read off the socket
+        :return: (Any) the decoded message
+        """
+        raise NotImplementedError
+
+    def split(self, data: Union[str, bytes]) -> Optional[Tuple[Any, Union[str, bytes]]]:
+        """
+        Cheaply splits a successful response into its id and its undecoded result.
+
+        :param data: (Union[str, bytes]) the frame read off the socket
+        :return: (Optional[Tuple[Any, Union[str, bytes]]]) the id and the encoded result, None if the frame
+                                                             has to be decoded in full
+        """
+        return None
+
+    def may_have_errors(self, result: Union[str, bytes]) -> bool:
+        """
+        Cheaply checks an undecoded result for a statement that failed.
+
+        :param result: (Union[str, bytes]) the encoded result returned by `split`
+        :return: (bool) False if no statement failed, True if one might have
+        """
+        return True
+
+    def verify(self, websocket) -> None:
+        """
+        Checks that the database accepted the protocol when the connection was opened.
+
+        :param websocket: (Websocket) the connection that was just opened
+        :return: None
+        """
+        if self.subprotocols is not None and websocket.subprotocol not in self.subprotocols:
+            raise SurrealLiteError(
+                f"the database did not accept the {self.protocol} protocol, "
+                f"it requires a version of SurrealDB that supports it"
+            )
+
+
+def available_json_backends() -> List[str]:
+    """
+    Lists the JSON backends that can be used, in the order they are preferred.
+
+    :return: (List[str]) the names of the installed backends, "json" is always available
+    """
+    installed = {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+    return [backend for backend in JSON_BACKENDS if installed[backend] is True]
+
+
+class JsonCodec(Codec):
+    """
+    Encodes RPC messages as JSON text.
+
+    # Notes
+    The fast backends reject a few values that the standard library accepts, such as integers
+    larger than 64 bits or `NaN` in a response. Those messages are retried with the standard library
+    so every backend accepts the same messages. orjson decodes integers larger than 64 bits as
+    floats, which does not affect responses as the integers of SurrealDB are 64 bit.
+
+    Attributes:
+        protocol: The name of the protocol.
+        subprotocols: The websocket subprotocols asked for when connecting, None to ask for none.
+        backend: The library that encodes and decodes the JSON, "orjson", "msgspec" or "json".
+    """
+    protocol: str = "json"
+    subprotocols: Optional[List[str]] = None
+
+    def __init__(self, backend: Optional[str] = None) -> None:
+        """
+        The constructor for the JsonCodec class.
+
+        :param backend: (Optional[str]) the library that encodes and decodes the JSON, "orjson", "msgspec"
+                                        or "json" (defaults to the fastest one installed)
+        """
+        if backend is None:
+            backend = available_json_backends()[0]
+        if backend not in JSON_BACKENDS:
+            raise ValueError(f"JSON backend {backend} is not one of {', '.join(JSON_BACKENDS)}")
+        if backend not in available_json_backends():
+            raise ValueError(f"JSON backend {backend} is not installed")
+        self.backend: str = backend
+        self._dumps: Callable[[Any], str]
+        self._loads: Callable[[Union[str, bytes]], Any]
+        self._encode_errors: Tuple[type, ...] = (TypeError, ValueError, OverflowError)
+        self._decode_errors: Tuple[type, ...] = (ValueError,)
+        if backend == "orjson":
+            self._dumps = lambda message: orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+            self._loads = orjson.loads
+        elif backend == "msgspec":
+            encoder = msgspec.json.Encoder()
+            self._dumps = lambda message: encoder.encode(message).decode("utf-8")
+            self._loads = msgspec.json.Decoder().decode
+            self._encode_errors += (msgspec.EncodeError,)
+            self._decode_errors += (msgspec.DecodeError,)
+        else:
+            self._dumps = lambda message: json.dumps(message, ensure_ascii=False)
+            self._loads = json.loads
+
+    def encode(self, message: Any) -> str:
+        """
+        Encodes a message to be sent as a text frame.
+
+        :param message: (Any) the message to encode
+        :return: (str) the encoded message
+        """
+        try:
+            return self._dumps(message)
+        except self._encode_errors:
+            if self.backend == "json":
+                raise
+            return json.dumps(message, ensure_ascii=False)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        """
+        Decodes a message read off the socket.
+
+        :param data: (Union[str, bytes]) the frame read off the socket
+        :return: (Any) the decoded message
+        """
+        try:
+            return self._loads(data)
+        except self._decode_errors:
+            if self.backend == "json":
+                raise
+            return json.loads(data)
+
+    def split(self, data: Union[str, bytes]) -> Optional[Tuple[Any, Union[str, bytes]]]:
+        """
+        Cheaply splits a successful response into its id and its undecoded result.
+
+        :param data: (Union[str, bytes]) the frame read off the socket
+        :return: (Optional[Tuple[Any, Union[str, bytes]]]) the id and the encoded result, None if the frame
+                                                             has to be decoded in full
+        """
+        if isinstance(data, str):
+            match = JSON_ENVELOPE.match(data)
+            end = "}"
+        else:
+            match = JSON_ENVELOPE_BYTES.match(data)
+            end = b"}"
+        if match is None:
+            return None
+        result = data[match.end():].rstrip()
+        if not result.endswith(end):
+            return None
+        request_id = match.group(1)
+        if isinstance(request_id, bytes):
+            request_id = request_id.decode("utf-8")
+        return request_id, result[:-1]
+
+    def may_have_errors(self, result: Union[str, bytes]) -> bool:
+        """
+        Cheaply checks an undecoded result for a statement that failed.
+
+        :param result: (Union[str, bytes]) the encoded result returned by `split`
+        :return: (bool) False if no statement failed, True if one might have
+        """
+        for marker in JSON_ERROR_MARKERS:
+            if (marker if isinstance(result, str) else marker.encode("utf-8")) in result:
+                return True
+        return False
+
+
+class CborCodec(Codec):
+    """
+    Encodes RPC messages as CBOR with the SurrealDB tags, see `sblpy.cbor`.
+
+    Attributes:
+        protocol: The name of the protocol.
+        subprotocols: The websocket subprotocols asked for when connecting.
+    """
+    protocol: str = "cbor"
+    subprotocols: Optional[List[str]] = ["cbor"]
+
+    def encode(self, message: Any) -> bytes:
+        """
+        Encodes a message to be sent as a binary frame.
+
+        :param message: (Any) the message to encode
+        :return: (bytes) the encoded message
+        """
+        return cbor.encode(message)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        """
+        Decodes a message read off the socket.
+
+        :param data: (Union[str, bytes]) the frame read off the socket
+        :return: (Any) the decoded message
+        """
+        if isinstance(data, str):
+            raise SurrealLiteError(f"expected a binary CBOR frame but received text: {data[:200]}")
+        return cbor.decode(data)
+
+    def split(self, data: Union[str, bytes]) -> Optional[Tuple[Any, Union[str, bytes]]]:
+        """
+        Cheaply splits a successful response into its id and its undecoded result.
+
+        :param data: (Union[str, bytes]) the frame read off the socket
+        :return: (Optional[Tuple[Any, Union[str, bytes]]]) the id and the encoded result, None if the frame
+                                                             has to be decoded in full
+        """
+        # a map of two entries
+        if isinstance(data, str) or data[:1] != b"\xa2":
+            return None
+        try:
+            (key, request_id), position = cbor.decode_items(data, 1, 2)
+            if key != "id":
+                return None
+            (key,), position = cbor.decode_items(data, position, 1)
+        except cbor.CborError:
+            return None
+        if key != "result":
+            return None
+        return request_id, data[position:]
+
+    def may_have_errors(self, result: Union[str, bytes]) -> bool:
+        """
+        Cheaply checks an undecoded result for a statement that failed.
+
+        :param result: (Union[str, bytes]) the encoded result returned by `split`
+        :return: (bool) False if no statement failed, True if one might have
+        """
+        return CBOR_ERROR_MARKER in result
+
+
+# Maps the name of each protocol to its codec
+CODECS = {
+    JsonCodec.protocol: JsonCodec,
+    CborCodec.protocol: CborCodec,
+}
+
+
+def get_codec(protocol: Union[str, Codec] = "json") -> Codec:
+    """
+    Gets the codec of a protocol.
+
+    :param protocol: (Union[str, Codec]) the name of the protocol, "json" or "cbor", or a codec to use as it is
+    :return: (Codec) the codec of the protocol
+    """
+    if isinstance(protocol, Codec):
+        return protocol
+    codec = CODECS.get(protocol)
+    if codec is None:
+        raise ValueError(f"protocol {protocol} is not one of {', '.join(repr(name) for name in CODECS)}")
+    return codec()
@@ -1,20 +1,40 @@
 """
 A basic synchronous connection to a SurrealDB instance.
 """
-import json
 import uuid
 from types import TracebackType
-from typing import Optional, Dict, Any, Type
+from typing import Optional, Dict, Any, Type, Iterable, Iterator, List, Set, Union
 
 from websockets.sync.client import connect
 
+from sblpy.auth import TokenCache, authenticate_params
+from sblpy.cache import QueryCache, cache_scope, succeeded
+from sblpy.codec import Codec, get_codec
+from sblpy.errors import QueryError, SurrealLiteError
 from sblpy.query import Query
+from sblpy.rpc import RpcCall, RpcMethods, unpack_result
+from sblpy.scan import TableScan
+from sblpy.stream import open_record_stream
 
 
-class SurrealSyncConnection:
+class SurrealSyncConnection(RpcMethods):
     """
     A basic synchronous connection to a SurrealDB instance. To be used once and discarded.
 
+    # Notes
+    If a `token_cache` is passed, the connection authenticates with the token cached by an earlier
+    connection with the same credentials and only signs in with the password if there is no token
+    or the token is rejected.
+
+    With `protocol="cbor"` the messages are sent as CBOR in binary frames rather than JSON text, and
+    record IDs, datetimes, UUIDs, decimals and durations are returned as python types, see `sblpy.cbor`.
+
+    If a `query_cache` is passed, `query` answers read only queries from the cache and drops the
+    cached queries reading the tables it writes to, see `sblpy.cache`.
+
+    `select`, `create`, `insert`, `update`, `merge`, `patch` and `delete` call the RPC methods of
+    the same name that work on a table or record ID without a SurrealQL query, see `sblpy.rpc`.
+
     Attributes:
         url: The URL of the database to process queries for.
         user: The username to login on.
@@ -24,6 +44,10 @@ class SurrealSyncConnection:
         socket: The WebSocket connection to the SurrealDB instance.
         id: The ID of the connection.
         token: The token of the connection.
+        token_cache: The cache of auth tokens shared with other connections, None to always sign in.
+        codec: Encodes and decodes the messages of the protocol of the connection.
+        query_cache: The cache of the responses of read only queries, None to send every query.
+        unanswered: The ids of the queries sent by pipelines whose responses have not been read yet.
     """
     def __init__(
             self,
@@ -34,7 +58,10 @@ class SurrealSyncConnection:
             namespace: str = "default",
             database: str = "default",
             max_size: int = 2 ** 20,
-            encrypted: bool = False
+            encrypted: bool = False,
+            token_cache: Optional[TokenCache] = None,
+            protocol: Union[str, Codec] = "json",
+            query_cache: Optional[QueryCache] = None
     ) -> None:
         """
         The constructor for the SurrealSyncConnection class.
@@ -47,6 +74,9 @@ class SurrealSyncConnection:
         :param database: (str) The database that the connection will stick to
         :param max_size: (int) The maximum size of the connection
         :param encrypted: (bool) Whether the connection is encrypted
+        :param token_cache: (Optional[TokenCache]) the cache of auth tokens shared with other connections
+        :param protocol: (Union[str, Codec]) the protocol of the messages, "json", "cbor" or a codec
+        :param query_cache: (Optional[QueryCache]) the cache of the responses of read only queries
         """
         if encrypted is True:
             self.url: str = f"wss://{host}:{port}/rpc"
@@ -58,20 +88,62 @@ class SurrealSyncConnection:
         self.password: str = password
         self.namespace: str = namespace
         self.database: str = database
-        self.socket = connect(self.url, max_size=max_size)
+        self.codec: Codec = get_codec(protocol)
+        self.query_cache: Optional[QueryCache] = query_cache
+        self._cache_scope: str = cache_scope(self.url, namespace, database)
+        self.socket = connect(self.url, max_size=max_size, subprotocols=self.codec.subprotocols)
+        try:
+            self.codec.verify(self.socket)
+        except Exception:
+            self.socket.close()
+            raise
         self.id: str = str(uuid.uuid4())
         self.token: Optional[str] = None
+        self.token_cache: Optional[TokenCache] = token_cache
+        self.unanswered: Set[str] = set()
         self.signin()
         self.set_space()
 
     def signin(self) -> None:
         """
-        Signs in to the SurrealDB instance.
+        Signs in to the SurrealDB instance, with the cached token if there is a token cache.
+
+        :return: None
+        """
+        if self.token_cache is None:
+            self.signin_with_password()
+            return
+        key = TokenCache.key(self.url, self.user, self.password)
+        with self.token_cache.lock(key):
+            token = self.token_cache.get(key)
+            if token is not None and self.authenticate(token) is True:
+                return
+            self.token_cache.invalidate(key)
+            self.signin_with_password()
+            self.token_cache.put(key, self.token)
+
+    def authenticate(self, token: str) -> bool:
+        """
+        Authenticates the connection with a token from an earlier signin.
+
+        :param token: (str) the token to authenticate with
+        :return: (bool) True if the database accepted the token
+        """
+        self.socket.send(self.codec.encode(authenticate_params(self.id, token)))
+        response = self.codec.decode(self.socket.recv())
+        if response.get("error") is not None:
+            return False
+        self.token = token
+        return True
+
+    def signin_with_password(self) -> None:
+        """
+        Signs in to the SurrealDB instance with the username and password.
 
         :return: None
         """
-        self.socket.send(json.dumps(self.sign_params, ensure_ascii=False))
-        response = json.loads(self.socket.recv())
+        self.socket.send(self.codec.encode(self.sign_params))
+        response = self.codec.decode(self.socket.recv())
         if response.get("error") is not None:
             raise Exception(f"error signing in: {response.get('error')}")
         if response.get("result") is None:
@@ -87,8 +159,23 @@ class SurrealSyncConnection:
 
         :return: None
         """
-        self.socket.send(json.dumps(self.use_params, ensure_ascii=False))
-        _ = json.loads(self.socket.recv())
+        self.socket.send(self.codec.encode(self.use_params))
+        _ = self.codec.decode(self.socket.recv())
+
+    def discard_unanswered(self) -> None:
+        """
+        Reads and discards the responses still on the socket for the queries of a pipeline that was abandoned.
+
+        # Notes
+        A pipeline that is neither executed nor used as a context manager leaves the responses of its
+        queries on the socket. They are read off before the connection sends anything else so the
+        next request is not answered with the response of another.
+
+        :return: None
+        """
+        while len(self.unanswered) > 0:
+            response = self.codec.decode(self.socket.recv())
+            self.unanswered.discard(response.get("id"))
 
     def query(self, query: str, vars: Optional[Dict[str, Any]] = None) -> dict:
         """
@@ -99,13 +186,158 @@ class SurrealSyncConnection:
         :return: The result of the query
         """
         query = Query(query, vars)
-        self.socket.send(json.dumps(query.query_params, ensure_ascii=False))
-        response = json.loads(self.socket.recv())
+        if self.query_cache is not None:
+            frame = self.query_cache.get(query.sql, query.vars, self._cache_scope)
+            if frame is not None:
+                return self._unpack(self.codec.decode(frame))
+            generation = self.query_cache.generation(query.sql, self._cache_scope)
+        self.discard_unanswered()
+        self.socket.send(self.codec.encode(query.query_params))
+        frame = self.socket.recv()
+        response = self.codec.decode(frame)
+        if self.query_cache is not None:
+            self.query_cache.observe(query.sql, self._cache_scope)
+            if succeeded(response):
+                self.query_cache.put(query.sql, query.vars, frame, generation, self._cache_scope)
+        return self._unpack(response)
+
+    def call(self, rpc: RpcCall) -> Any:
+        """
+        Calls a direct RPC method of the SurrealDB instance.
+
+        :param rpc: (RpcCall) the method and its parameters
+        :return: (Any) the result of the method
+        """
+        self.discard_unanswered()
+        self.socket.send(self.codec.encode(rpc.for_protocol(self.codec.protocol).query_params))
+        response = self.codec.decode(self.socket.recv())
+        if self.query_cache is not None and rpc.writes is True:
+            self.query_cache.invalidate([rpc.table], self._cache_scope)
+        return unpack_result(response, rpc.method)
+
+    def query_stream(
+            self,
+            query: str,
+            vars: Optional[Dict[str, Any]] = None,
+            max_size: Optional[int] = None
+    ) -> Iterator[Any]:
+        """
+        Queries the SurrealDB instance, yielding the records of the first statement as they are decoded.
+
+        # Notes
+        The response is read in the fragments it arrives in and each record is decoded as soon as it
+        has been read, so the records of a large SELECT are never all held at once. `max_size` lifts
+        the size limit of the connection for this response only. If the iteration is stopped early
+        the rest of the response is read and discarded so the connection can still be used.
+
+        :param query: (str) the query to run
+        :param vars: (Optional[Dict[str, Any]]) the variables to use in the query
+        :param max_size: (Optional[int]) the maximum size of the response (defaults to the max_size of the connection)
+        :return: (Iterator[Any]) the records of the first statement
+        """
+        query = Query(query, vars)
+        protocol = self.socket.protocol
+        previous_max_size = protocol.max_size
+        if max_size is not None:
+            protocol.max_size = max_size
+        try:
+            self.discard_unanswered()
+            self.socket.send(self.codec.encode(query.query_params))
+            fragments = self.socket.recv_streaming()
+            stream = open_record_stream(self.codec)
+            try:
+                for fragment in fragments:
+                    yield from stream.feed(fragment)
+            finally:
+                # read the rest of the response if the caller stopped early
+                for _ in fragments:
+                    pass
+            yield from stream.close()
+        finally:
+            protocol.max_size = previous_max_size
+
+    def stream(
+            self,
+            table: str,
+            batch_size: int = 1000,
+            where: Optional[str] = None,
+            order_by: Optional[str] = None,
+            vars: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yields every record of a table, selecting them a page at a time with keyset pagination.
+
+        # Notes
+        The query of the next page is sent before the records of the current page are yielded, so
+        the database selects the next page while the caller handles the current one. See `TableScan`.
+
+        :param table: (str) the name of the table to stream
+        :param batch_size: (int) the number of records selected in each page
+        :param where: (Optional[str]) the SurrealQL condition the records have to meet, such as "age > $age"
+        :param order_by: (Optional[str]) the field to order the records by, optionally followed by ASC or DESC
+        :param vars: (Optional[Dict[str, Any]]) the variables used in the condition
+        :return: (Iterator[Dict[str, Any]]) the records of the table
+        """
+        scan = TableScan(table, batch_size, where, order_by, vars)
+        self.discard_unanswered()
+        self.socket.send(self.codec.encode(scan.query().query_params))
+        pending = True
+        try:
+            while pending is True:
+                response = self.codec.decode(self.socket.recv())
+                pending = False
+                records = scan.advance(self._unpack(response))
+                if scan.done is False:
+                    self.socket.send(self.codec.encode(scan.query().query_params))
+                    pending = True
+                yield from records
+        finally:
+            # read the page that was prefetched if the caller stopped early
+            if pending is True:
+                self.socket.recv()
+
+    def pipeline(self, window: int = 100) -> "Pipeline":
+        """
+        Creates a pipeline that writes queries back to back on the connection without waiting for each response.
+
+        :param window: (int) the maximum number of queries awaiting a response at once
+        :return: (Pipeline) the pipeline of the connection
+        """
+        self.discard_unanswered()
+        return Pipeline(self, window)
+
+    def query_many(self, queries: Iterable[Union[str, Query]], window: int = 100) -> List[Any]:
+        """
+        Runs many queries with one round trip per window rather than one per query.
+
+        # Notes
+        All the responses are read before an error is raised so the connection can still be used.
+
+        :param queries: (Iterable[Union[str, Query]]) the queries to run, a Query to pass variables
+        :param window: (int) the maximum number of queries awaiting a response at once
+        :return: (List[Any]) the results of the queries in the order of the queries
+        """
+        pipeline = self.pipeline(window)
+        for query in queries:
+            if isinstance(query, Query):
+                pipeline.add(query)
+            else:
+                pipeline.query(query)
+        return pipeline.execute()
+
+    @staticmethod
+    def _unpack(response: dict) -> Any:
+        """
+        Extracts the result of the first statement from the response of a query.
+
+        :param response: (dict) the raw response from the database
+        :return: The result of the query
+        """
         if response.get("result") is None:
-            raise Exception(f"error querying no result: {response}")
+            raise QueryError(f"error querying no result: {response}")
         response = response["result"]
         if response[0].get("status") is not None and response[0].get("status") == "ERR":
-            raise Exception(f"error querying: {response[0].get('result')}")
+            raise QueryError(f"error querying: {response[0].get('result')}")
         return response[0]["result"]
 
     def __aexit__(
@@ -159,3 +391,124 @@ class SurrealSyncConnection:
                 self.database
             ]
         }
+
+
+class Pipeline:
+    """
+    Writes queries back to back on the socket of a blocking connection and matches the responses by id.
+
+    # Notes
+    A query is sent as soon as it is added unless `window` queries are already awaiting a response,
+    in which case responses are read until there is room. This keeps the server busy without
+    flooding it. `execute` reads the remaining responses and returns the results in the order the
+    queries were added. When used as a context manager the pipeline is executed on exit and the
+    results are stored in `results`.
+
+    The database can run the queries in flight at the same time in any order, so a query that
+    depends on an earlier one should be sent after `execute` or put in the same query. A query added
+    again while it is still in the pipeline is sent as a copy with an id of its own. A pipeline that
+    is abandoned before it is executed has the responses of its queries discarded by the next request
+    of the connection, after which it can no longer be executed.
+
+    Attributes:
+        connection: The connection the queries are sent on.
+        window: The maximum number of queries awaiting a response at once.
+        results: The results of the last `execute`, None before the pipeline has been executed.
+    """
+    def __init__(self, connection: SurrealSyncConnection, window: int = 100) -> None:
+        """
+        The constructor for the Pipeline class.
+
+        :param connection: (SurrealSyncConnection) the connection the queries are sent on
+        :param window: (int) the maximum number of queries awaiting a response at once
+        """
+        if window < 1:
+            raise ValueError(f"the window of a pipeline has to be at least 1, not {window}")
+        self.connection: SurrealSyncConnection = connection
+        self.window: int = window
+        self.results: Optional[List[Any]] = None
+        self._order: List[str] = []
+        self._waiting: set = set()
+        self._responses: Dict[str, dict] = {}
+
+    def add(self, query: Query) -> int:
+        """
+        Sends a query, first reading responses if the window is full.
+
+        :param query: (Query) the query to send
+        :return: (int) the index of the result of the query in the results
+        """
+        while len(self._waiting) >= self.window:
+            self._receive()
+        if query.id in self._waiting or query.id in self._responses:
+            # the responses are matched by id so the same query added twice is sent as a copy
+            query = Query(query.sql, query._vars, query.priority, query.tenant)
+        self.connection.socket.send(self.connection.codec.encode(query.query_params))
+        self.connection.unanswered.add(query.id)
+        self._order.append(query.id)
+        self._waiting.add(query.id)
+        return len(self._order) - 1
+
+    def query(self, query: str, vars: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Sends a query, first reading responses if the window is full.
+
+        :param query: The query to run
+        :param vars: The variables to use in the query
+        :return: (int) the index of the result of the query in the results
+        """
+        return self.add(Query(query, vars))
+
+    def _receive(self) -> None:
+        """
+        Reads a response off the socket and keeps it for its query.
+
+        :return: None
+        """
+        if self._waiting.issubset(self.connection.unanswered) is False:
+            raise SurrealLiteError("the responses of the pipeline were discarded by a later request of the connection")
+        response = self.connection.codec.decode(self.connection.socket.recv())
+        request_id = response.get("id")
+        self.connection.unanswered.discard(request_id)
+        if request_id in self._waiting:
+            self._waiting.discard(request_id)
+            self._responses[request_id] = response
+
+    def drain(self) -> None:
+        """
+        Reads the responses of all the queries that have been sent.
+
+        :return: None
+        """
+        while len(self._waiting) > 0:
+            self._receive()
+
+    def execute(self) -> List[Any]:
+        """
+        Reads the remaining responses and unpacks the results of the queries.
+
+        :return: (List[Any]) the results of the queries in the order they were added
+        """
+        self.drain()
+        responses = [self._responses.pop(request_id) for request_id in self._order]
+        self._order = []
+        self.results = [self.connection._unpack(response) for response in responses]
+        return self.results
+
+    def __enter__(self) -> "Pipeline":
+        """No-op for entering the context manager since queries are sent as they are added."""
+        return self
+
+    def __exit__(
+            self,
+            exc_type: Optional[Type[BaseException]],
+            exc_value: Optional[BaseException],
+            traceback: Optional[TracebackType]
+    ) -> None:
+        """Executes the pipeline, or only reads the responses if the block raised, when exiting the context manager."""
+        if exc_type is None:
+            self.execute()
+            return
+        self.drain()
+        self._order = []
+        self._responses = {}
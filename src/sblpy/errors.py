@@ -0,0 +1,40 @@
+"""
+Defines the errors raised by the connections and the connection pool.
+"""
+
+
+class SurrealLiteError(Exception):
+    """
+    The base class for the errors raised by sblpy.
+    """
+
+
+class ConnectionDroppedError(SurrealLiteError):
+    """
+    Raised for a request that was in flight on a connection that dropped before the response arrived.
+
+    # Notes
+    The request may or may not have been run by the database, so it is left to the caller to decide
+    whether it is safe to send it again.
+    """
+
+
+class QueryError(SurrealLiteError):
+    """
+    Raised when the database answers a query or RPC method with an error.
+
+    # Notes
+    The whole response has been read, so the connection can still be used for the next request.
+    """
+
+
+class QueryTimeoutError(SurrealLiteError, TimeoutError):
+    """
+    Raised when a query does not get a response within its timeout.
+    """
+
+
+class PoolOverloadedError(SurrealLiteError):
+    """
+    Raised when the connection pool sheds a query because its queue is full.
+    """
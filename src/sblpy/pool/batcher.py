@@ -0,0 +1,306 @@
+"""
+Defines how small queries queued at about the same time are sent to the database as one multi-statement query.
+"""
+import asyncio
+import re
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sblpy.cache import STRING_LITERAL, split_statements
+from sblpy.codec import Codec
+from sblpy.query import Query
+from sblpy.response import Response
+
+# A variable of a query, or a string literal so the variables inside of it are left alone
+VARIABLE_OR_LITERAL = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|\$([A-Za-z_][A-Za-z0-9_]*)""", re.DOTALL)
+# Statements that do not mean the same thing once other statements run around them, and comments
+# that could hide a semicolon
+NOT_BATCHABLE = re.compile(r"\b(?:BEGIN|COMMIT|CANCEL|LET|USE)\b|--|//|/\*|#", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def batchable(sql: str) -> bool:
+    """
+    Checks whether a query can be sent in a batch with other queries.
+
+    :param sql: (str) the query
+    :return: (bool) True if the query is a single statement outside of a transaction that sets no variables
+    """
+    blanked = STRING_LITERAL.sub("''", sql)
+    return NOT_BATCHABLE.search(blanked) is None and len(split_statements(blanked)) == 1
+
+
+def rename_vars(sql: str, vars: Dict[str, Any], prefix: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Prefixes the variables of a query so they cannot clash with those of the other queries of a batch.
+
+    :param sql: (str) the query
+    :param vars: (Dict[str, Any]) the variables of the query
+    :param prefix: (str) the prefix of the variables
+    :return: (Tuple[str, Dict[str, Any]]) the query and its variables with the prefixed names
+    """
+    if len(vars) == 0:
+        return sql, vars
+
+    def rename(match: re.Match) -> str:
+        name = match.group(2)
+        if name is None or name not in vars:
+            return match.group(0)
+        return f"${prefix}{name}"
+
+    return VARIABLE_OR_LITERAL.sub(rename, sql), {f"{prefix}{name}": value for name, value in vars.items()}
+
+
+class PendingQuery:
+    """
+    A query waiting in a batch for its response.
+
+    Attributes:
+        query: The query.
+        future: The future the response of the query is set on.
+        size: The rough size of the query in the message of the batch.
+        abandoned: Whether the caller has stopped waiting for the response.
+    """
+    __slots__ = ("query", "future", "size", "abandoned")
+
+    def __init__(self, query: Query, future: asyncio.Future, size: int) -> None:
+        """
+        The constructor for the PendingQuery class.
+
+        :param query: (Query) the query
+        :param future: (asyncio.Future) the future the response of the query is set on
+        :param size: (int) the rough size of the query in the message of the batch
+        """
+        self.query: Query = query
+        self.future: asyncio.Future = future
+        self.size: int = size
+        self.abandoned: bool = False
+
+
+class Batch:
+    """
+    The queries collected to be sent together.
+
+    Attributes:
+        key: The priority and tenant shared by the queries.
+        queries: The queries of the batch in order.
+        size: The rough size of the message of the batch.
+        timer: Sends the batch once the window has passed, None once it has been sent.
+        task: The task sending the batch, None until it is sent.
+    """
+    def __init__(self, key: Tuple[int, Optional[str]]) -> None:
+        """
+        The constructor for the Batch class.
+
+        :param key: (Tuple[int, Optional[str]]) the priority and tenant shared by the queries
+        """
+        self.key: Tuple[int, Optional[str]] = key
+        self.queries: List[PendingQuery] = []
+        self.size: int = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class QueryBatcher:
+    """
+    Collects small queries for a short window and sends them as one multi-statement query.
+
+    # Notes
+    A batch is sent `window` seconds after its first query arrives, or as soon as it holds
+    `max_statements` queries or about `max_bytes` of SQL and variables. The queries are joined with
+    their variables prefixed so they cannot clash, and the result of each statement is handed back
+    to the caller of its query as a response of its own. Only queries with the same priority and
+    tenant are batched together so the scheduler still orders them fairly.
+
+    The statements of a batch run one after another but not in a transaction, so a failing statement
+    only fails its own query. If the database rejects the whole batch, for instance because one of the
+    queries does not parse, the queries are sent again one at a time so each caller gets its own error.
+
+    Attributes:
+        send: Sends a query through the pool and waits for its response.
+        codec: Encodes the responses handed back to the callers.
+        window: The seconds a batch waits for more queries after the first one arrives.
+        max_statements: The maximum number of queries in a batch.
+        max_bytes: The rough maximum size of the message of a batch.
+        batches: The number of batches sent with more than one query.
+        batched: The number of queries sent in those batches.
+    """
+    def __init__(
+            self,
+            send: Callable[[Query], Awaitable[Response]],
+            codec: Codec,
+            window: float,
+            max_statements: int = 100,
+            max_bytes: int = 2 ** 19
+    ) -> None:
+        """
+        The constructor for the QueryBatcher class.
+
+        :param send: (Callable[[Query], Awaitable[Response]]) sends a query through the pool
+        :param codec: (Codec) encodes the responses handed back to the callers
+        :param window: (float) the seconds a batch waits for more queries after the first one arrives
+        :param max_statements: (int) the maximum number of queries in a batch
+        :param max_bytes: (int) the rough maximum size of the message of a batch
+        """
+        if window < 0:
+            raise ValueError(f"window has to be at least 0, not {window}")
+        if max_statements < 1:
+            raise ValueError(f"max_statements has to be at least 1, not {max_statements}")
+        self.send: Callable[[Query], Awaitable[Response]] = send
+        self.codec: Codec = codec
+        self.window: float = window
+        self.max_statements: int = max_statements
+        self.max_bytes: int = max_bytes
+        self.batches: int = 0
+        self.batched: int = 0
+        self._open: Dict[Tuple[int, Optional[str]], Batch] = {}
+        self._sending: Dict[asyncio.Task, Batch] = {}
+
+    async def submit(self, query: Query, timeout: Optional[float] = None) -> Response:
+        """
+        Adds a query to the open batch of its priority and tenant and waits for its response.
+
+        :param query: (Query) a query that is `batchable`
+        :param timeout: (Optional[float]) the seconds to wait before raising an asyncio.TimeoutError
+        :return: (Response) the response of the query on its own
+        """
+        loop = asyncio.get_running_loop()
+        size = len(query.sql) + (len(self.codec.encode(query.vars)) if len(query.vars) > 0 else 0)
+        pending = PendingQuery(query, loop.create_future(), size)
+        key = (query.priority, query.tenant)
+        batch = self._open.get(key)
+        if batch is not None and batch.size + size > self.max_bytes:
+            self._dispatch(batch)
+            batch = None
+        if batch is None:
+            batch = Batch(key)
+            self._open[key] = batch
+            batch.timer = loop.call_later(self.window, self._dispatch, batch)
+        batch.queries.append(pending)
+        batch.size += size
+        if len(batch.queries) >= self.max_statements or batch.size >= self.max_bytes:
+            self._dispatch(batch)
+        try:
+            if timeout is None:
+                return await asyncio.shield(pending.future)
+            return await asyncio.wait_for(asyncio.shield(pending.future), timeout)
+        finally:
+            if not pending.future.done():
+                self._abandon(batch, pending)
+
+    def flush(self) -> List[asyncio.Task]:
+        """
+        Sends every open batch without waiting for its window to pass.
+
+        :return: (List[asyncio.Task]) the tasks sending the batches that have not been answered yet
+        """
+        for batch in list(self._open.values()):
+            self._dispatch(batch)
+        return list(self._sending)
+
+    def _dispatch(self, batch: Batch) -> None:
+        """
+        Closes a batch to new queries and starts sending it.
+
+        :param batch: (Batch) the batch to send
+        :return: None
+        """
+        if batch.task is not None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+            batch.timer = None
+        if self._open.get(batch.key) is batch:
+            del self._open[batch.key]
+        batch.task = asyncio.ensure_future(self._run(batch.queries))
+        self._sending[batch.task] = batch
+        batch.task.add_done_callback(lambda task: self._sending.pop(task, None))
+
+    def _abandon(self, batch: Batch, pending: PendingQuery) -> None:
+        """
+        Drops a query whose caller stopped waiting, cancelling the batch if nobody is waiting on it.
+
+        :param batch: (Batch) the batch the query is in
+        :param pending: (PendingQuery) the query
+        :return: None
+        """
+        pending.abandoned = True
+        if batch.task is None:
+            batch.queries.remove(pending)
+            batch.size -= pending.size
+            if len(batch.queries) == 0:
+                if batch.timer is not None:
+                    batch.timer.cancel()
+                    batch.timer = None
+                if self._open.get(batch.key) is batch:
+                    del self._open[batch.key]
+        elif all(queued.abandoned for queued in batch.queries) and not batch.task.done():
+            batch.task.cancel()
+
+    async def _run(self, queries: List[PendingQuery]) -> None:
+        """
+        Sends the queries of a batch and hands each caller its response.
+
+        :param queries: (List[PendingQuery]) the queries of the batch
+        :return: None
+        """
+        if len(queries) == 1:
+            await self._run_one(queries[0])
+            return
+        parts = []
+        vars: Dict[str, Any] = {}
+        for index, pending in enumerate(queries):
+            sql, renamed = rename_vars(pending.query.sql, pending.query.vars, f"sblpy_{index}_")
+            parts.append(sql.strip().rstrip(";").rstrip())
+            vars.update(renamed)
+        first = queries[0].query
+        query = Query(";\n".join(parts) + ";", vars, first.priority, first.tenant)
+        try:
+            response = await self.send(query)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            for pending in queries:
+                self._resolve(pending, error=error)
+            return
+        result = response.result
+        if response.error is not None or not isinstance(result, list) or len(result) != len(queries):
+            # the database refused the batch as a whole, so each query is sent on its own to get its own outcome
+            await asyncio.gather(*[self._run_one(pending) for pending in queries if pending.abandoned is False])
+            return
+        self.batches += 1
+        self.batched += len(queries)
+        for pending, statement in zip(queries, result):
+            frame = self.codec.encode({"id": response.id, "result": [statement]})
+            self._resolve(pending, Response(frame, self.codec))
+
+    async def _run_one(self, pending: PendingQuery) -> None:
+        """
+        Sends a query on its own and hands its caller the response.
+
+        :param pending: (PendingQuery) the query
+        :return: None
+        """
+        try:
+            self._resolve(pending, await self.send(pending.query))
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self._resolve(pending, error=error)
+
+    @staticmethod
+    def _resolve(pending: PendingQuery, response: Optional[Response] = None, error: Optional[Exception] = None) -> None:
+        """
+        Hands a caller the response of its query or the error it failed with.
+
+        :param pending: (PendingQuery) the query
+        :param response: (Optional[Response]) the response of the query
+        :param error: (Optional[Exception]) the error of the query
+        :return: None
+        """
+        if pending.abandoned is True or pending.future.done():
+            return
+        if error is not None:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(response)
@@ -0,0 +1,316 @@
+"""
+Defines the websocket client actor that runs inside the async connection pool.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Dict
+from uuid import uuid4
+
+import websockets
+
+from sblpy.errors import ConnectionDroppedError
+from sblpy.pool.metrics import ClientMetrics
+from sblpy.pool.setup_config import setup_connection
+from sblpy.query import Priority
+from sblpy.response import Response
+
+logger = logging.getLogger(__name__)
+
+# The errors that mean the connection to the database was lost or could not be made
+CONNECTION_ERRORS = (
+    websockets.ConnectionClosed,
+    websockets.InvalidHandshake,
+    OSError,
+    asyncio.TimeoutError,
+    ConnectionDroppedError
+)
+
+
+class PooledClient:
+    """
+    A single websocket client of a connection pool, pulling messages off the pool's queue.
+
+    # Notes
+    The client is supervised: if the connection drops it reconnects with an exponential backoff and
+    runs the setup of the connection (signin and use) again. The requests that were in flight on the
+    dropped connection are either sent again or failed with a `ConnectionDroppedError` depending on
+    the `retry_in_flight` and `max_retries` settings of the pool. The backoff only resets once a
+    request has been answered on the new connection, so a server that accepts the connection and
+    drops it again straight away is retried less and less often. A connection whose setup fails, for
+    instance because the password was changed, is retried the same way so the client stays in the
+    pool and picks the queued requests up again once the database lets it in.
+
+    Attributes:
+        pool: The connection pool that the client belongs to.
+        client_id: The ID of the client to enable mapping.
+        sent: Maps the ids of the requests awaiting a response on the socket to their queue items and send times.
+        last_active: The monotonic time of the last request sent or response received.
+        task: The task running the client.
+        closing: Whether the client has taken a shutdown message off the queue.
+        connected: Whether the client currently has a working connection.
+        reconnects: The number of times the client has reconnected.
+        failures: The number of connections that failed since a request was last answered.
+        metrics: The send, receive and decode latencies of the client.
+    """
+    def __init__(self, pool, client_id: int) -> None:
+        """
+        The constructor for the PooledClient class.
+
+        :param pool: (ConnectionPool) the connection pool that the client belongs to
+        :param client_id: (int) the ID of the client to enable mapping
+        """
+        self.pool = pool
+        self.client_id: int = client_id
+        self.sent: Dict[str, tuple] = {}
+        self.last_active: float = time.monotonic()
+        self.task: asyncio.Task = None
+        self.closing: bool = False
+        self.connected: bool = False
+        self.reconnects: int = 0
+        self.failures: int = 0
+        self.metrics: ClientMetrics = ClientMetrics()
+
+    @property
+    def in_flight(self) -> int:
+        """
+        The number of requests sent on the socket that are awaiting a response.
+
+        :return: (int) the number of requests in flight
+        """
+        return len(self.sent)
+
+    @property
+    def idle_for(self) -> float:
+        """
+        The number of seconds the client has had nothing in flight.
+
+        :return: (float) the idle time of the client, 0 if requests are in flight
+        """
+        if self.in_flight > 0:
+            return 0.0
+        return time.monotonic() - self.last_active
+
+    async def read_responses(self, websocket, in_flight: asyncio.Semaphore) -> None:
+        """
+        Reads responses off the websocket and hands them to the futures waiting on them.
+
+        # Notes
+        Responses are matched to their requests by the RPC `id` so the server is free to answer
+        requests on the same socket in any order.
+
+        :param websocket: (Websocket) the connection that the responses are read from
+        :param in_flight: (asyncio.Semaphore) the in-flight slots of the connection, released per response
+        :return: None
+        """
+        async for raw_response in websocket:
+            received_at = time.perf_counter()
+            response = Response(raw_response, self.pool.codec)
+            self.metrics.decode.observe(time.perf_counter() - received_at)
+            request_id = response.id
+            sent = self.sent.pop(request_id, None)
+            if sent is None:
+                continue
+            self.metrics.recv.observe(received_at - sent[1])
+            self.failures = 0
+            future = self.pool.pending_responses.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(response)
+            self.last_active = time.monotonic()
+            in_flight.release()
+
+    async def send_messages(self, websocket, in_flight: asyncio.Semaphore) -> None:
+        """
+        Takes messages off the pool's queue and sends them until a shutdown message is received.
+
+        :param websocket: (Websocket) the connection that the messages are sent on
+        :param in_flight: (asyncio.Semaphore) the in-flight slots of the connection, taken per message
+        :return: None
+        """
+        pool = self.pool
+        while True:
+            # Only take a message off the queue once there is room for it on this socket
+            await in_flight.acquire()
+            item = await pool.message_queue.get()
+            # a request queued again after its connection dropped carries the number of times it was sent
+            request_id, message, enqueued_at = item[:3]
+            if message == "shutdown":
+                self.closing = True
+                in_flight.release()
+                break
+            if request_id not in pool.pending_responses:
+                # the caller timed out or was cancelled while the message was queued
+                in_flight.release()
+                continue
+            if pool.rate_limiter is not None:
+                # the token is only taken for a request that is sent, so shutdown messages, abandoned
+                # requests and idle senders do not use up the rate
+                try:
+                    await pool.rate_limiter.acquire()
+                except asyncio.CancelledError:
+                    # the connection dropped while the request waited for a token, the request is neither
+                    # queued nor in flight so it has to be handed back or it would never be answered
+                    self.return_unsent(item)
+                    raise
+                if request_id not in pool.pending_responses:
+                    # the caller gave up while the request waited for a token
+                    pool.rate_limiter.release()
+                    in_flight.release()
+                    continue
+            pool.record_queue_wait(time.monotonic() - enqueued_at)
+            started_at = time.perf_counter()
+            try:
+                payload = pool.codec.encode(message)
+            except (TypeError, ValueError) as error:
+                # the variables of the query cannot be encoded so only the query fails, not the connection
+                future = pool.pending_responses.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_exception(error)
+                in_flight.release()
+                continue
+            self.sent[request_id] = (item, started_at)
+            self.last_active = time.monotonic()
+            await websocket.send(payload)
+            self.metrics.send.observe(time.perf_counter() - started_at)
+            pool.metrics.requests += 1
+
+        # Wait for the requests still in flight to be answered before closing the socket
+        for _ in range(pool.max_in_flight):
+            await in_flight.acquire()
+
+    async def serve(self, websocket) -> None:
+        """
+        Runs the send and reader loops on a connection until the client shuts down or the connection drops.
+
+        :param websocket: (Websocket) the connection that has been set up
+        :return: None, raising an error if the connection dropped
+        """
+        in_flight = asyncio.Semaphore(self.pool.max_in_flight)
+        reader = asyncio.create_task(self.read_responses(websocket, in_flight))
+        sender = asyncio.create_task(self.send_messages(websocket, in_flight))
+        try:
+            await asyncio.wait({reader, sender}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            reader.cancel()
+            sender.cancel()
+        if sender.done() and not sender.cancelled() and sender.exception() is not None:
+            raise sender.exception()
+        if reader.done() and not reader.cancelled() and reader.exception() is not None:
+            raise reader.exception()
+        if self.closing is False or self.in_flight > 0:
+            raise ConnectionDroppedError("the server closed the connection")
+
+    def recover_in_flight(self) -> None:
+        """
+        Sends the requests in flight on a dropped connection again or fails them.
+
+        :return: None
+        """
+        pool = self.pool
+        for request_id, (item, _) in self.sent.items():
+            future = pool.pending_responses.get(request_id)
+            if future is None or future.done():
+                pool.pending_responses.pop(request_id, None)
+                continue
+            retries = item[3] if len(item) > 3 else 0
+            if pool.retry_in_flight is True and retries < pool.max_retries and not pool.message_queue.full():
+                # the request has already waited its turn so it goes to the front
+                pool.message_queue.put_nowait(item[:3] + (retries + 1,), Priority.INTERACTIVE)
+            else:
+                pool.pending_responses.pop(request_id, None)
+                pool.metrics.record_error("dropped")
+                future.set_exception(ConnectionDroppedError(
+                    f"connection of client {self.client_id} to {pool.url} dropped with request {request_id} "
+                    f"in flight after {retries} retries"
+                ))
+        self.sent = {}
+
+    def return_unsent(self, item: tuple) -> None:
+        """
+        Puts a request that was taken off the queue but never sent back at the front of the queue.
+
+        :param item: (tuple) the queue item of the request
+        :return: None, failing the request with a `ConnectionDroppedError` if the queue has no room for it
+        """
+        pool = self.pool
+        request_id = item[0]
+        future = pool.pending_responses.get(request_id)
+        if future is None or future.done():
+            pool.pending_responses.pop(request_id, None)
+            return
+        try:
+            # the request has already waited its turn so it goes to the front, it was never sent so it is not a retry
+            pool.message_queue.put_nowait(item, Priority.INTERACTIVE)
+        except asyncio.QueueFull:
+            pool.pending_responses.pop(request_id, None)
+            pool.metrics.record_error("dropped")
+            future.set_exception(ConnectionDroppedError(
+                f"connection of client {self.client_id} to {pool.url} dropped before request {request_id} was sent"
+            ))
+
+    async def back_off(self, error: Exception, kind: str) -> bool:
+        """
+        Recovers the requests of a connection that failed and waits before the next attempt to connect.
+
+        :param error: (Exception) the error the connection failed with
+        :param kind: (str) the kind of error counted in the metrics, "connection" or "setup"
+        :return: (bool) False if the client is shutting down and should not reconnect
+        """
+        pool = self.pool
+        self.connected = False
+        pool.metrics.record_error(kind)
+        self.recover_in_flight()
+        if self.closing is True:
+            return False
+        delay = min(pool.reconnect_backoff * 2 ** self.failures, pool.max_reconnect_backoff)
+        delay *= random.uniform(0.5, 1.0)
+        self.failures += 1
+        if kind == "connection":
+            logger.warning(
+                "client %s lost connection to %s (%s), retrying in %.2fs", self.client_id, pool.url, error, delay
+            )
+        else:
+            logger.error(
+                "client %s failed to set up its connection to %s (%s), retrying in %.2fs",
+                self.client_id, pool.url, error, delay
+            )
+        await asyncio.sleep(delay)
+        self.reconnects += 1
+        pool.metrics.reconnects += 1
+        return True
+
+    async def run(self) -> None:
+        """
+        Connects the client and keeps it connected until it receives a shutdown message.
+
+        :return: None
+        """
+        pool = self.pool
+        try:
+            while True:
+                id = str(uuid4())
+                try:
+                    async with websockets.connect(
+                            pool.url, max_size=pool.max_size, subprotocols=pool.codec.subprotocols
+                    ) as websocket:
+                        pool.codec.verify(websocket)
+                        await setup_connection(
+                            websocket, id, pool.user, pool.password, pool.namespace, pool.database,
+                            token_cache=pool.token_cache, url=pool.url, codec=pool.codec
+                        )
+                        logger.info("client %s connected to %s", self.client_id, pool.url)
+                        self.connected = True
+                        await self.serve(websocket)
+                        return
+                except CONNECTION_ERRORS as error:
+                    if await self.back_off(error, "connection") is False:
+                        return
+                except Exception as error:
+                    # a signin or use that failed, for instance because the password changed or the server
+                    # restarted without the user, is retried too so the pool does not shrink client by client
+                    if await self.back_off(error, "setup") is False:
+                        return
+        finally:
+            self.connected = False
+            pool.remove_client(self)
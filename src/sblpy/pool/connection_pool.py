@@ -6,74 +6,893 @@ The outputs are raw because we need the connections to have as little chance
 of crashing. This means that you need to handle your output yourself.
 """
 import asyncio
-import json
+import time
+from types import TracebackType
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Type, Union
 from uuid import uuid4
 
-import websockets
-
-from sblpy.pool.setup_config import setup_connection
+from sblpy.auth import TokenCache
+from sblpy.bulk import MESSAGE_OVERHEAD, BulkInsertResult, ChunkFailure, chunk_error, chunk_records, insert_query
+from sblpy.cache import QueryCache, TableVersions, analyse, cache_scope
+from sblpy.codec import Codec, get_codec
+from sblpy.errors import ConnectionDroppedError, PoolOverloadedError, QueryTimeoutError
+from sblpy.pool.batcher import QueryBatcher, batchable
+from sblpy.pool.client import PooledClient
+from sblpy.pool.metrics import PoolMetrics, prometheus_text
+from sblpy.pool.parallel_scan import merge_pages
+from sblpy.pool.rate_limiter import TokenBucket
+from sblpy.pool.scheduler import Scheduler
+from sblpy.pool.single_flight import SingleFlight
 from sblpy.query import Query
-
-# Dictionary to map request ids to asyncio.Future objects
-pending_responses = {}
+from sblpy.rpc import RpcCall, RpcMethods
+from sblpy.scan import CURSOR_FIELD, TableScan, bound_query, split_range
+from sblpy.response import Response
 
 # WebSocket client pool size
 NUM_CLIENTS = 5
 
-# The message queue to send the queries to the connection pool
-MESSAGE_QUEUE = asyncio.Queue()
+# The maximum number of requests that a single pooled websocket can have in flight at once
+MAX_IN_FLIGHT = 100
 
+# The weight of the latest sample in the moving average of the queue wait time
+QUEUE_WAIT_SMOOTHING = 0.2
 
-async def websocket_client(
-        client_id,
-        host: str,
-        port: int,
-        user: str,
-        password: str,
-        namespace: str = "default",
-        database: str = "default",
-        max_size: int = 2**20,
-        encrypted: bool = False
-    ) -> None:
+
+class Overflow:
     """
-    Spins up a websocket client in the async runtime as an actor.
+    The admission policies of the connection pool for a query that arrives when the queue is full.
+    """
+    # wait for room in the queue
+    BLOCK: str = "block"
+    # raise a PoolOverloadedError straight away
+    FAIL: str = "fail"
+    # fail the query that has waited the longest with a PoolOverloadedError and queue the new one
+    DROP_OLDEST: str = "drop_oldest"
 
-    :param client_id: The ID of the client to enable mapping
-    :param host: (str) the url of the database to process queries for
-    :param port: (int) the port that the database is listening on
-    :param user: (str) the username to login on
-    :param password: (str) the password to login on
-    :param namespace: (str) the namespace that the connection will stick to
-    :param database: (str) The database that the connection will stick to
-    :param max_size: (int) The maximum size of the connection
-                           (however the pool connections cannot be updated, consider using
-                           individual connections that are to be discarded if you are expecting a large query)
-    :param encrypted: (bool) Whether the connection is encrypted (default is False, please ensure that server
-                             supports encryption with SSL certificates before setting to True)
-    :return: None
+
+class ConnectionPool(RpcMethods):
     """
-    if encrypted is True:
-        url: str = f"wss://{host}:{port}/rpc"
-    else:
-        url: str = f"ws://{host}:{port}/rpc"
-    id = str(uuid4())
-    async with websockets.connect(url, max_size=max_size) as websocket:
-        print(f"Client {client_id} connected to {url}")
-        await setup_connection(websocket, id, user, password, namespace, database)
+    An async pool of websocket clients that share a message queue of queries.
+
+    # Notes
+    Each pool has its own queue, pending responses and client tasks so several pools can run in
+    the same process, for instance one per namespace and database or one per host. The queue is
+    created lazily so the pool can be constructed outside a running event loop.
+
+    The queue is a `Scheduler` rather than a FIFO queue. Queries are served by their `priority` and
+    the queries of a priority are shared fairly between their `tenant` labels, weighted by
+    `tenant_weights`. A query that has waited for `starvation_timeout` seconds is served next
+    whatever its priority.
+
+    Under overload the queue can be bounded with `max_queue_size` and the rate that queries are sent
+    to the database capped with a token bucket of `rate_limit` queries per second. When the queue is
+    full a new query is handled by the `overflow` policy, see `Overflow`.
+
+    If `max_clients` is larger than `min_clients` the pool scales itself. A client is added when
+    the queue depth or the queue wait time stays above its threshold for `scale_up_after` seconds,
+    and a client is retired once it has been idle for `idle_timeout` seconds.
+
+    Clients that lose their connection reconnect with an exponential backoff between
+    `reconnect_backoff` and `max_reconnect_backoff` seconds. The requests that were in flight on the
+    dropped connection are queued again if `retry_in_flight` is set, otherwise they fail with a
+    `ConnectionDroppedError`. A request is queued again at most `max_retries` times, so a request
+    that makes the server drop the connection fails rather than taking the clients down with it.
+    The server may have run a request before the connection dropped, so a retried write can be
+    applied twice. Only retry if your queries are safe to run twice.
+
+    The clients share a `TokenCache` so only the first client to connect signs in with the password,
+    the rest and every reconnect authenticate with the cached token. Pass the same cache to several
+    pools or connections to share the token between them.
+
+    With `protocol="cbor"` the clients send and receive CBOR in binary frames rather than JSON text,
+    and the responses hold python types for record IDs, datetimes and the like, see `sblpy.cbor`.
+
+    With a `query_cache`, read only queries are answered from the cache without being queued, and
+    the queries that write to a table drop the cached queries reading it, see `sblpy.cache`.
+
+    With `coalesce_reads`, a read only query that is identical to one already in flight, the same
+    query and variables, is not sent again. It waits on the request in flight and gets the same
+    response, so a burst of the same hot query costs one round trip.
+
+    With a `batch_window`, single statement queries are collected for up to that many seconds, or
+    until there are `batch_max_statements` of them or `batch_max_bytes` of SQL and variables, and sent
+    as one multi-statement query, see `QueryBatcher`. Each caller still gets a response of its own.
+
+    `select`, `create`, `insert`, `update`, `merge`, `patch` and `delete` queue the RPC methods of
+    the same name that work on a table or record ID without a SurrealQL query, see `sblpy.rpc`. They
+    return the raw `Response` like `execute`, and are neither cached, coalesced nor batched.
+
+    Attributes:
+        url: The URL of the database to process queries for.
+        user: The username to login on.
+        password: The password to login on.
+        namespace: The namespace that the connections will stick to.
+        database: The database that the connections will stick to.
+        number_of_clients: The number of clients the connection pool starts with.
+        min_clients: The number of clients the pool will not scale below.
+        max_clients: The number of clients the pool will not scale above.
+        max_size: The maximum size of each connection.
+        max_in_flight: The maximum number of requests awaiting a response on each client.
+        scale_up_queue_depth: The queue depth above which the pool is considered busy.
+        scale_up_wait: The queue wait time in seconds above which the pool is considered busy.
+        scale_up_after: The number of seconds the pool has to stay busy before a client is added.
+        idle_timeout: The number of seconds a client has to be idle before it is retired.
+        scale_interval: The number of seconds between checks of the autoscaler.
+        retry_in_flight: Whether requests in flight on a dropped connection are sent again.
+        max_retries: The number of times a request in flight on a dropped connection is sent again.
+        reconnect_backoff: The number of seconds waited before the first reconnect attempt.
+        max_reconnect_backoff: The maximum number of seconds waited between reconnect attempts.
+        tenant_weights: Maps tenant labels to their share of a priority, tenants not in the map have a weight of 1.
+        starvation_timeout: The seconds a query can wait before it is served ahead of higher priorities.
+        max_queue_size: The maximum number of queries that can wait in the queue, 0 for no limit.
+        overflow: The admission policy for a query that arrives when the queue is full.
+        rate_limiter: The token bucket limiting the rate queries are sent, None if there is no limit.
+        token_cache: The cache of auth tokens the clients authenticate with instead of signing in.
+        codec: Encodes and decodes the messages of the protocol of the clients.
+        query_cache: The cache of the responses of read only queries, None to send every query.
+        coalesce_reads: Whether identical read only queries in flight at the same time share one request.
+        batcher: Joins small queries into multi-statement queries, None if queries are sent one at a time.
+        queue_wait: The moving average of the time in seconds messages wait in the queue.
+        metrics: The queue wait histogram and the request, reconnect and error counters of the pool.
+        pending_responses: Maps request ids to the futures waiting on them.
+        clients: Maps client ids to the clients of the pool.
+    """
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            user: str,
+            password: str,
+            namespace: str = "default",
+            database: str = "default",
+            number_of_clients: int = NUM_CLIENTS,
+            max_size: int = 2**20,
+            encrypted: bool = False,
+            max_in_flight: int = MAX_IN_FLIGHT,
+            min_clients: Optional[int] = None,
+            max_clients: Optional[int] = None,
+            scale_up_queue_depth: int = 10,
+            scale_up_wait: float = 0.05,
+            scale_up_after: float = 0.5,
+            idle_timeout: float = 60.0,
+            scale_interval: float = 0.1,
+            retry_in_flight: bool = False,
+            reconnect_backoff: float = 0.1,
+            max_reconnect_backoff: float = 10.0,
+            tenant_weights: Optional[Dict[str, float]] = None,
+            starvation_timeout: float = 1.0,
+            max_queue_size: int = 0,
+            overflow: str = Overflow.BLOCK,
+            rate_limit: Optional[float] = None,
+            rate_burst: Optional[int] = None,
+            token_cache: Optional[TokenCache] = None,
+            protocol: Union[str, Codec] = "json",
+            query_cache: Optional[QueryCache] = None,
+            coalesce_reads: bool = False,
+            batch_window: Optional[float] = None,
+            batch_max_statements: int = 100,
+            batch_max_bytes: Optional[int] = None,
+            max_retries: int = 2
+    ) -> None:
+        """
+        The constructor for the ConnectionPool class.
+
+        :param host: (str) the url of the database to process queries for
+        :param port: (int) the port that the database is listening on
+        :param user: (str) the username to login on
+        :param password: (str) the password to login on
+        :param namespace: (str) the namespace that the connections will stick to
+        :param database: (str) The database that the connections will stick to
+        :param number_of_clients: (int) the number of clients the connection pool starts with
+        :param max_size: (int) The maximum size of the connection
+                               (however the pool connections cannot be updated, consider using
+                               individual connections that are to be discarded if you are expecting a large query)
+        :param encrypted: (bool) Whether the connection is encrypted (default is False, please ensure that server
+                                 supports encryption with SSL certificates before setting to True)
+        :param max_in_flight: (int) the maximum number of requests awaiting a response on each client
+        :param min_clients: (Optional[int]) the number of clients the pool will not scale below
+                                            (defaults to the number of clients)
+        :param max_clients: (Optional[int]) the number of clients the pool will not scale above
+                                            (defaults to the number of clients)
+        :param scale_up_queue_depth: (int) the queue depth above which the pool is considered busy
+        :param scale_up_wait: (float) the queue wait time in seconds above which the pool is considered busy
+        :param scale_up_after: (float) the seconds the pool has to stay busy before a client is added
+        :param idle_timeout: (float) the seconds a client has to be idle before it is retired
+        :param scale_interval: (float) the seconds between checks of the autoscaler
+        :param retry_in_flight: (bool) whether requests in flight on a dropped connection are sent again
+                                       (only enable if your queries are safe to run twice)
+        :param reconnect_backoff: (float) the seconds waited before the first reconnect attempt
+        :param max_reconnect_backoff: (float) the maximum seconds waited between reconnect attempts
+        :param tenant_weights: (Optional[Dict[str, float]]) maps tenant labels to their share of a priority
+        :param starvation_timeout: (float) the seconds a query can wait before it skips ahead of higher priorities
+        :param max_queue_size: (int) the maximum number of queries that can wait in the queue, 0 for no limit
+        :param overflow: (str) the admission policy when the queue is full, "block", "fail" or "drop_oldest"
+        :param rate_limit: (Optional[float]) the maximum number of queries sent to the database per second
+        :param rate_burst: (Optional[int]) the number of queries that can be sent in a burst above the rate limit
+                                           (defaults to one second of queries)
+        :param token_cache: (Optional[TokenCache]) the cache of auth tokens the clients authenticate with
+                                                  (defaults to a cache of the pool's own)
+        :param protocol: (Union[str, Codec]) the protocol of the messages, "json", "cbor" or a codec
+        :param query_cache: (Optional[QueryCache]) the cache of the responses of read only queries
+        :param coalesce_reads: (bool) whether identical read only queries in flight at the same time share one request
+        :param batch_window: (Optional[float]) the seconds small queries are collected for before being sent as
+                                               one multi-statement query, None to send each query on its own
+        :param batch_max_statements: (int) the maximum number of queries in a batch
+        :param batch_max_bytes: (Optional[int]) the rough maximum size of a batch (defaults to half of `max_size`)
+        :param max_retries: (int) the number of times a request in flight on a dropped connection is sent again
+                                  before it fails with a ConnectionDroppedError, if `retry_in_flight` is set
+        """
+        if encrypted is True:
+            self.url: str = f"wss://{host}:{port}/rpc"
+        else:
+            self.url: str = f"ws://{host}:{port}/rpc"
+        self.user: str = user
+        self.password: str = password
+        self.namespace: str = namespace
+        self.database: str = database
+        self.min_clients: int = number_of_clients if min_clients is None else min_clients
+        self.max_clients: int = number_of_clients if max_clients is None else max_clients
+        if self.min_clients > self.max_clients:
+            raise ValueError(f"min_clients {self.min_clients} is larger than max_clients {self.max_clients}")
+        self.number_of_clients: int = min(max(number_of_clients, self.min_clients), self.max_clients)
+        self.max_size: int = max_size
+        self.max_in_flight: int = max_in_flight
+        self.scale_up_queue_depth: int = scale_up_queue_depth
+        self.scale_up_wait: float = scale_up_wait
+        self.scale_up_after: float = scale_up_after
+        self.idle_timeout: float = idle_timeout
+        self.scale_interval: float = scale_interval
+        self.retry_in_flight: bool = retry_in_flight
+        self.max_retries: int = max_retries
+        self.reconnect_backoff: float = reconnect_backoff
+        self.max_reconnect_backoff: float = max_reconnect_backoff
+        self.tenant_weights: Dict[str, float] = tenant_weights if tenant_weights is not None else {}
+        self.starvation_timeout: float = starvation_timeout
+        if overflow not in (Overflow.BLOCK, Overflow.FAIL, Overflow.DROP_OLDEST):
+            raise ValueError(f"overflow policy {overflow} is not one of 'block', 'fail' or 'drop_oldest'")
+        self.max_queue_size: int = max_queue_size
+        self.overflow: str = overflow
+        self.rate_limiter: Optional[TokenBucket] = None
+        if rate_limit is not None:
+            self.rate_limiter = TokenBucket(rate_limit, rate_burst)
+        self.token_cache: TokenCache = token_cache if token_cache is not None else TokenCache()
+        self.codec: Codec = get_codec(protocol)
+        self.query_cache: Optional[QueryCache] = query_cache
+        self._cache_scope: str = cache_scope(self.url, namespace, database)
+        # the writes seen through the pool, so a read started before a write is neither cached nor joined after it
+        self._table_versions: TableVersions = query_cache.versions if query_cache is not None else TableVersions()
+        self.coalesce_reads: bool = coalesce_reads
+        self.batcher: Optional[QueryBatcher] = None
+        if batch_window is not None:
+            self.batcher = QueryBatcher(
+                self._send, self.codec, batch_window, batch_max_statements,
+                batch_max_bytes if batch_max_bytes is not None else max_size // 2
+            )
+        self.queue_wait: float = 0.0
+        self.metrics: PoolMetrics = PoolMetrics()
+        self.pending_responses: Dict[str, asyncio.Future] = {}
+        self.clients: Dict[int, PooledClient] = {}
+        self._message_queue: Optional[Scheduler] = None
+        self._next_client_id: int = 0
+        self._retiring: int = 0
+        self._autoscaler: Optional[asyncio.Task] = None
+        self._single_flight: SingleFlight = SingleFlight()
+
+    @property
+    def message_queue(self) -> Scheduler:
+        """
+        The queue that the queries are sent to the clients on, created inside the running loop.
+
+        :return: (Scheduler) the message queue of the pool
+        """
+        if self._message_queue is None:
+            self._message_queue = Scheduler(self.tenant_weights, self.starvation_timeout, self.max_queue_size)
+        return self._message_queue
+
+    @property
+    def active_clients(self) -> int:
+        """
+        The number of clients that have not been told to shut down.
+
+        :return: (int) the number of clients serving queries
+        """
+        return len(self.clients) - self._retiring
+
+    async def start(self) -> None:
+        """
+        Spins up the clients of the pool, and the autoscaler if enabled, in the background.
+
+        :return: None
+        """
+        for _ in range(self.number_of_clients):
+            self.add_client()
+        if self.max_clients > self.min_clients:
+            self._autoscaler = asyncio.create_task(self.autoscale())
+
+    def add_client(self) -> PooledClient:
+        """
+        Spins up a new client for the pool in the background.
+
+        :return: (PooledClient) the client that was added
+        """
+        client = PooledClient(self, self._next_client_id)
+        self._next_client_id += 1
+        self.clients[client.client_id] = client
+        client.task = asyncio.create_task(client.run())
+        return client
+
+    def remove_client(self, client: PooledClient) -> None:
+        """
+        Removes a client that has stopped from the pool.
+
+        :param client: (PooledClient) the client that has stopped
+        :return: None
+        """
+        if self.clients.pop(client.client_id, None) is None:
+            return
+        if client.closing is True and self._retiring > 0:
+            self._retiring -= 1
+
+    def record_queue_wait(self, wait: float) -> None:
+        """
+        Adds the time a message waited in the queue to the moving average of the queue wait.
+
+        :param wait: (float) the seconds that the message waited in the queue
+        :return: None
+        """
+        self.queue_wait += QUEUE_WAIT_SMOOTHING * (wait - self.queue_wait)
+        self.metrics.queue_wait.observe(wait)
+
+    async def retire_client(self) -> None:
+        """
+        Tells one of the clients of the pool to shut down once its in-flight requests are answered.
+
+        :return: None
+        """
+        self._retiring += 1
+        await self.message_queue.put((None, "shutdown", time.monotonic()))
+
+    async def autoscale(self) -> None:
+        """
+        Adds clients while the pool stays busy and retires clients that stay idle.
+
+        :return: None
+        """
+        busy_since: Optional[float] = None
         while True:
-            # Get the message to send to the external server
-            request_id, message = await MESSAGE_QUEUE.get()
-            if message == "shutdown":
-                break
+            await asyncio.sleep(self.scale_interval)
+            now = time.monotonic()
+            depth = self.message_queue.qsize()
+            busy = depth > self.scale_up_queue_depth or (depth > 0 and self.queue_wait > self.scale_up_wait)
+            if busy is True:
+                if busy_since is None:
+                    busy_since = now
+                if now - busy_since >= self.scale_up_after and self.active_clients < self.max_clients:
+                    self.add_client()
+                    busy_since = None
+                continue
+            busy_since = None
+            if depth == 0 and self.active_clients > self.min_clients:
+                idle_clients = [
+                    client for client in self.clients.values() if client.idle_for >= self.idle_timeout
+                ]
+                if len(idle_clients) > self._retiring:
+                    await self.retire_client()
+
+    async def wait_closed(self) -> None:
+        """
+        Waits for all the clients of the pool to finish.
+
+        :return: None
+        """
+        while len(self.clients) > 0:
+            await asyncio.gather(
+                *[client.task for client in list(self.clients.values())], return_exceptions=True
+            )
+
+    async def close(self) -> None:
+        """
+        Sends kill messages to all clients and waits for them to shut down.
+
+        # Notes
+        Clients that are waiting to reconnect are cancelled as they cannot take a kill message. The
+        queries left queued once every client has stopped, or in flight on a cancelled client, fail
+        with a `ConnectionDroppedError` so their callers do not wait forever.
+
+        :return: None
+        """
+        if self._autoscaler is not None:
+            self._autoscaler.cancel()
+            self._autoscaler = None
+        if self.batcher is not None:
+            # the open batches are queued before the kill messages so they are still answered
+            await asyncio.gather(*self.batcher.flush(), return_exceptions=True)
+        connected = [client for client in self.clients.values() if client.connected is True]
+        for client in list(self.clients.values()):
+            if client.connected is False:
+                client.task.cancel()
+        for _ in range(len(connected) - self._retiring):
+            await self.retire_client()
+        await self.wait_closed()
+        for request_id, future in list(self.pending_responses.items()):
+            self.message_queue.remove(request_id)
+            if not future.done():
+                self.metrics.record_error("dropped")
+                future.set_exception(ConnectionDroppedError(
+                    f"connection pool to {self.url} closed before request {request_id} was answered"
+                ))
+        self.pending_responses.clear()
+
+    async def execute(
+            self,
+            query: Query,
+            timeout: Optional[float] = None,
+            server_timeout: bool = False
+    ) -> Response:
+        """
+        Sends a query to the pool to be executed on the database.
+
+        # Notes
+        If the caller times out or is cancelled while the query is still queued, the query is removed
+        from the queue. If the query is already in flight its response is discarded when it arrives.
+
+        With `coalesce_reads` the callers of an identical read only query share the request and its
+        response, and the request is only withdrawn once every one of them has given up. A query sent
+        after a write to one of its tables completed through the pool never shares a request sent
+        before the write.
+
+        :param query: (Query) the query to be executed
+        :param timeout: (Optional[float]) the seconds to wait for the response before raising a QueryTimeoutError
+        :param server_timeout: (bool) whether to also add a SurrealQL `TIMEOUT` of the same length to the query
+                                      so the database stops working on it (only for a single statement)
+        :return: (Response) the raw response from the database, its result is decoded when it is read
+        """
+        if self.query_cache is not None:
+            frame = self.query_cache.get(query.sql, query.vars, self._cache_scope)
+            if frame is not None:
+                return Response(frame, self.codec)
+        if self.coalesce_reads is False or QueryCache.cacheable(query.sql) is False:
+            return await self._execute(query, timeout, server_timeout)
+
+        # the priority and tenant are left out so a shared request keeps those of the caller that sent it, and
+        # the version of the tables is in so a read sent after a write completed never joins one sent before it
+        key = QueryCache.key(query.sql, query.vars) + (
+            timeout if server_timeout is True else None, self._table_versions.version(analyse(query.sql)[0], self._cache_scope)
+        )
+        if key in self._single_flight:
+            self.metrics.coalesced += 1
+        try:
+            return await self._single_flight.run(
+                key, lambda: self._execute(query, timeout if server_timeout is True else None, server_timeout), timeout
+            )
+        except QueryTimeoutError:
+            raise
+        except asyncio.TimeoutError:
+            self.metrics.record_error("timeout")
+            raise QueryTimeoutError(f"query got no response within {timeout}s") from None
+
+    async def _execute(self, query: Query, timeout: Optional[float], server_timeout: bool) -> Response:
+        """
+        Sends a query on its own or in a batch and keeps the query cache up to date with it.
+
+        :param query: (Query) the query to be executed
+        :param timeout: (Optional[float]) the seconds to wait for the response before raising a QueryTimeoutError
+        :param server_timeout: (bool) whether to also add a SurrealQL `TIMEOUT` of the same length to the query
+        :return: (Response) the raw response from the database
+        """
+        generation = self.query_cache.generation(query.sql, self._cache_scope) if self.query_cache is not None else None
+        if self.batcher is not None and server_timeout is False and batchable(query.sql) is True:
+            try:
+                response = await self.batcher.submit(query, timeout)
+            except QueryTimeoutError:
+                raise
+            except asyncio.TimeoutError:
+                self.metrics.record_error("timeout")
+                raise QueryTimeoutError(f"query {query.id} got no response within {timeout}s") from None
+        else:
+            response = await self._send(query, timeout, server_timeout)
+        if self.query_cache is not None:
+            self.query_cache.observe(query.sql, self._cache_scope)
+            if self.query_cache.cacheable(query.sql) and response.ok is True:
+                self.query_cache.put(query.sql, query.vars, response.raw, generation, self._cache_scope)
+        else:
+            self._table_versions.observe(query.sql, self._cache_scope)
+        return response
+
+    async def _send(self, query: Query, timeout: Optional[float] = None, server_timeout: bool = False) -> Response:
+        """
+        Queues a query as a request of its own and waits for its response.
+
+        :param query: (Query) the query to be executed
+        :param timeout: (Optional[float]) the seconds to wait for the response before raising a QueryTimeoutError
+        :param server_timeout: (bool) whether to also add a SurrealQL `TIMEOUT` of the same length to the query
+        :return: (Response) the raw response from the database
+        """
+        if server_timeout is True and timeout is not None:
+            query = query.with_timeout(timeout)
+        request_id = str(uuid4())
+        response_future = asyncio.get_running_loop().create_future()
+        self.pending_responses[request_id] = response_future
+
+        # The RPC id is what the reader loop uses to route the response back to this future
+        message = query.query_params
+        message["id"] = request_id
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        try:
+            # Send the request to the WebSocket client via the message queue
+            admission = self.admit((request_id, message, time.monotonic()), query)
+            if deadline is None:
+                await admission
+            else:
+                await asyncio.wait_for(admission, deadline - loop.time())
+
+            # Wait for the WebSocket client to get a response and set the future's result
+            if deadline is None:
+                response = await response_future
+            else:
+                response = await asyncio.wait_for(response_future, deadline - loop.time())
+        except asyncio.TimeoutError:
+            self.metrics.record_error("timeout")
+            raise QueryTimeoutError(f"query {request_id} got no response within {timeout}s") from None
+        finally:
+            if self.pending_responses.pop(request_id, None) is not None:
+                self.message_queue.remove(request_id)
+        return response
+
+    async def call(self, rpc: RpcCall, timeout: Optional[float] = None) -> Response:
+        """
+        Queues a direct RPC method to be called on the database.
+
+        :param rpc: (RpcCall) the method and its parameters, with the priority and tenant it is queued under
+        :param timeout: (Optional[float]) the seconds to wait for the response before raising a QueryTimeoutError
+        :return: (Response) the raw response from the database, its result is decoded when it is read
+        """
+        try:
+            return await self._send(rpc.for_protocol(self.codec.protocol), timeout)
+        finally:
+            if rpc.writes is True:
+                if self.query_cache is not None:
+                    self.query_cache.invalidate([rpc.table], self._cache_scope)
+                else:
+                    self._table_versions.bump([rpc.table], self._cache_scope)
+
+    async def query_stream(
+            self,
+            query: Query,
+            timeout: Optional[float] = None,
+            server_timeout: bool = False
+    ) -> AsyncIterator[Any]:
+        """
+        Executes a query on the pool, yielding the records of the first statement as they are decoded.
+
+        # Notes
+        The response still has to fit in the `max_size` of the clients, but its records are decoded
+        one at a time as they are iterated over rather than all at once, so they are never all held
+        at the same time. Use `AsyncSurrealConnection.query_stream` for a response too large for the pool.
+
+        :param query: (Query) the query to be executed
+        :param timeout: (Optional[float]) the seconds to wait for the response before raising a QueryTimeoutError
+        :param server_timeout: (bool) whether to also add a SurrealQL `TIMEOUT` of the same length to the query
+        :return: (AsyncIterator[Any]) the records of the first statement
+        """
+        response = await self.execute(query, timeout, server_timeout)
+        for record in response.records():
+            yield record
+
+    async def stream(
+            self,
+            table: str,
+            batch_size: int = 1000,
+            where: Optional[str] = None,
+            order_by: Optional[str] = None,
+            vars: Optional[Dict[str, Any]] = None,
+            timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields every record of a table, selecting them a page at a time with keyset pagination.
+
+        # Notes
+        The query of the next page is queued while the records of the current page are yielded, so
+        the database selects the next page while the caller handles the current one. See `TableScan`.
+
+        :param table: (str) the name of the table to stream
+        :param batch_size: (int) the number of records selected in each page
+        :param where: (Optional[str]) the SurrealQL condition the records have to meet, such as "age > $age"
+        :param order_by: (Optional[str]) the field to order the records by, optionally followed by ASC or DESC
+        :param vars: (Optional[Dict[str, Any]]) the variables used in the condition
+        :param timeout: (Optional[float]) the seconds to wait for each page before raising a QueryTimeoutError
+        :return: (AsyncIterator[Dict[str, Any]]) the records of the table
+        """
+        pages = self.pages(TableScan(table, batch_size, where, order_by, vars), timeout)
+        try:
+            async for records in pages:
+                for record in records:
+                    yield record
+        finally:
+            # cancel the page it prefetched now if the caller stopped early
+            await pages.aclose()
 
-            await websocket.send(json.dumps(message, ensure_ascii=False))
+    async def pages(self, scan: TableScan, timeout: Optional[float] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yields the pages of a table scan, queueing the query of the next page before yielding the current one.
 
-            # Await the response from the WebSocket server
-            response = await websocket.recv()
+        :param scan: (TableScan) the scan to read the pages of
+        :param timeout: (Optional[float]) the seconds to wait for each page before raising a QueryTimeoutError
+        :return: (AsyncIterator[List[Dict[str, Any]]]) the records of each page
+        """
+        page = asyncio.ensure_future(self.execute(scan.query(), timeout))
+        try:
+            while page is not None:
+                response = await page
+                page = None
+                records: List[Dict[str, Any]] = scan.advance(list(response.records()))
+                if scan.done is False:
+                    page = asyncio.ensure_future(self.execute(scan.query(), timeout))
+                if len(records) > 0:
+                    yield records
+        finally:
+            if page is not None:
+                page.cancel()
+                await asyncio.gather(page, return_exceptions=True)
 
-            # Set the result of the future so the request handler can continue
-            pending_responses[request_id].set_result(response)
-            del pending_responses[request_id]
+    async def scan_ranges(
+            self,
+            table: str,
+            parts: int,
+            field: Optional[str] = None,
+            where: Optional[str] = None,
+            vars: Optional[Dict[str, Any]] = None,
+            timeout: Optional[float] = None
+    ) -> List[Tuple[Any, Any]]:
+        """
+        Splits a table into ranges of equal width of a numeric key from its lowest and highest key.
+
+        :param table: (str) the name of the table to split
+        :param parts: (int) the number of ranges
+        :param field: (Optional[str]) the numeric field to split by, None for the id part of numeric record IDs
+        :param where: (Optional[str]) the SurrealQL condition the records have to meet
+        :param vars: (Optional[Dict[str, Any]]) the variables used in the condition
+        :param timeout: (Optional[float]) the seconds to wait for each bound before raising a QueryTimeoutError
+        :return: (List[Tuple[Any, Any]]) the start and end of each range in ascending order
+        """
+        bounds = []
+        for descending in (False, True):
+            response = await self.execute(bound_query(table, field, where, vars, descending), timeout)
+            records = list(response.records())
+            bounds.append(records[0].get(CURSOR_FIELD) if len(records) > 0 else None)
+        low, high = bounds
+        if low is None or high is None:
+            return [(None, None)]
+        for bound in (low, high):
+            if isinstance(bound, bool) or not isinstance(bound, (int, float)):
+                raise ValueError(
+                    f"the key {bound!r} of table {table} is not a number, pass the ranges to scan explicitly"
+                )
+        return split_range(low, high, parts)
+
+    async def parallel_scan(
+            self,
+            table: str,
+            ranges: Union[int, Sequence[Tuple[Any, Any]], None] = None,
+            field: Optional[str] = None,
+            batch_size: int = 1000,
+            where: Optional[str] = None,
+            vars: Optional[Dict[str, Any]] = None,
+            concurrency: Optional[int] = None,
+            ordered: bool = False,
+            timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields every record of a table, scanning ranges of the table side by side across the clients of the pool.
+
+        # Notes
+        Each range is a keyset paginated scan like `stream`, limited to the keys from the start of the
+        range up to its end. The key is `field`, or the id part of the record ID if `field` is None.
+        The ranges have to cover the table without overlapping, for instance
+        `[(None, 1000), (1000, 2000), (2000, None)]` where None is no bound. Pass a number of ranges
+        instead to split a numeric key into ranges of equal width, see `scan_ranges`. Records are
+        yielded as their pages arrive, or in the order of the key if `ordered` is set. See `merge_pages`.
+
+        :param table: (str) the name of the table to scan
+        :param ranges: (Union[int, Sequence[Tuple[Any, Any]], None]) the start and end of each range, or
+                       the number of ranges to split a numeric key into (defaults to `concurrency`)
+        :param field: (Optional[str]) the field the table is split by, None for the id part of the record ID
+        :param batch_size: (int) the number of records selected in each page
+        :param where: (Optional[str]) the SurrealQL condition the records have to meet, such as "age > $age"
+        :param vars: (Optional[Dict[str, Any]]) the variables used in the condition
+        :param concurrency: (Optional[int]) the maximum number of ranges scanned at once (defaults to max_clients)
+        :param ordered: (bool) whether the records are yielded in the order of the key
+        :param timeout: (Optional[float]) the seconds to wait for each page before raising a QueryTimeoutError
+        :return: (AsyncIterator[Dict[str, Any]]) the records of the table
+        """
+        if concurrency is None:
+            concurrency = self.max_clients
+        if ranges is None:
+            ranges = concurrency
+        if isinstance(ranges, int):
+            ranges = await self.scan_ranges(table, ranges, field, where, vars, timeout)
+        scans = [
+            TableScan(table, batch_size, where, field, vars, start=start, end=end) for start, end in ranges
+        ]
+        sources = [lambda scan=scan: self.pages(scan, timeout) for scan in scans]
+        pages = merge_pages(sources, concurrency, ordered)
+        try:
+            async for records in pages:
+                for record in records:
+                    yield record
+        finally:
+            # cancel the scans of the ranges now if the caller stopped early
+            await pages.aclose()
+
+    async def bulk_insert(
+            self,
+            table: str,
+            records: Iterable[Dict[str, Any]],
+            chunk_size: int = 1000,
+            concurrency: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            ignore: bool = False,
+            timeout: Optional[float] = None
+    ) -> BulkInsertResult:
+        """
+        Inserts records into a table a chunk at a time, with several chunks in flight across the clients.
+
+        # Notes
+        Each chunk is one `INSERT` statement with its records sent as a variable, holding at most
+        `chunk_size` records and about `max_bytes` of them encoded, so it stays under the `max_size`
+        of the connections. The records are read as chunks are sent, so a generator can feed a load
+        larger than memory. Chunks are queued at the BATCH priority so interactive queries go first.
+
+        A chunk that fails does not stop the others, it is reported in the result with its records
+        so it can be sent again. Chunks are not transactions across each other, so a failed load
+        leaves the chunks that succeeded in the table.
+
+        :param table: (str) the name of the table to insert the records into
+        :param records: (Iterable[Dict[str, Any]]) the records to insert, with an `id` to choose their record IDs
+        :param chunk_size: (int) the maximum number of records in a chunk
+        :param concurrency: (Optional[int]) the maximum number of chunks in flight at once (defaults to max_clients)
+        :param max_bytes: (Optional[int]) the maximum encoded size of the records of a chunk
+                                          (defaults to half of `max_size`)
+        :param ignore: (bool) whether records with an ID that already exists are skipped rather than failing their chunk
+        :param timeout: (Optional[float]) the seconds to wait for each chunk before counting it as failed
+        :return: (BulkInsertResult) the number of chunks and records inserted and the chunks that failed
+        """
+        if concurrency is None:
+            concurrency = self.max_clients
+        if concurrency < 1:
+            raise ValueError(f"concurrency has to be at least 1, not {concurrency}")
+        if max_bytes is None:
+            max_bytes = self.max_size // 2
+        max_bytes = min(max_bytes, self.max_size - MESSAGE_OVERHEAD)
+        # checks the table name before any record is read
+        insert_query(table, [], ignore)
+        outcome = BulkInsertResult()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def insert(index: int, offset: int, chunk: List[Dict[str, Any]]) -> None:
+            try:
+                response = await self.execute(insert_query(table, chunk, ignore), timeout)
+                error = chunk_error(response)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exception:
+                error = exception
+            finally:
+                slots.release()
+            if error is None:
+                outcome.inserted += len(chunk)
+            else:
+                outcome.failures.append(ChunkFailure(index, offset, chunk, error))
+
+        # finished chunks drop out of the set so a long load does not hold on to them
+        tasks = set()
+        try:
+            for index, (offset, chunk) in enumerate(chunk_records(records, chunk_size, max_bytes, self.codec.encode)):
+                await slots.acquire()
+                outcome.chunks += 1
+                task = asyncio.ensure_future(insert(index, offset, chunk))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return outcome
+
+    async def admit(self, item: tuple, query: Query) -> None:
+        """
+        Puts a message into the queue following the overflow policy of the pool.
+
+        :param item: (tuple) the request ID, message and enqueue time to queue
+        :param query: (Query) the query of the message, used for its priority and tenant
+        :return: None
+        """
+        queue = self.message_queue
+        if self.overflow == Overflow.BLOCK or not queue.full():
+            await queue.put(item, query.priority, query.tenant)
+            return
+        self.metrics.record_error("overloaded")
+        if self.overflow == Overflow.FAIL:
+            raise PoolOverloadedError(f"the queue of the pool to {self.url} is full with {queue.qsize()} queries")
+        dropped = queue.drop_oldest()
+        if dropped is not None:
+            future = self.pending_responses.pop(dropped[0], None)
+            if future is not None and not future.done():
+                future.set_exception(PoolOverloadedError(
+                    f"query {dropped[0]} was dropped from the full queue of the pool to {self.url}"
+                ))
+        queue.put_nowait(item, query.priority, query.tenant)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Takes a snapshot of the metrics of the pool.
+
+        :return: (Dict[str, Any]) the queue depth and wait, the request, reconnect and error counters,
+                                  the in-flight count and latency histograms of each client, and the
+                                  counters of the query cache and the batcher if there are any
+        """
+        stats = {
+            "url": self.url,
+            "namespace": self.namespace,
+            "database": self.database,
+            "queue_depth": self.message_queue.qsize(),
+            "queue_wait": self.metrics.queue_wait.snapshot(),
+            "requests": self.metrics.requests,
+            "coalesced": self.metrics.coalesced,
+            "reconnects": self.metrics.reconnects,
+            "errors": dict(self.metrics.errors),
+            "clients": {
+                client_id: {
+                    "connected": client.connected,
+                    "in_flight": client.in_flight,
+                    "reconnects": client.reconnects,
+                    "send": client.metrics.send.snapshot(),
+                    "recv": client.metrics.recv.snapshot(),
+                    "decode": client.metrics.decode.snapshot()
+                }
+                for client_id, client in self.clients.items()
+            }
+        }
+        if self.query_cache is not None:
+            stats["cache"] = self.query_cache.stats()
+        if self.batcher is not None:
+            stats["batches"] = self.batcher.batches
+            stats["batched"] = self.batcher.batched
+        return stats
+
+    def prometheus(self, prefix: str = "sblpy_pool") -> str:
+        """
+        Exports the metrics of the pool in the Prometheus text exposition format.
+
+        :param prefix: (str) the prefix of the metric names
+        :return: (str) the metrics of the pool
+        """
+        histograms = {
+            "queue_wait": self.metrics.queue_wait,
+            "clients": {client_id: client.metrics for client_id, client in self.clients.items()}
+        }
+        return prometheus_text(self.stats(), histograms, prefix)
+
+    async def __aenter__(self) -> "ConnectionPool":
+        """Starts the clients of the pool when entering the context manager."""
+        await self.start()
+        return self
+
+    async def __aexit__(
+            self,
+            exc_type: Optional[Type[BaseException]],
+            exc_value: Optional[BaseException],
+            traceback: Optional[TracebackType]
+    ) -> None:
+        """Shuts down the clients of the pool when exiting the context manager."""
+        await self.close()
+
+
+# The pool used by the module level functions below, registered by `client_pool`
+DEFAULT_POOL: Optional[ConnectionPool] = None
 
 
 async def client_pool(
@@ -85,10 +904,14 @@ async def client_pool(
         database: str = "default",
         number_of_clients: int = 5,
         max_size: int = 2**20,
-        encrypted: bool = False
+        encrypted: bool = False,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        query_cache: Optional[QueryCache] = None,
+        coalesce_reads: bool = False,
+        batch_window: Optional[float] = None
     ) -> None:
     """
-    Spins up an async connection pool.
+    Spins up the default async connection pool used by `execute_pooled_query`.
 
     # Notes
     To be run in the background using the following:
@@ -101,7 +924,8 @@ async def client_pool(
         number_of_clients=NUM_CLIENTS
     ))
     ```
-    Do not await on this
+    Do not await on this. If you need more than one pool in the same process use the
+    `ConnectionPool` class directly.
 
     :param host: (str) the url of the database to process queries for
     :param port: (int) the port that the database is listening on
@@ -115,42 +939,58 @@ async def client_pool(
                            individual connections that are to be discarded if you are expecting a large query)
     :param encrypted: (bool) Whether the connection is encrypted (default is False, please ensure that server
                              supports encryption with SSL certificates before setting to True)
+    :param max_in_flight: (int) the maximum number of requests awaiting a response on each client
+    :param query_cache: (Optional[QueryCache]) the cache of the responses of read only queries
+    :param coalesce_reads: (bool) whether identical read only queries in flight at the same time share one request
+    :param batch_window: (Optional[float]) the seconds small queries are collected for before being sent as
+                                           one multi-statement query, None to send each query on its own
     :return: None
     """
-    tasks = []
-    for i in range(number_of_clients):
-        tasks.append(asyncio.create_task(websocket_client(
-            i, host, port, user, password, namespace, database, max_size, encrypted
-        )))
-    await asyncio.gather(*tasks)
+    global DEFAULT_POOL
+    pool = ConnectionPool(
+        host, port, user, password, namespace, database, number_of_clients, max_size, encrypted, max_in_flight,
+        query_cache=query_cache, coalesce_reads=coalesce_reads, batch_window=batch_window
+    )
+    DEFAULT_POOL = pool
+    await pool.start()
+    await pool.wait_closed()
 
 
 async def shutdown_pool(number_of_clients: int = 5) -> None:
     """
-    Sends kill messages to all clients shutting down the connection pool.
+    Sends kill messages to all clients shutting down the default connection pool.
 
-    :param number_of_clients: (int) the number of clients to kill (should be the same number for creating the connection pool)
+    :param number_of_clients: (int) kept for backwards compatibility, all the clients of the pool are shut down
     :return: None
     """
-    for _ in range(number_of_clients):
-        await MESSAGE_QUEUE.put((None, "shutdown"))
-
+    global DEFAULT_POOL
+    if DEFAULT_POOL is None:
+        return
+    pool = DEFAULT_POOL
+    DEFAULT_POOL = None
+    await pool.close()
 
-async def execute_pooled_query(query: Query) -> dict:
-    """
-    Sends a query to the connection pool to be executed on the database.
 
-    :param query: (Query)
-    :return:
+async def execute_pooled_query(
+        query: Query,
+        timeout: Optional[float] = None,
+        server_timeout: bool = False
+    ) -> Response:
     """
-    request_id = str(uuid4())
-    response_future = asyncio.get_running_loop().create_future()
-    pending_responses[request_id] = response_future
+    Sends a query to the default connection pool to be executed on the database.
 
-    # Send the request to the WebSocket client via the message_queue
-    await MESSAGE_QUEUE.put((request_id, query.query_params))
-
-    # Wait for the WebSocket client to get a response and set the future's result
-    response = await response_future
+    # Notes
+    Raises a RuntimeError if `client_pool` has not been started, or the pool was shut down with `shutdown_pool`.
 
-    return json.loads(response)
+    :param query: (Query) the query to be executed
+    :param timeout: (Optional[float]) the seconds to wait for the response before raising a QueryTimeoutError
+    :param server_timeout: (bool) whether to also add a SurrealQL `TIMEOUT` of the same length to the query
+    :return: (Response) the raw response from the database, its result is decoded when it is read
+    """
+    if DEFAULT_POOL is None:
+        # `client_pool` is usually spawned as a task right before the first query, and registers the pool
+        # before it first yields, so one turn of the loop is enough for it to run
+        await asyncio.sleep(0)
+    if DEFAULT_POOL is None:
+        raise RuntimeError("no pool running; call client_pool first")
+    return await DEFAULT_POOL.execute(query, timeout, server_timeout)
@@ -0,0 +1,212 @@
+"""
+Defines the metrics collected by the connection pool and how they are exported.
+
+# Notes
+Latencies are kept in fixed-bucket histograms so recording a sample is a bisect and an increment,
+and the memory of a histogram does not grow with the number of samples.
+"""
+import bisect
+from typing import Any, Dict, List, Optional, Sequence
+
+# The upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Histogram:
+    """
+    A histogram with fixed bucket bounds.
+
+    Attributes:
+        bounds: The upper bounds of the buckets, a final bucket catches everything above the last bound.
+        counts: The number of samples in each bucket (not cumulative).
+        count: The total number of samples.
+        sum: The sum of all the samples.
+    """
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS) -> None:
+        """
+        The constructor for the Histogram class.
+
+        :param bounds: (Sequence[float]) the sorted upper bounds of the buckets
+        """
+        self.bounds: Sequence[float] = bounds
+        self.counts: List[int] = [0] * (len(bounds) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Records a sample.
+
+        :param value: (float) the sample to record
+        :return: None
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in.
+
+        :param q: (float) the quantile to estimate between 0 and 1
+        :return: (Optional[float]) the estimate, None if there are no samples
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                if index == len(self.bounds):
+                    return float("inf")
+                return self.bounds[index]
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Exports the histogram as a dictionary.
+
+        :return: (Dict[str, Any]) the count, sum, estimated quantiles and cumulative buckets of the histogram
+        """
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+
+class ClientMetrics:
+    """
+    The latencies recorded by a single pooled client.
+
+    Attributes:
+        send: The time taken to encode and write a request to the socket.
+        recv: The time between a request being sent and its response arriving.
+        decode: The time taken to read the id of a response off its frame, its result is decoded lazily.
+    """
+    def __init__(self) -> None:
+        """
+        The constructor for the ClientMetrics class.
+        """
+        self.send: Histogram = Histogram()
+        self.recv: Histogram = Histogram()
+        self.decode: Histogram = Histogram()
+
+
+class PoolMetrics:
+    """
+    The metrics of a connection pool that outlive its individual clients.
+
+    Attributes:
+        queue_wait: The time queries wait in the queue before a client takes them.
+        requests: The number of queries sent to the database.
+        coalesced: The number of queries that shared the request of an identical query in flight.
+        reconnects: The number of times a client of the pool has reconnected.
+        errors: Maps the kind of error to the number of times it happened.
+    """
+    def __init__(self) -> None:
+        """
+        The constructor for the PoolMetrics class.
+        """
+        self.queue_wait: Histogram = Histogram()
+        self.requests: int = 0
+        self.coalesced: int = 0
+        self.reconnects: int = 0
+        self.errors: Dict[str, int] = {}
+
+    def record_error(self, kind: str) -> None:
+        """
+        Counts an error.
+
+        :param kind: (str) the kind of error, for instance "timeout" or "connection"
+        :return: None
+        """
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    """
+    Formats labels for the Prometheus text format.
+
+    :param labels: (Dict[str, Any]) the names and values of the labels
+    :return: (str) the formatted labels
+    """
+    escaped = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def prometheus_histogram(name: str, histogram: Histogram, labels: Dict[str, Any]) -> List[str]:
+    """
+    Formats the samples of a histogram for the Prometheus text format.
+
+    :param name: (str) the name of the metric
+    :param histogram: (Histogram) the histogram to format
+    :param labels: (Dict[str, Any]) the labels of the histogram
+    :return: (List[str]) the lines of the samples
+    """
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+    lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+def prometheus_text(stats: Dict[str, Any], histograms: Dict[str, Any], prefix: str = "sblpy_pool") -> str:
+    """
+    Formats a snapshot of the pool for the Prometheus text exposition format.
+
+    :param stats: (Dict[str, Any]) the snapshot returned by `ConnectionPool.stats`
+    :param histograms: (Dict[str, Any]) the live histograms of the pool, "queue_wait" and "clients"
+                                        mapping client ids to their ClientMetrics
+    :param prefix: (str) the prefix of the metric names
+    :return: (str) the metrics in the Prometheus text format
+    """
+    pool = {"url": stats["url"], "namespace": stats["namespace"], "database": stats["database"]}
+    lines = [
+        f"# TYPE {prefix}_queue_depth gauge",
+        f"{prefix}_queue_depth{_labels(pool)} {stats['queue_depth']}",
+        f"# TYPE {prefix}_clients gauge",
+        f"{prefix}_clients{_labels(pool)} {len(stats['clients'])}",
+        f"# TYPE {prefix}_requests_total counter",
+        f"{prefix}_requests_total{_labels(pool)} {stats['requests']}",
+        f"# TYPE {prefix}_coalesced_total counter",
+        f"{prefix}_coalesced_total{_labels(pool)} {stats['coalesced']}",
+        f"# TYPE {prefix}_reconnects_total counter",
+        f"{prefix}_reconnects_total{_labels(pool)} {stats['reconnects']}",
+        f"# TYPE {prefix}_errors_total counter",
+    ]
+    for kind, count in sorted(stats["errors"].items()):
+        lines.append(f"{prefix}_errors_total{_labels({**pool, 'kind': kind})} {count}")
+    lines.append(f"# TYPE {prefix}_queue_wait_seconds histogram")
+    lines.extend(prometheus_histogram(f"{prefix}_queue_wait_seconds", histograms["queue_wait"], pool))
+
+    lines.append(f"# TYPE {prefix}_client_in_flight gauge")
+    for client_id, client in stats["clients"].items():
+        lines.append(f"{prefix}_client_in_flight{_labels({**pool, 'client': client_id})} {client['in_flight']}")
+    for stage in ("send", "recv", "decode"):
+        lines.append(f"# TYPE {prefix}_client_{stage}_seconds histogram")
+        for client_id, metrics in histograms["clients"].items():
+            lines.extend(prometheus_histogram(
+                f"{prefix}_client_{stage}_seconds", getattr(metrics, stage), {**pool, "client": client_id}
+            ))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,85 @@
+"""
+Defines how the pages of the ranges of a parallel table scan are merged into one stream.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, List, Sequence
+
+# Put on the queue of a range once its last page has been put
+RANGE_DONE = object()
+
+# The number of pages each range can read ahead of the caller
+PAGES_AHEAD = 2
+
+
+async def merge_pages(
+        sources: Sequence[Callable[[], AsyncIterator[List[Any]]]],
+        concurrency: int,
+        ordered: bool = False
+) -> AsyncIterator[List[Any]]:
+    """
+    Reads the pages of several ranges side by side and yields them as one stream.
+
+    # Notes
+    At most `concurrency` ranges are read at once and each can read `PAGES_AHEAD` pages ahead of the
+    caller before it waits, so a slow caller holds back the reads rather than buffering the table.
+    Unordered, the pages are yielded as they arrive. Ordered, the pages of each range are yielded
+    after those of the ranges before it, and the ranges after it read ahead while the caller catches
+    up. The ranges are started in order and the semaphore wakes its waiters in order, so the range
+    the caller is waiting on is always running. The first error of a range is raised to the caller
+    and the other ranges are cancelled.
+
+    :param sources: (Sequence[Callable[[], AsyncIterator[List[Any]]]]) opens the pages of each range in order
+    :param concurrency: (int) the maximum number of ranges read at once
+    :param ordered: (bool) whether the pages are yielded in the order of the ranges
+    :return: (AsyncIterator[List[Any]]) the pages of every range
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency has to be at least 1, not {concurrency}")
+    semaphore = asyncio.Semaphore(concurrency)
+    if ordered is True:
+        queues = [asyncio.Queue(PAGES_AHEAD) for _ in sources]
+    else:
+        shared = asyncio.Queue(PAGES_AHEAD * concurrency)
+        queues = [shared for _ in sources]
+
+    async def read(source: Callable[[], AsyncIterator[List[Any]]], queue: asyncio.Queue) -> None:
+        try:
+            async with semaphore:
+                pages = source()
+                try:
+                    async for page in pages:
+                        await queue.put(page)
+                finally:
+                    # cancel the page it prefetched now if the range was cancelled
+                    await pages.aclose()
+            await queue.put(RANGE_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            await queue.put(error)
+
+    tasks = [asyncio.ensure_future(read(source, queue)) for source, queue in zip(sources, queues)]
+    try:
+        if ordered is True:
+            for queue in queues:
+                while True:
+                    page = await queue.get()
+                    if page is RANGE_DONE:
+                        break
+                    if isinstance(page, Exception):
+                        raise page
+                    yield page
+        else:
+            remaining = len(tasks)
+            while remaining > 0:
+                page = await shared.get()
+                if page is RANGE_DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,69 @@
+"""
+Defines the token bucket that limits the rate queries are sent to the database by the connection pool.
+"""
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    A token bucket that refills at a fixed rate up to a burst capacity.
+
+    Attributes:
+        rate: The number of tokens added to the bucket per second.
+        capacity: The maximum number of tokens the bucket can hold.
+        tokens: The number of tokens currently in the bucket.
+    """
+    def __init__(self, rate: float, burst: Optional[int] = None) -> None:
+        """
+        The constructor for the TokenBucket class.
+
+        :param rate: (float) the number of tokens added to the bucket per second
+        :param burst: (Optional[int]) the maximum number of tokens the bucket can hold (defaults to one second of tokens)
+        """
+        if rate <= 0:
+            raise ValueError(f"rate has to be larger than 0, not {rate}")
+        self.rate: float = rate
+        self.capacity: float = float(burst) if burst is not None else max(1.0, rate)
+        self.tokens: float = self.capacity
+        self._updated: float = time.monotonic()
+
+    def _refill(self) -> None:
+        """
+        Adds the tokens that have accrued since the last refill.
+
+        :return: None
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a token out of the bucket if there is one.
+
+        :return: (bool) True if a token was taken
+        """
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        """
+        Waits until a token can be taken out of the bucket and takes it.
+
+        :return: None
+        """
+        while self.try_acquire() is False:
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def release(self) -> None:
+        """
+        Puts back a token that was taken for a message that was not sent after all.
+
+        :return: None
+        """
+        self.tokens = min(self.capacity, self.tokens + 1.0)
@@ -0,0 +1,341 @@
+"""
+Defines the scheduler that orders the messages waiting to be sent by the connection pool.
+
+# Notes
+Messages are put into priority lanes and lower priority values are served first. Within a lane the
+tenants of the messages share the lane with weighted fair queuing: every message gets a virtual
+finish tag of `max(lane virtual time, tenant's last tag) + 1 / weight` and the smallest tag is served
+first, so a tenant that floods the lane only delays itself. To stop lower lanes from starving, a
+message that has waited longer than the starvation timeout is served before any other message.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sblpy.query import Priority
+
+
+class ScheduledMessage:
+    """
+    A message waiting in the scheduler.
+
+    Attributes:
+        item: The item handed to the client that takes the message.
+        request_id: The ID of the request used to remove the message.
+        priority: The priority lane of the message.
+        tenant: The tenant the message is fairly queued under.
+        enqueued_at: The monotonic time the message was put into the scheduler.
+        finish: The virtual finish tag of the message in its lane.
+        done: Whether the message has been served or removed.
+    """
+    __slots__ = ("item", "request_id", "priority", "tenant", "enqueued_at", "finish", "done")
+
+    def __init__(self, item: Tuple, request_id: Optional[str], priority: int, tenant: Optional[str]) -> None:
+        """
+        The constructor for the ScheduledMessage class.
+
+        :param item: (Tuple) the item handed to the client that takes the message
+        :param request_id: (Optional[str]) the ID of the request used to remove the message
+        :param priority: (int) the priority lane of the message
+        :param tenant: (Optional[str]) the tenant the message is fairly queued under
+        """
+        self.item: Tuple = item
+        self.request_id: Optional[str] = request_id
+        self.priority: int = priority
+        self.tenant: Optional[str] = tenant
+        self.enqueued_at: float = time.monotonic()
+        self.finish: float = 0.0
+        self.done: bool = False
+
+
+class Lane:
+    """
+    The messages of one priority, fairly queued between their tenants.
+
+    Attributes:
+        virtual_time: The finish tag of the last message served from the lane.
+        last_finish: Maps tenants to the finish tag of their last message put into the lane.
+        heap: The messages of the lane ordered by their finish tag.
+        arrivals: The messages of the lane in the order they were put in, used to detect starvation.
+    """
+    def __init__(self) -> None:
+        """
+        The constructor for the Lane class.
+        """
+        self.virtual_time: float = 0.0
+        self.last_finish: Dict[Optional[str], float] = {}
+        self.heap: List[Tuple[float, int, ScheduledMessage]] = []
+        self.arrivals: Deque[ScheduledMessage] = deque()
+
+    def oldest(self) -> Optional[ScheduledMessage]:
+        """
+        Gets the message of the lane that has waited the longest.
+
+        :return: (Optional[ScheduledMessage]) the oldest message, None if the lane is empty
+        """
+        while len(self.arrivals) > 0 and self.arrivals[0].done is True:
+            self.arrivals.popleft()
+        if len(self.arrivals) == 0:
+            return None
+        return self.arrivals[0]
+
+    def next(self) -> Optional[ScheduledMessage]:
+        """
+        Gets the message of the lane with the smallest finish tag.
+
+        :return: (Optional[ScheduledMessage]) the next fair message, None if the lane is empty
+        """
+        while len(self.heap) > 0 and self.heap[0][2].done is True:
+            heapq.heappop(self.heap)
+        if len(self.heap) == 0:
+            return None
+        return self.heap[0][2]
+
+
+class Scheduler:
+    """
+    A queue of messages with priority lanes, weighted fair queuing between tenants and starvation protection.
+
+    # Notes
+    The scheduler has the same `put`, `put_nowait`, `get` and `qsize` interface as the `asyncio.Queue`
+    it replaces, with `remove` added so queued messages of cancelled requests can be dropped. Messages
+    without a request ID, such as the shutdown messages of the pool, are served in arrival order
+    relative to the oldest queued query so closing the pool still drains the queries queued before it.
+    Like `asyncio.Queue` a `maxsize` of 0 means the scheduler is unbounded. Messages without a request ID
+    do not count towards the bound.
+
+    Attributes:
+        tenant_weights: Maps tenants to their share of a lane, tenants not in the map have a weight of 1.
+        starvation_timeout: The seconds a message can wait before it is served ahead of higher priorities.
+        maxsize: The maximum number of queries that can be queued, 0 for no limit.
+    """
+    def __init__(
+            self,
+            tenant_weights: Optional[Dict[str, float]] = None,
+            starvation_timeout: float = 1.0,
+            maxsize: int = 0
+    ) -> None:
+        """
+        The constructor for the Scheduler class.
+
+        :param tenant_weights: (Optional[Dict[str, float]]) maps tenants to their share of a lane
+        :param starvation_timeout: (float) the seconds a message can wait before it skips ahead of higher priorities
+        :param maxsize: (int) the maximum number of queries that can be queued, 0 for no limit
+        """
+        self.tenant_weights: Dict[str, float] = tenant_weights if tenant_weights is not None else {}
+        self.starvation_timeout: float = starvation_timeout
+        self.maxsize: int = maxsize
+        self._lanes: Dict[int, Lane] = {}
+        self._priorities: List[int] = []
+        self._control: Deque[ScheduledMessage] = deque()
+        self._messages: Dict[str, ScheduledMessage] = {}
+        self._size: int = 0
+        self._sequence = itertools.count()
+        self._getters: Deque[asyncio.Future] = deque()
+        self._putters: Deque[asyncio.Future] = deque()
+
+    def qsize(self) -> int:
+        """
+        The number of messages waiting in the scheduler.
+
+        :return: (int) the number of queued messages
+        """
+        return self._size
+
+    def empty(self) -> bool:
+        """
+        Whether there are no messages waiting in the scheduler.
+
+        :return: (bool) True if no messages are queued
+        """
+        return self._size == 0
+
+    def full(self) -> bool:
+        """
+        Whether the number of queued queries has reached the bound of the scheduler.
+
+        :return: (bool) True if no more queries can be queued without waiting
+        """
+        return self.maxsize > 0 and len(self._messages) >= self.maxsize
+
+    def put_nowait(
+            self,
+            item: Tuple,
+            priority: int = Priority.NORMAL,
+            tenant: Optional[str] = None
+    ) -> ScheduledMessage:
+        """
+        Puts a message into the scheduler.
+
+        :param item: (Tuple) the item to hand to a client, the first element is the request ID
+        :param priority: (int) the priority lane of the message, lower values are served first
+        :param tenant: (Optional[str]) the tenant the message is fairly queued under
+        :return: (ScheduledMessage) the message that was queued, raising asyncio.QueueFull if the scheduler is full
+        """
+        request_id = item[0]
+        if request_id is not None and self.full():
+            raise asyncio.QueueFull()
+        message = ScheduledMessage(item, request_id, priority, tenant)
+        if request_id is None:
+            self._control.append(message)
+        else:
+            lane = self._lanes.get(priority)
+            if lane is None:
+                lane = Lane()
+                self._lanes[priority] = lane
+                self._priorities = sorted(self._lanes)
+            weight = self.tenant_weights.get(tenant, 1.0)
+            start = max(lane.virtual_time, lane.last_finish.get(tenant, 0.0))
+            message.finish = start + 1.0 / weight
+            lane.last_finish[tenant] = message.finish
+            heapq.heappush(lane.heap, (message.finish, next(self._sequence), message))
+            lane.arrivals.append(message)
+            self._messages[request_id] = message
+        self._size += 1
+        self._wake(self._getters)
+        return message
+
+    async def put(
+            self,
+            item: Tuple,
+            priority: int = Priority.NORMAL,
+            tenant: Optional[str] = None
+    ) -> ScheduledMessage:
+        """
+        Puts a message into the scheduler, waiting for room if the scheduler is full.
+
+        :param item: (Tuple) the item to hand to a client, the first element is the request ID
+        :param priority: (int) the priority lane of the message, lower values are served first
+        :param tenant: (Optional[str]) the tenant the message is fairly queued under
+        :return: (ScheduledMessage) the message that was queued
+        """
+        while item[0] is not None and self.full():
+            await self._wait(self._putters, self.full)
+        return self.put_nowait(item, priority, tenant)
+
+    def remove(self, request_id: str) -> bool:
+        """
+        Removes a queued message so it is never handed to a client.
+
+        :param request_id: (str) the ID of the request of the message
+        :return: (bool) True if the message was still queued
+        """
+        message = self._messages.pop(request_id, None)
+        if message is None or message.done is True:
+            return False
+        message.done = True
+        self._size -= 1
+        self._wake(self._putters)
+        return True
+
+    def drop_oldest(self) -> Optional[Tuple]:
+        """
+        Removes the query that has waited the longest to make room for a new one.
+
+        :return: (Optional[Tuple]) the item of the removed query, None if no queries are queued
+        """
+        oldest: Optional[ScheduledMessage] = None
+        for lane in self._lanes.values():
+            head = lane.oldest()
+            if head is not None and (oldest is None or head.enqueued_at < oldest.enqueued_at):
+                oldest = head
+        if oldest is None:
+            return None
+        self.remove(oldest.request_id)
+        return oldest.item
+
+    def get_nowait(self) -> Tuple:
+        """
+        Takes the next message out of the scheduler.
+
+        :return: (Tuple) the item of the next message
+        """
+        message = self._select()
+        if message is None:
+            raise asyncio.QueueEmpty()
+        message.done = True
+        self._size -= 1
+        if message.request_id is None:
+            self._control.popleft()
+        else:
+            self._messages.pop(message.request_id, None)
+            lane = self._lanes[message.priority]
+            lane.virtual_time = max(lane.virtual_time, message.finish)
+            self._wake(self._putters)
+        return message.item
+
+    async def get(self) -> Tuple:
+        """
+        Waits for the next message and takes it out of the scheduler.
+
+        :return: (Tuple) the item of the next message
+        """
+        while self._size == 0:
+            await self._wait(self._getters, self.empty)
+        return self.get_nowait()
+
+    async def _wait(self, waiters: Deque[asyncio.Future], blocked) -> None:
+        """
+        Waits until woken by a change to the scheduler.
+
+        :param waiters: (Deque[asyncio.Future]) the waiters to join, either the getters or the putters
+        :param blocked: (Callable[[], bool]) whether a waiter of this kind would still be blocked
+        :return: None
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in waiters:
+                waiters.remove(waiter)
+            elif not blocked():
+                # pass the wake up on to another waiter as this one will not use it
+                self._wake(waiters)
+            raise
+
+    @staticmethod
+    def _wake(waiters: Deque[asyncio.Future]) -> None:
+        """
+        Wakes the longest waiting waiter that is still waiting.
+
+        :param waiters: (Deque[asyncio.Future]) the waiters to wake one of
+        :return: None
+        """
+        while len(waiters) > 0:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _select(self) -> Optional[ScheduledMessage]:
+        """
+        Picks the message to serve next.
+
+        :return: (Optional[ScheduledMessage]) the next message, None if the scheduler is empty
+        """
+        heads: List[Tuple[int, Lane, ScheduledMessage]] = []
+        oldest: Optional[ScheduledMessage] = None
+        for priority in self._priorities:
+            lane = self._lanes[priority]
+            head = lane.oldest()
+            if head is None:
+                continue
+            heads.append((priority, lane, head))
+            if oldest is None or head.enqueued_at < oldest.enqueued_at:
+                oldest = head
+
+        if len(self._control) > 0:
+            control = self._control[0]
+            if oldest is None or control.enqueued_at <= oldest.enqueued_at:
+                return control
+        if oldest is None:
+            return None
+
+        # starvation protection, the longest waiting message skips ahead once it has waited too long
+        if time.monotonic() - oldest.enqueued_at >= self.starvation_timeout:
+            return oldest
+        return heads[0][1].next()
@@ -1,7 +1,10 @@
 """
 Sets up the pooled connection.
 """
-import json
+from typing import Optional
+
+from sblpy.auth import TokenCache, authenticate_params
+from sblpy.codec import Codec, JsonCodec
 
 
 async def setup_connection(
@@ -10,7 +13,10 @@ async def setup_connection(
     user: str,
     password: str,
     namespace: str,
-    database: str
+    database: str,
+    token_cache: Optional[TokenCache] = None,
+    url: str = "",
+    codec: Optional[Codec] = None
 ) -> None:
     """
     Sets up the connection ready to be used by logging in and defining the namespace and database.
@@ -21,8 +27,63 @@ async def setup_connection(
     :param password: (str) the password to login on
     :param namespace: (str) the namespace that the connection will stick to
     :param database: (str) The database that the connection will stick to
+    :param token_cache: (Optional[TokenCache]) the cache of auth tokens to authenticate with instead of
+                                              signing in, None to always sign in
+    :param url: (str) the URL of the database, used to key the token cache
+    :param codec: (Optional[Codec]) encodes and decodes the messages, defaults to JSON
     :return:
     """
+    if codec is None:
+        codec = JsonCodec()
+    if token_cache is not None:
+        key = TokenCache.key(url, user, password)
+        async with token_cache.async_lock(key):
+            token = token_cache.get(key)
+            if token is None or await authenticate(websocket, id, token, codec) is False:
+                token_cache.invalidate(key)
+                token_cache.put(key, await signin(websocket, id, user, password, codec))
+    else:
+        await signin(websocket, id, user, password, codec)
+
+    use_params = {
+        "id": id,
+        "method": "use",
+        "params": [
+            namespace,
+            database
+        ]
+    }
+
+    await websocket.send(codec.encode(use_params))
+    await websocket.recv()
+
+
+async def authenticate(websocket, id: str, token: str, codec: Codec) -> bool:
+    """
+    Authenticates the connection with a token from an earlier signin.
+
+    :param websocket: (Websocket) the connection to authenticate
+    :param id: (str) the ID of the connection actor
+    :param token: (str) the token to authenticate with
+    :param codec: (Codec) encodes and decodes the messages
+    :return: (bool) True if the database accepted the token
+    """
+    await websocket.send(codec.encode(authenticate_params(id, token)))
+    response = codec.decode(await websocket.recv())
+    return response.get("error") is None
+
+
+async def signin(websocket, id: str, user: str, password: str, codec: Codec) -> str:
+    """
+    Signs in to the database with the username and password.
+
+    :param websocket: (Websocket) the connection to sign in on
+    :param id: (str) the ID of the connection actor
+    :param user: (str) the username to login on
+    :param password: (str) the password to login on
+    :param codec: (Codec) encodes and decodes the messages
+    :return: (str) the token returned by the database
+    """
     sign_params = {
         "id": id,
         "method": "signin",
@@ -34,9 +95,9 @@ async def setup_connection(
         ]
     }
     # Send the sign-in message
-    await websocket.send(json.dumps(sign_params, ensure_ascii=False))
+    await websocket.send(codec.encode(sign_params))
     response = await websocket.recv()
-    response = json.loads(response)
+    response = codec.decode(response)
 
     if response.get("error") is not None:
         raise Exception(f"Error signing in: {response.get('error')}")
@@ -44,16 +105,4 @@ async def setup_connection(
         raise Exception(f"No result signing in: {response}")
     if response.get("id") is None:
         raise Exception(f"No id signing in: {response}")
-    id = response["id"]
-
-    use_params = {
-        "id": id,
-        "method": "use",
-        "params": [
-            namespace,
-            database
-        ]
-    }
-
-    await websocket.send(json.dumps(use_params, ensure_ascii=False))
-    await websocket.recv()
+    return response["result"]
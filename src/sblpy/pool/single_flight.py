@@ -0,0 +1,86 @@
+"""
+Defines how identical requests in flight at the same time share one call to the database.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class Flight:
+    """
+    A call in flight and the number of callers waiting on it.
+
+    Attributes:
+        task: The task running the call.
+        waiters: The number of callers waiting on the task.
+    """
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        """
+        The constructor for the Flight class.
+
+        :param task: (asyncio.Task) the task running the call
+        """
+        self.task: asyncio.Task = task
+        self.waiters: int = 0
+
+
+class SingleFlight:
+    """
+    Runs one call for every caller with the same key while the call is in flight.
+
+    # Notes
+    The first caller of a key starts the call in a task of its own and the callers that arrive
+    before it finishes wait on the same task, so they all get the same result or the same error.
+    Each caller waits with its own timeout and a caller that gives up leaves the others waiting.
+    The call is only cancelled once every caller has given up. A caller that arrives after the call
+    has finished starts a new one, so nothing is cached.
+    """
+    def __init__(self) -> None:
+        """
+        The constructor for the SingleFlight class.
+        """
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """
+        Waits on the call in flight for a key, starting it if there is none.
+
+        :param key: (Hashable) identifies the calls that can be shared
+        :param call: (Callable[[], Awaitable[Any]]) starts the call if none is in flight
+        :param timeout: (Optional[float]) the seconds to wait before raising an asyncio.TimeoutError
+        :return: (Any) the result of the call
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        flight.waiters += 1
+        try:
+            if timeout is None:
+                return await asyncio.shield(flight.task)
+            return await asyncio.wait_for(asyncio.shield(flight.task), timeout)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # forget the flight now so a caller arriving before the cancellation lands starts a new call
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: Flight) -> None:
+        """
+        Removes the flight of a key if it is still the one registered.
+
+        :param key: (Hashable) the key of the flight
+        :param flight: (Flight) the flight to remove
+        :return: None
+        """
+        if self._flights.get(key) is flight:
+            del self._flights[key]
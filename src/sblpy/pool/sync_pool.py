@@ -0,0 +1,307 @@
+"""
+Defines a thread-safe pool of blocking connections for threaded applications.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from types import TracebackType
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple, Type, Union
+
+from websockets.protocol import State
+
+from sblpy.auth import TokenCache
+from sblpy.cache import QueryCache
+from sblpy.codec import Codec, get_codec
+from sblpy.connection import SurrealSyncConnection
+from sblpy.errors import PoolOverloadedError, QueryError
+
+
+class SyncConnectionPool:
+    """
+    A thread-safe pool of reusable `SurrealSyncConnection`s.
+
+    # Notes
+    Connections are created lazily up to `max_connections` and handed out to one thread at a time
+    with the `connection` context manager, so the connect, handshake, signin and use of a connection
+    are only paid for once. A connection that has been idle for `idle_timeout` seconds is closed
+    instead of being reused. If `health_check` is set, a borrowed connection is pinged first and
+    replaced if it does not answer. Connections that are closed when they are returned, or that
+    still have responses to read, are evicted.
+    New connections share a `TokenCache` so only the first signs in with the password.
+
+    Attributes:
+        host: The host of the database to process queries for.
+        port: The port that the database is listening on.
+        user: The username to login on.
+        password: The password to login on.
+        namespace: The namespace that the connections will stick to.
+        database: The database that the connections will stick to.
+        max_size: The maximum size of each connection.
+        encrypted: Whether the connections are encrypted.
+        max_connections: The maximum number of connections open at once.
+        idle_timeout: The seconds a connection can sit idle in the pool before it is closed.
+        health_check: Whether a connection is pinged before it is handed out.
+        health_check_timeout: The seconds to wait for the answer to a health check ping.
+        checkout_timeout: The seconds to wait for a free connection, None to wait forever.
+        token_cache: The cache of auth tokens new connections authenticate with instead of signing in.
+        codec: Encodes and decodes the messages of the connections.
+        query_cache: The cache of the responses of read only queries shared by the connections, None for no cache.
+    """
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            user: str,
+            password: str,
+            namespace: str = "default",
+            database: str = "default",
+            max_size: int = 2 ** 20,
+            encrypted: bool = False,
+            max_connections: int = 10,
+            idle_timeout: float = 300.0,
+            health_check: bool = True,
+            health_check_timeout: float = 1.0,
+            checkout_timeout: Optional[float] = None,
+            token_cache: Optional[TokenCache] = None,
+            protocol: Union[str, Codec] = "json",
+            query_cache: Optional[QueryCache] = None
+    ) -> None:
+        """
+        The constructor for the SyncConnectionPool class.
+
+        :param host: (str) the url of the database to process queries for
+        :param port: (int) the port that the database is listening on
+        :param user: (str) the username to login on
+        :param password: (str) the password to login on
+        :param namespace: (str) the namespace that the connections will stick to
+        :param database: (str) The database that the connections will stick to
+        :param max_size: (int) The maximum size of each connection
+        :param encrypted: (bool) Whether the connections are encrypted
+        :param max_connections: (int) the maximum number of connections open at once
+        :param idle_timeout: (float) the seconds a connection can sit idle in the pool before it is closed
+        :param health_check: (bool) whether a connection is pinged before it is handed out
+        :param health_check_timeout: (float) the seconds to wait for the answer to a health check ping
+        :param checkout_timeout: (Optional[float]) the seconds to wait for a free connection before raising a
+                                                   PoolOverloadedError, None to wait forever
+        :param token_cache: (Optional[TokenCache]) the cache of auth tokens new connections authenticate with
+                                                  (defaults to a cache of the pool's own)
+        :param protocol: (Union[str, Codec]) the protocol of the messages of the connections, "json", "cbor" or a codec
+        :param query_cache: (Optional[QueryCache]) the cache of the responses of read only queries
+        """
+        self.host: str = host
+        self.port: int = port
+        self.user: str = user
+        self.password: str = password
+        self.namespace: str = namespace
+        self.database: str = database
+        self.max_size: int = max_size
+        self.encrypted: bool = encrypted
+        self.max_connections: int = max_connections
+        self.idle_timeout: float = idle_timeout
+        self.health_check: bool = health_check
+        self.health_check_timeout: float = health_check_timeout
+        self.checkout_timeout: Optional[float] = checkout_timeout
+        self.token_cache: TokenCache = token_cache if token_cache is not None else TokenCache()
+        self.codec: Codec = get_codec(protocol)
+        self.query_cache: Optional[QueryCache] = query_cache
+        self._idle: Deque[Tuple[SurrealSyncConnection, float]] = deque()
+        self._open: int = 0
+        self._closed: bool = False
+        self._condition = threading.Condition()
+
+    def _connect(self) -> SurrealSyncConnection:
+        """
+        Opens a new connection for the pool.
+
+        :return: (SurrealSyncConnection) the connection signed in and set to the namespace and database
+        """
+        return SurrealSyncConnection(
+            self.host,
+            self.port,
+            self.user,
+            self.password,
+            self.namespace,
+            self.database,
+            self.max_size,
+            self.encrypted,
+            token_cache=self.token_cache,
+            protocol=self.codec,
+            query_cache=self.query_cache
+        )
+
+    @staticmethod
+    def _discard(connection: SurrealSyncConnection) -> None:
+        """
+        Closes a connection that is leaving the pool, ignoring errors from an already broken socket.
+
+        :param connection: (SurrealSyncConnection) the connection to close
+        :return: None
+        """
+        try:
+            connection.socket.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, connection: SurrealSyncConnection) -> bool:
+        """
+        Checks that a connection is open and, if health checks are on, answers a ping.
+
+        :param connection: (SurrealSyncConnection) the connection to check
+        :return: (bool) True if the connection can be handed out
+        """
+        if connection.socket.protocol.state is not State.OPEN:
+            return False
+        if self.health_check is False:
+            return True
+        try:
+            return connection.socket.ping().wait(self.health_check_timeout)
+        except Exception:
+            return False
+
+    def acquire(self) -> SurrealSyncConnection:
+        """
+        Takes a connection out of the pool, opening a new one if there is room.
+
+        :return: (SurrealSyncConnection) a connection only to be used by the calling thread until released
+        """
+        deadline = None if self.checkout_timeout is None else time.monotonic() + self.checkout_timeout
+        while True:
+            connection = None
+            expired = []
+            try:
+                with self._condition:
+                    while True:
+                        if self._closed is True:
+                            raise RuntimeError("the connection pool is closed")
+                        # the most recently returned connection is reused first, so the connections that
+                        # have gone stale collect at the other end of the idle queue
+                        now = time.monotonic()
+                        while len(self._idle) > 0 and now - self._idle[0][1] >= self.idle_timeout:
+                            expired.append(self._idle.popleft()[0])
+                            self._open -= 1
+                        if len(self._idle) > 0:
+                            connection, _ = self._idle.pop()
+                            break
+                        if self._open < self.max_connections:
+                            # reserve the slot so the connection can be opened outside the lock
+                            self._open += 1
+                            break
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise PoolOverloadedError(
+                                f"no connection to {self.host}:{self.port} was free within {self.checkout_timeout}s"
+                            )
+                        self._condition.wait(remaining)
+            finally:
+                # closing a socket waits for the close handshake so it is done outside the lock
+                for expired_connection in expired:
+                    self._discard(expired_connection)
+
+            if connection is None:
+                try:
+                    return self._connect()
+                except BaseException:
+                    self._release_slot()
+                    raise
+            if self._is_healthy(connection):
+                return connection
+            self._discard(connection)
+            self._release_slot()
+
+    def _release_slot(self) -> None:
+        """
+        Frees the slot of a connection that was evicted so a waiting thread can open a new one.
+
+        :return: None
+        """
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    def release(self, connection: SurrealSyncConnection, broken: bool = False) -> None:
+        """
+        Returns a connection to the pool, evicting it if it is broken.
+
+        :param connection: (SurrealSyncConnection) the connection taken out with `acquire`
+        :param broken: (bool) whether the connection should be evicted regardless of its state
+        :return: None
+        """
+        if (
+                broken is True
+                or self._closed is True
+                or connection.socket.protocol.state is not State.OPEN
+                or len(connection.unanswered) > 0
+        ):
+            self._discard(connection)
+            self._release_slot()
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[SurrealSyncConnection]:
+        """
+        Checks a connection out of the pool for the duration of the `with` block.
+
+        # Notes
+        If the block raises anything other than a `QueryError`, the connection could have a response
+        left unread or be half closed, for instance after an interrupted read or pipeline, so it is
+        evicted. A `QueryError` means the database answered with an error and the whole response was
+        read, so the connection goes back to the pool.
+
+        :return: (Iterator[SurrealSyncConnection]) the borrowed connection
+        """
+        connection = self.acquire()
+        broken = True
+        try:
+            yield connection
+            broken = False
+        except QueryError:
+            broken = False
+            raise
+        finally:
+            self.release(connection, broken)
+
+    def query(self, query: str, vars: Optional[Dict[str, Any]] = None) -> dict:
+        """
+        Runs a query on a connection borrowed from the pool.
+
+        :param query: The query to run
+        :param vars: The variables to use in the query
+        :return: The result of the query
+        """
+        with self.connection() as connection:
+            return connection.query(query, vars)
+
+    def close(self) -> None:
+        """
+        Closes the idle connections and stops the pool handing out connections.
+
+        # Notes
+        Connections that are checked out are closed when they are returned.
+
+        :return: None
+        """
+        with self._condition:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._condition.notify_all()
+        for connection in idle:
+            self._discard(connection)
+
+    def __enter__(self) -> "SyncConnectionPool":
+        """No-op for entering the context manager since connections are opened lazily."""
+        return self
+
+    def __exit__(
+            self,
+            exc_type: Optional[Type[BaseException]],
+            exc_value: Optional[BaseException],
+            traceback: Optional[TracebackType]
+    ) -> None:
+        """Closes the pool when exiting the context manager."""
+        self.close()
@@ -0,0 +1,168 @@
+"""
+Defines a thread-safe facade that runs an async connection pool on a background event loop.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from types import TracebackType
+from typing import Any, Dict, Optional, Type
+
+from sblpy.pool.connection_pool import ConnectionPool
+from sblpy.query import Query
+from sblpy.response import Response
+
+
+class ThreadedConnectionPool:
+    """
+    Runs a `ConnectionPool` on a dedicated event loop thread so any thread can submit queries to it.
+
+    # Notes
+    Sync code and thread pool workers share the same multiplexed sockets as async code running on the
+    background loop. `submit` returns a `concurrent.futures.Future` and `execute` blocks until the
+    response arrives. Cancelling a submitted future cancels the query in the pool, removing it from
+    the queue if it has not been sent yet.
+
+    Attributes:
+        pool: The async connection pool run on the background loop.
+        loop: The event loop the pool runs on.
+        thread: The thread running the event loop.
+    """
+    def __init__(self, pool: ConnectionPool) -> None:
+        """
+        The constructor for the ThreadedConnectionPool class.
+
+        :param pool: (ConnectionPool) the async connection pool to run, it must not have been started
+        """
+        self.pool: ConnectionPool = pool
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Starts the background event loop thread and the clients of the pool on it.
+
+        # Notes
+        If the pool fails to start, the clients it did start are shut down and the loop thread is
+        stopped and joined before the error is raised, so the pool can be started again.
+
+        :return: None
+        """
+        if self.thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="sblpy-pool-loop", daemon=True)
+        self.thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(self.pool.start(), self.loop).result()
+        except BaseException:
+            try:
+                asyncio.run_coroutine_threadsafe(self.pool.close(), self.loop).result()
+            except Exception:
+                pass
+            self._stop_loop()
+            raise
+
+    def _run_loop(self) -> None:
+        """
+        Runs the background event loop until it is stopped.
+
+        :return: None
+        """
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _check_running(self) -> None:
+        """
+        Checks that the pool can accept queries from the calling thread.
+
+        :return: None
+        """
+        if self.loop is None:
+            raise RuntimeError("the threaded connection pool has not been started")
+        if threading.current_thread() is self.thread:
+            raise RuntimeError(
+                "the threaded connection pool cannot be called from its own loop, use the pool directly"
+            )
+
+    def submit(
+            self,
+            query: Query,
+            timeout: Optional[float] = None,
+            server_timeout: bool = False
+    ) -> Future:
+        """
+        Submits a query to the pool from any thread.
+
+        :param query: (Query) the query to be executed
+        :param timeout: (Optional[float]) the seconds to wait for the response before raising a QueryTimeoutError
+        :param server_timeout: (bool) whether to also add a SurrealQL `TIMEOUT` of the same length to the query
+        :return: (Future) resolves to the raw response from the database
+        """
+        self._check_running()
+        return asyncio.run_coroutine_threadsafe(self.pool.execute(query, timeout, server_timeout), self.loop)
+
+    def execute(
+            self,
+            query: Query,
+            timeout: Optional[float] = None,
+            server_timeout: bool = False
+    ) -> Response:
+        """
+        Executes a query on the pool, blocking the calling thread until the response arrives.
+
+        :param query: (Query) the query to be executed
+        :param timeout: (Optional[float]) the seconds to wait for the response before raising a QueryTimeoutError
+        :param server_timeout: (bool) whether to also add a SurrealQL `TIMEOUT` of the same length to the query
+        :return: (Response) the raw response from the database, its result is decoded when it is read
+        """
+        return self.submit(query, timeout, server_timeout).result()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Takes a snapshot of the metrics of the pool on its loop.
+
+        :return: (Dict[str, Any]) the snapshot returned by `ConnectionPool.stats`
+        """
+        self._check_running()
+
+        async def snapshot() -> Dict[str, Any]:
+            return self.pool.stats()
+        return asyncio.run_coroutine_threadsafe(snapshot(), self.loop).result()
+
+    def close(self) -> None:
+        """
+        Shuts down the clients of the pool, then stops and joins the background loop thread.
+
+        :return: None
+        """
+        if self.thread is None:
+            return
+        self._check_running()
+        asyncio.run_coroutine_threadsafe(self.pool.close(), self.loop).result()
+        self._stop_loop()
+
+    def _stop_loop(self) -> None:
+        """
+        Stops the background event loop and joins its thread.
+
+        :return: None
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+        self.thread = None
+
+    def __enter__(self) -> "ThreadedConnectionPool":
+        """Starts the background loop and the pool when entering the context manager."""
+        self.start()
+        return self
+
+    def __exit__(
+            self,
+            exc_type: Optional[Type[BaseException]],
+            exc_value: Optional[BaseException],
+            traceback: Optional[TracebackType]
+    ) -> None:
+        """Shuts down the pool and the background loop when exiting the context manager."""
+        self.close()
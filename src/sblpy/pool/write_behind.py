@@ -0,0 +1,305 @@
+"""
+Defines the write-behind buffer that coalesces frequent updates of the same records before writing them through the pool.
+"""
+import asyncio
+import logging
+from types import TracebackType
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from sblpy.bulk import MESSAGE_OVERHEAD, chunk_records
+from sblpy.cbor import RecordID
+from sblpy.query import Priority, Query
+from sblpy.rpc import record_key
+
+logger = logging.getLogger(__name__)
+
+# The rough size of the statement of a record and of the names of its variables in the message of a flush
+STATEMENT_SIZE = 160
+
+
+def merge_fields(pending: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combines two writes of a record so the later value of each field wins, like two `MERGE` updates in a row.
+
+    :param pending: (Dict[str, Any]) the fields of the write not yet flushed
+    :param data: (Dict[str, Any]) the fields of the new write
+    :return: (Dict[str, Any]) the fields of both writes
+    """
+    return {**pending, **data}
+
+
+class WriteBehindBuffer:
+    """
+    Buffers updates of records and writes them through a connection pool in batches.
+
+    # Notes
+    `write` only records the update, so a burst of updates of a hot record costs one statement. The
+    update of a record that is still pending is combined with it by `merge`, which by default keeps
+    the later value of each field, so the record ends up the same as if every update had been sent.
+    Pass a `merge` of your own to add up counters and the like.
+
+    The pending updates are flushed every `interval` seconds, or as soon as `max_pending` records
+    are waiting, as multi-statement queries of `UPDATE ... MERGE` statements, split so that none
+    holds more than about `max_bytes` of updates and every message fits in the `max_size` of the
+    pool. Only one flush runs
+    at a time, so a later update of a record is never written before an earlier one. The records of
+    a flush that succeeded are passed to `on_flush` and the updates that failed to `on_error`, with
+    the error, so they can be written again or logged. An update is lost if the process dies before
+    it is flushed, so only buffer updates that can be lost, such as counters and presence.
+
+    Attributes:
+        pool: The connection pool the updates are written through.
+        interval: The seconds between flushes.
+        max_pending: The number of pending records that starts a flush straight away.
+        merge: Combines a pending update of a record with a new one.
+        upsert: Whether records that do not exist are created rather than left alone.
+        priority: The priority class of the flushes in the pool.
+        timeout: The seconds to wait for a flush before counting its updates as failed.
+        max_bytes: The rough maximum size of the updates sent in one query of a flush.
+        on_flush: Called with the records of each flush that was written.
+        on_error: Called with the updates that failed and the error.
+        writes: The number of updates buffered.
+        coalesced: The number of updates combined with a pending update of the same record.
+        flushed: The number of records written.
+        failed: The number of records that failed to be written.
+    """
+    def __init__(
+            self,
+            pool,
+            interval: float = 0.05,
+            max_pending: int = 500,
+            merge: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]] = merge_fields,
+            upsert: bool = False,
+            priority: int = Priority.NORMAL,
+            timeout: Optional[float] = None,
+            on_flush: Optional[Callable[[List[Union[str, RecordID]]], None]] = None,
+            on_error: Optional[Callable[[Dict[Union[str, RecordID], Dict[str, Any]], Any], None]] = None,
+            max_bytes: Optional[int] = None
+    ) -> None:
+        """
+        The constructor for the WriteBehindBuffer class.
+
+        :param pool: (ConnectionPool) the connection pool the updates are written through
+        :param interval: (float) the seconds between flushes
+        :param max_pending: (int) the number of pending records that starts a flush straight away
+        :param merge: (Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]) combines a pending update
+                      of a record with a new one (defaults to the later value of each field winning)
+        :param upsert: (bool) whether records that do not exist are created rather than left alone
+        :param priority: (int) the priority class of the flushes in the pool
+        :param timeout: (Optional[float]) the seconds to wait for a flush before counting its updates as failed
+        :param on_flush: (Optional[Callable[[List[Union[str, RecordID]]], None]]) called with the records
+                         of each flush once they are written
+        :param on_error: (Optional[Callable[[Dict[Union[str, RecordID], Dict[str, Any]], Any], None]]) called
+                         with the updates that failed and the error
+        :param max_bytes: (Optional[int]) the rough maximum size of the updates sent in one query of a flush
+                                          (defaults to half of the `max_size` of the pool)
+        """
+        if interval <= 0:
+            raise ValueError(f"interval has to be larger than 0, not {interval}")
+        if max_pending < 1:
+            raise ValueError(f"max_pending has to be at least 1, not {max_pending}")
+        self.pool = pool
+        self.interval: float = interval
+        self.max_pending: int = max_pending
+        self.merge: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]] = merge
+        self.upsert: bool = upsert
+        self.priority: int = priority
+        self.timeout: Optional[float] = timeout
+        if max_bytes is None:
+            max_bytes = pool.max_size // 2
+        self.max_bytes: int = min(max_bytes, pool.max_size - MESSAGE_OVERHEAD)
+        self.on_flush: Optional[Callable[[List[Union[str, RecordID]]], None]] = on_flush
+        self.on_error: Optional[Callable[[Dict[Union[str, RecordID], Dict[str, Any]], Any], None]] = on_error
+        self.writes: int = 0
+        self.coalesced: int = 0
+        self.flushed: int = 0
+        self.failed: int = 0
+        self._pending: Dict[Tuple[str, Any], Tuple[Union[str, RecordID], Dict[str, Any]]] = {}
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._kicked: Optional[asyncio.Task] = None
+        self._closed: bool = False
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of records with an update waiting to be flushed.
+
+        :return: (int) the number of pending records
+        """
+        return len(self._pending)
+
+    def start(self) -> None:
+        """
+        Starts flushing the pending updates every `interval` seconds in the background.
+
+        :return: None
+        """
+        if self._timer is None:
+            self._closed = False
+            self._timer = asyncio.ensure_future(self._flush_every_interval())
+
+    def write(self, record: Union[str, RecordID], data: Dict[str, Any]) -> None:
+        """
+        Buffers an update of a record, combining it with the pending update of the record if there is one.
+
+        :param record: (Union[str, RecordID]) the ID of the record, as a RecordID or a `table:id` string
+        :param data: (Dict[str, Any]) the fields to set on the record
+        :return: None
+        """
+        if self._closed is True:
+            raise RuntimeError("the write-behind buffer is closed")
+        key = record_key(record)
+        self.writes += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = (record, dict(data))
+        else:
+            self.coalesced += 1
+            self._pending[key] = (pending[0], self.merge(pending[1], data))
+        if len(self._pending) >= self.max_pending and (self._kicked is None or self._kicked.done()):
+            self._kicked = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> int:
+        """
+        Writes the pending updates and waits for them to be written.
+
+        :return: (int) the number of records the flush wrote
+        """
+        async with self._lock:
+            if len(self._pending) == 0:
+                return 0
+            writes, self._pending = self._pending, {}
+            written = 0
+            # the records merged into a write have no size limit, so the flush is split to fit in the messages
+            for _, chunk in chunk_records(
+                    writes.values(), len(writes), self.max_bytes, self._encode, STATEMENT_SIZE
+            ):
+                written += await self._write(chunk)
+            return written
+
+    def _encode(self, write: Tuple[Union[str, RecordID], Dict[str, Any]]) -> Union[str, bytes]:
+        """
+        Encodes the variables of the update of a record the way they are sent.
+
+        :param write: (Tuple[Union[str, RecordID], Dict[str, Any]]) the record and its combined update
+        :return: (Union[str, bytes]) the encoded table, id and fields of the update
+        """
+        table, id = record_key(write[0])
+        return self.pool.codec.encode([table, id, write[1]])
+
+    async def close(self) -> None:
+        """
+        Stops the background flushes and flushes the updates still pending.
+
+        :return: None
+        """
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+        if self._kicked is not None:
+            await asyncio.gather(self._kicked, return_exceptions=True)
+        await self.flush()
+
+    async def _flush_every_interval(self) -> None:
+        """
+        Flushes the pending updates every `interval` seconds until cancelled.
+
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            # a flush already sent is left to finish when the timer is cancelled, or its updates would be lost
+            await asyncio.shield(self.flush())
+
+    def query(self, writes: List[Tuple[Union[str, RecordID], Dict[str, Any]]]) -> Query:
+        """
+        Builds the multi-statement query of a flush.
+
+        :param writes: (List[Tuple[Union[str, RecordID], Dict[str, Any]]]) the records and their combined updates
+        :return: (Query) one `UPDATE ... MERGE` statement per record
+        """
+        statement = "UPSERT" if self.upsert is True else "UPDATE"
+        statements = []
+        vars: Dict[str, Any] = {}
+        for index, (record, data) in enumerate(writes):
+            table, id = record_key(record)
+            vars[f"sblpy_table_{index}"] = table
+            vars[f"sblpy_id_{index}"] = id
+            vars[f"sblpy_data_{index}"] = data
+            statements.append(
+                f"{statement} type::thing($sblpy_table_{index}, $sblpy_id_{index}) "
+                f"MERGE $sblpy_data_{index} RETURN NONE;"
+            )
+        return Query("\n".join(statements), vars, self.priority)
+
+    async def _write(self, writes: List[Tuple[Union[str, RecordID], Dict[str, Any]]]) -> int:
+        """
+        Sends the updates of a flush and reports which were written.
+
+        :param writes: (List[Tuple[Union[str, RecordID], Dict[str, Any]]]) the records and their combined updates
+        :return: (int) the number of records written
+        """
+        try:
+            response = await self.pool.execute(self.query(writes), self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self._report_error(dict(writes), error)
+            return 0
+        if response.error is not None:
+            self._report_error(dict(writes), response.error)
+            return 0
+        written = []
+        failed: Dict[Union[str, RecordID], Dict[str, Any]] = {}
+        errors = []
+        statuses = response.statuses
+        results = response.result
+        for index, (record, data) in enumerate(writes):
+            if index < len(statuses) and statuses[index] == "OK":
+                written.append(record)
+            else:
+                failed[record] = data
+                errors.append(results[index].get("result") if index < len(statuses) else "no result")
+        self.flushed += len(written)
+        if len(written) > 0 and self.on_flush is not None:
+            try:
+                self.on_flush(written)
+            except Exception:
+                logger.exception("the on_flush callback of a write-behind buffer failed")
+        if len(failed) > 0:
+            self._report_error(failed, errors[0] if len(errors) == 1 else errors)
+        return len(written)
+
+    def _report_error(self, failed: Dict[Union[str, RecordID], Dict[str, Any]], error: Any) -> None:
+        """
+        Counts the updates that failed and hands them to `on_error`, or logs them if there is no callback.
+
+        :param failed: (Dict[Union[str, RecordID], Dict[str, Any]]) the records and updates that failed
+        :param error: (Any) the error of the flush, or the errors of the statements that failed
+        :return: None
+        """
+        self.failed += len(failed)
+        if self.on_error is None:
+            logger.warning("a write-behind buffer failed to write %s records: %s", len(failed), error)
+            return
+        try:
+            self.on_error(failed, error)
+        except Exception:
+            logger.exception("the on_error callback of a write-behind buffer failed")
+
+    async def __aenter__(self) -> "WriteBehindBuffer":
+        """Starts the background flushes when entering the context manager."""
+        self.start()
+        return self
+
+    async def __aexit__(
+            self,
+            exc_type: Optional[Type[BaseException]],
+            exc_value: Optional[BaseException],
+            traceback: Optional[TracebackType]
+    ) -> None:
+        """Flushes the pending updates when exiting the context manager."""
+        await self.close()
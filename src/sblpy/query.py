@@ -1,11 +1,38 @@
 """
 The query module contains the Query class.
 """
+import re
 import uuid
 from typing import Any, Dict, Optional, List
 
 from sblpy.sql_adapter import SqlAdapter
 
+# String literals and comments are blanked before the end of a query is looked for
+STRING_LITERAL = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*\"""", re.DOTALL)
+COMMENT = re.compile(r"--[^\n]*|//[^\n]*|#[^\n]*|/\*.*?\*/", re.DOTALL)
+TIMEOUT_CLAUSE = re.compile(r"\bTIMEOUT\s+(?:\d|\$)", re.IGNORECASE)
+
+
+def _blank(pattern: re.Pattern, sql: str, fill: str) -> str:
+    """
+    Overwrites the matches of a pattern, keeping the positions of the rest of a query.
+
+    :param pattern: (re.Pattern) the pattern of the parts to blank
+    :param sql: (str) the query
+    :param fill: (str) the character the matches are overwritten with
+    :return: (str) the query with the matches blanked
+    """
+    return pattern.sub(lambda match: fill * len(match.group(0)), sql)
+
+
+class Priority:
+    """
+    The priority classes of queries sent through the connection pool, lower values are served first.
+    """
+    INTERACTIVE: int = 0
+    NORMAL: int = 1
+    BATCH: int = 2
+
 
 class Query:
     """
@@ -15,17 +42,29 @@ class Query:
         sql: The SQL query to run.
         _vars: The variables to use in the query.
         id: The ID of the query.
+        priority: The priority class of the query in the connection pool.
+        tenant: The label the query is fairly queued under in the connection pool.
     """
-    def __init__(self, sql: str, vars: Optional[Dict[str, Any]] = None) -> None:
+    def __init__(
+            self,
+            sql: str,
+            vars: Optional[Dict[str, Any]] = None,
+            priority: int = Priority.NORMAL,
+            tenant: Optional[str] = None
+    ) -> None:
         """
         The constructor for the Query class.
 
         :param sql: (str) the SQL query to run
         :param vars: (Optional[Dict[str, Any]]) the variables to use in the query
+        :param priority: (int) the priority class of the query in the connection pool (see `Priority`)
+        :param tenant: (Optional[str]) the label the query is fairly queued under in the connection pool
         """
         self.sql: str = sql
         self._vars: Optional[Dict[str, Any]] = vars
         self.id: str = str(uuid.uuid4())
+        self.priority: int = priority
+        self.tenant: Optional[str] = tenant
 
     @staticmethod
     def from_docstring(docstring: str) -> "Query":
@@ -57,6 +96,25 @@ class Query:
         """
         return Query(SqlAdapter.from_file(file_path))
 
+    def with_timeout(self, timeout: float) -> "Query":
+        """
+        Creates a copy of the query with a SurrealQL `TIMEOUT` clause so the database abandons it in time.
+
+        # Notes
+        The clause is appended to the end of the SQL, before any trailing semicolons and comments, so
+        the query has to be a single statement that supports `TIMEOUT` such as `SELECT`, `CREATE`,
+        `UPDATE`, `RELATE` or `DELETE`. A query that already has a `TIMEOUT` clause is left as it is.
+
+        :param timeout: (float) the seconds the database has to run the query
+        :return: (Query) the query object with the timeout clause, or this query if it already has one
+        """
+        # string literals are kept as text so a query ending in one is not cut, comments become whitespace
+        code = _blank(COMMENT, _blank(STRING_LITERAL, self.sql, "_"), " ")
+        if TIMEOUT_CLAUSE.search(code) is not None:
+            return self
+        sql = self.sql[:len(code.rstrip(" \t\r\n;"))]
+        return Query(f"{sql} TIMEOUT {max(int(timeout * 1000), 1)}ms;", self._vars, self.priority, self.tenant)
+
     @property
     def vars(self) -> Dict[str, Any]:
         if self._vars is None:
@@ -0,0 +1,186 @@
+"""
+Defines the response returned by the connection pool, which decodes its result lazily.
+"""
+from collections.abc import Mapping
+from typing import Any, Iterator, List, Optional, Union
+
+from sblpy.codec import Codec
+from sblpy.stream import open_record_stream, unpack_records
+
+
+class Response(Mapping):
+    """
+    A raw response from the database that is only decoded as far as it is read.
+
+    # Notes
+    The id of the response, whether it is an error and whether any of its statements failed are
+    worked out from the frame without decoding the result, which is decoded the first time it is
+    read. The response can still be read like the dictionary it replaces, for instance
+    `response["result"][0]["result"]`, and `records` decodes the records of the first statement one
+    at a time. `raw` and `raw_result` give the encoded frame and result for passing straight through,
+    for instance to the body of an HTTP response, without decoding and encoding them again.
+
+    The response is a read only `Mapping` rather than the `dict` the pool used to return, so it
+    cannot be changed, `isinstance(response, dict)` is False and `json.dumps` does not accept it.
+    `to_dict` decodes the frame into a `dict` of its own for code that needs one.
+
+    Attributes:
+        id: The id of the request the response answers.
+        codec: The codec the frame was encoded with.
+    """
+    __slots__ = ("id", "codec", "_frame", "_raw_result", "_decoded", "_result", "_result_decoded")
+
+    def __init__(self, frame: Union[str, bytes], codec: Codec) -> None:
+        """
+        The constructor for the Response class.
+
+        :param frame: (Union[str, bytes]) the frame read off the socket
+        :param codec: (Codec) the codec the frame was encoded with
+        """
+        self.codec: Codec = codec
+        self._frame: Union[str, bytes] = frame
+        self._raw_result: Optional[Union[str, bytes]] = None
+        self._decoded: Optional[dict] = None
+        self._result: Any = None
+        self._result_decoded: bool = False
+        split = codec.split(frame)
+        if split is None:
+            # errors and unusual frames are small or rare so they are decoded in full
+            self._decoded = codec.decode(frame)
+            self.id: Any = self._decoded.get("id")
+        else:
+            self.id, self._raw_result = split
+
+    @property
+    def result(self) -> Any:
+        """
+        The result of the response, decoded the first time it is read.
+
+        :return: (Any) the decoded result, None if the response is an error
+        """
+        if self._raw_result is None:
+            return self._decoded.get("result")
+        if self._result_decoded is False:
+            self._result = self.codec.decode(self._raw_result)
+            self._result_decoded = True
+        return self._result
+
+    @property
+    def error(self) -> Any:
+        """
+        The error of a request that the database could not run at all, such as a query that does not parse.
+
+        :return: (Any) the error, None if the request ran
+        """
+        if self._raw_result is not None:
+            return None
+        return self._decoded.get("error")
+
+    @property
+    def ok(self) -> bool:
+        """
+        Whether the request ran and none of its statements failed, decoding the result only if one might have.
+
+        :return: (bool) True if the request succeeded
+        """
+        return self.error is None and len(self.errors) == 0
+
+    @property
+    def errors(self) -> List[Any]:
+        """
+        The results of the statements that failed, decoding the result only if one might have.
+
+        :return: (List[Any]) the error messages of the failed statements in order
+        """
+        if self._raw_result is not None and self.codec.may_have_errors(self._raw_result) is False:
+            return []
+        result = self.result
+        if not isinstance(result, list):
+            return []
+        return [
+            statement.get("result") for statement in result
+            if isinstance(statement, dict) and statement.get("status") == "ERR"
+        ]
+
+    @property
+    def statuses(self) -> List[str]:
+        """
+        The status of each statement of the request.
+
+        :return: (List[str]) "OK" or "ERR" for each statement in order
+        """
+        result = self.result
+        if not isinstance(result, list):
+            return []
+        return [statement.get("status") for statement in result if isinstance(statement, dict)]
+
+    def records(self) -> Iterator[Any]:
+        """
+        Yields the records of the first statement, decoding them one at a time rather than all at once.
+
+        :return: (Iterator[Any]) the records of the first statement, or its value if it is not an array
+        """
+        if self._raw_result is None:
+            yield from unpack_records(self._decoded)
+            return
+        if self._result_decoded is True:
+            yield from unpack_records({"id": self.id, "result": self._result})
+            return
+        stream = open_record_stream(self.codec)
+        yield from stream.feed(self._frame)
+        yield from stream.close()
+
+    @property
+    def raw(self) -> bytes:
+        """
+        The frame as it was read off the socket.
+
+        :return: (bytes) the encoded frame
+        """
+        if isinstance(self._frame, str):
+            return self._frame.encode("utf-8")
+        return bytes(self._frame)
+
+    @property
+    def raw_result(self) -> bytes:
+        """
+        The result as it was read off the socket, encoded again only if the frame had to be decoded in full.
+
+        :return: (bytes) the encoded result
+        """
+        raw_result = self._raw_result
+        if raw_result is None:
+            raw_result = self.codec.encode(self.result)
+        if isinstance(raw_result, str):
+            return raw_result.encode("utf-8")
+        return bytes(raw_result)
+
+    def to_dict(self) -> dict:
+        """
+        Decodes the whole frame into a dictionary, as the pool returned before it returned a Response.
+
+        :return: (dict) the decoded response, a new dictionary on each call so it can be changed freely
+        """
+        return self.codec.decode(self._frame)
+
+    def __getitem__(self, key: str) -> Any:
+        if self._raw_result is not None:
+            if key == "id":
+                return self.id
+            if key == "result":
+                return self.result
+            raise KeyError(key)
+        return self._decoded[key]
+
+    def __iter__(self) -> Iterator[str]:
+        if self._raw_result is not None:
+            return iter(("id", "result"))
+        return iter(self._decoded)
+
+    def __len__(self) -> int:
+        if self._raw_result is not None:
+            return 2
+        return len(self._decoded)
+
+    def __repr__(self) -> str:
+        return f"Response({dict(self)!r})"
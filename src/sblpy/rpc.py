@@ -0,0 +1,247 @@
+"""
+Defines the direct RPC methods of SurrealDB that read and write records without a SurrealQL query.
+
+# Notes
+A `query` is parsed and planned by the database before it runs, while `select`, `create`, `insert`,
+`update`, `merge`, `patch` and `delete` name the table or record they work on so the database goes
+straight to it. They are the cheapest way to fetch or write records by ID.
+"""
+import re
+import uuid
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sblpy.cbor import RecordID, Table
+from sblpy.errors import QueryError
+from sblpy.query import Priority
+
+# The id part of a `table:id` string that SurrealQL reads as a number
+INTEGER_ID = re.compile(r"-?\d+")
+# The methods that change records, so the query caches drop what they hold of the table
+WRITE_METHODS = frozenset({"create", "insert", "update", "merge", "patch", "delete"})
+
+Thing = Union[str, RecordID, Table]
+
+
+def record_key(record: Union[str, RecordID]) -> Tuple[str, Any]:
+    """
+    Splits a record ID into its table and the id part of the record in the table.
+
+    :param record: (Union[str, RecordID]) the record ID, as a RecordID or a `table:id` string
+    :return: (Tuple[str, Any]) the table and the id, a number if the string form is a whole number like in SurrealQL
+    """
+    if isinstance(record, RecordID):
+        return record.table_name, record.id
+    table, _, id = record.partition(":")
+    if table == "" or id == "":
+        raise ValueError(f"{record} is not a record ID of the form table:id")
+    if id[:1] in ("⟨", "`") and id[-1:] in ("⟩", "`"):
+        return table, id[1:-1]
+    if INTEGER_ID.fullmatch(id) is not None:
+        return table, int(id)
+    return table, id
+
+
+def thing_table(thing: Thing) -> str:
+    """
+    Reads the table of a table or record ID.
+
+    :param thing: (Thing) a table name, a `table:id` string, a RecordID or a Table
+    :return: (str) the name of the table
+    """
+    if isinstance(thing, RecordID):
+        return thing.table_name
+    if isinstance(thing, Table):
+        return thing.name
+    return thing.partition(":")[0]
+
+
+def encode_thing(thing: Thing, protocol: str) -> Any:
+    """
+    Converts a table or record ID to the form the database reads it in over a protocol.
+
+    # Notes
+    Over CBOR a string is only a string, so `table:id` strings are sent as a RecordID and other
+    strings as a Table. Over JSON the database parses strings itself, so RecordIDs and Tables are
+    sent as their `table:id` and table strings.
+
+    :param thing: (Thing) a table name, a `table:id` string, a RecordID or a Table
+    :param protocol: (str) the protocol of the codec, "json" or "cbor"
+    :return: (Any) the table or record ID to send
+    """
+    if protocol == "cbor":
+        if isinstance(thing, str):
+            if ":" in thing:
+                return RecordID(*record_key(thing))
+            return Table(thing)
+        return thing
+    if isinstance(thing, (RecordID, Table)):
+        return str(thing)
+    return thing
+
+
+class RpcCall:
+    """
+    Defines a call of a direct RPC method of the database.
+
+    Attributes:
+        method: The name of the RPC method, such as "select".
+        params: The parameters of the method, the first is the table or record ID it works on.
+        id: The ID of the call.
+        priority: The priority class of the call in the connection pool.
+        tenant: The label the call is fairly queued under in the connection pool.
+    """
+    def __init__(
+            self,
+            method: str,
+            params: List[Any],
+            priority: int = Priority.NORMAL,
+            tenant: Optional[str] = None
+    ) -> None:
+        """
+        The constructor for the RpcCall class.
+
+        :param method: (str) the name of the RPC method, such as "select"
+        :param params: (List[Any]) the parameters of the method, the first is the table or record ID it works on
+        :param priority: (int) the priority class of the call in the connection pool (see `Priority`)
+        :param tenant: (Optional[str]) the label the call is fairly queued under in the connection pool
+        """
+        self.method: str = method
+        self.params: List[Any] = params
+        self.id: str = str(uuid.uuid4())
+        self.priority: int = priority
+        self.tenant: Optional[str] = tenant
+
+    @property
+    def table(self) -> str:
+        """
+        The table the call works on.
+
+        :return: (str) the name of the table
+        """
+        return thing_table(self.params[0])
+
+    @property
+    def writes(self) -> bool:
+        """
+        Whether the call changes records.
+
+        :return: (bool) True for every method but select
+        """
+        return self.method in WRITE_METHODS
+
+    def for_protocol(self, protocol: str) -> "RpcCall":
+        """
+        Creates a copy of the call with its table or record ID in the form the database reads over a protocol.
+
+        :param protocol: (str) the protocol of the codec, "json" or "cbor"
+        :return: (RpcCall) the call to send
+        """
+        call = RpcCall(self.method, [encode_thing(self.params[0], protocol)] + self.params[1:], self.priority, self.tenant)
+        call.id = self.id
+        return call
+
+    @property
+    def query_params(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "params": self.params
+        }
+
+
+def unpack_result(response: dict, method: str) -> Any:
+    """
+    Extracts the result from the response of a direct RPC method.
+
+    :param response: (dict) the raw response from the database
+    :param method: (str) the name of the method, for the error message
+    :return: (Any) the records the method returned
+    """
+    error = response.get("error")
+    if error is not None:
+        message = error.get("message") if isinstance(error, dict) else error
+        raise QueryError(f"error calling {method}: {message}")
+    return response.get("result")
+
+
+class RpcMethods:
+    """
+    Adds the direct RPC methods to an interface that implements `call`.
+
+    # Notes
+    The connections return the result of the method and raise an exception if it failed, while the
+    connection pool returns the raw `Response` like `execute`. On the async connection and the pool
+    the methods have to be awaited. Tables and record IDs can be passed as strings such as "user" and
+    "user:tobie", or as the `Table` and `RecordID` types of `sblpy.cbor`, over either protocol.
+    """
+    def call(self, rpc: RpcCall) -> Any:
+        raise NotImplementedError
+
+    def select(self, thing: Thing) -> Any:
+        """
+        Selects every record of a table or a record by its ID.
+
+        :param thing: (Thing) the table or record ID
+        :return: (Any) the records of the table or the record, None if it does not exist
+        """
+        return self.call(RpcCall("select", [thing]))
+
+    def create(self, thing: Thing, data: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Creates a record, with a random ID if a table is passed.
+
+        :param thing: (Thing) the table or record ID
+        :param data: (Optional[Dict[str, Any]]) the content of the record
+        :return: (Any) the record created
+        """
+        return self.call(RpcCall("create", [thing] if data is None else [thing, data]))
+
+    def insert(self, table: Union[str, Table], data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> Any:
+        """
+        Inserts one record or an array of records into a table in one call.
+
+        :param table: (Union[str, Table]) the table
+        :param data: (Union[Dict[str, Any], List[Dict[str, Any]]]) the record or records, with an `id` to choose their IDs
+        :return: (Any) the records inserted
+        """
+        return self.call(RpcCall("insert", [table, data]))
+
+    def update(self, thing: Thing, data: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Replaces the content of a record, or of every record of a table.
+
+        :param thing: (Thing) the table or record ID
+        :param data: (Optional[Dict[str, Any]]) the new content of the records
+        :return: (Any) the records updated
+        """
+        return self.call(RpcCall("update", [thing] if data is None else [thing, data]))
+
+    def merge(self, thing: Thing, data: Dict[str, Any]) -> Any:
+        """
+        Sets some fields of a record, or of every record of a table, leaving the others as they are.
+
+        :param thing: (Thing) the table or record ID
+        :param data: (Dict[str, Any]) the fields to set
+        :return: (Any) the records updated
+        """
+        return self.call(RpcCall("merge", [thing, data]))
+
+    def patch(self, thing: Thing, patches: List[Dict[str, Any]], diff: bool = False) -> Any:
+        """
+        Applies JSON patch operations to a record, or to every record of a table.
+
+        :param thing: (Thing) the table or record ID
+        :param patches: (List[Dict[str, Any]]) the operations, such as {"op": "replace", "path": "/name", "value": "Tobie"}
+        :param diff: (bool) whether to return the operations applied rather than the records
+        :return: (Any) the records updated, or the operations applied to them
+        """
+        return self.call(RpcCall("patch", [thing, patches, diff]))
+
+    def delete(self, thing: Thing) -> Any:
+        """
+        Deletes a record, or every record of a table.
+
+        :param thing: (Thing) the table or record ID
+        :return: (Any) the records deleted
+        """
+        return self.call(RpcCall("delete", [thing]))
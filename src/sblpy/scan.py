@@ -0,0 +1,223 @@
+"""
+Defines the keyset pagination used to stream the records of a table a page at a time.
+
+# Notes
+Each page is selected with a condition on the key of the last record of the previous page rather
+than a growing `START` offset, so every page costs the same however deep into the table it is. The
+key is the record ID, or the `order_by` field and then the record ID so records with the same value
+of the field are neither skipped nor repeated.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from sblpy.query import Query
+
+# The field the id part of the record ID of each record is selected as for the cursor
+CURSOR_FIELD = "sblpy_cursor"
+# A field name or a path of field names, interpolated into the query so nothing else is allowed
+FIELD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*")
+ORDER_PATTERN = re.compile(rf"({FIELD_PATTERN.pattern})(?:\s+(ASC|DESC))?", re.IGNORECASE)
+
+
+def field_value(record: Dict[str, Any], path: str) -> Any:
+    """
+    Reads a field of a record by its path.
+
+    :param record: (Dict[str, Any]) the record to read the field of
+    :param path: (str) the name of the field, with dots between the names of nested fields
+    :return: (Any) the value of the field, None if it is not set
+    """
+    value: Any = record
+    for name in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(name)
+    return value
+
+
+class TableScan:
+    """
+    Builds the queries of a keyset paginated scan of a table, one page after another.
+
+    # Notes
+    `query` builds the query of the next page and `advance` moves the cursor past a page once its
+    records have arrived. The scan is done once a page comes back with fewer than `batch_size`
+    records. The id part of the record ID of each record is selected alongside it so the cursor is
+    sent back with the type it has in the database, whatever the protocol. The `order_by` value of
+    the last record is sent back as it was received, so with the JSON protocol order by a field that
+    JSON keeps the type of, such as a number or a string, and use the CBOR protocol for datetimes.
+
+    `start` and `end` limit the scan to a range of the key, the `order_by` field or else the id part
+    of the record ID, so a table can be split into ranges that are scanned side by side.
+
+    Attributes:
+        table: The name of the table to scan.
+        batch_size: The maximum number of records in each page.
+        where: The SurrealQL condition the records have to meet, None for every record.
+        order_by: The field the records are ordered by before their record ID, None to order by record ID.
+        descending: Whether the records are returned in descending order.
+        vars: The variables used in the condition.
+        start: The lowest key of the records scanned, None for no lower bound.
+        end: The key the records scanned are below, None for no upper bound.
+        done: Whether the last page has been read.
+    """
+    def __init__(
+            self,
+            table: str,
+            batch_size: int = 1000,
+            where: Optional[str] = None,
+            order_by: Optional[str] = None,
+            vars: Optional[Dict[str, Any]] = None,
+            start: Any = None,
+            end: Any = None
+    ) -> None:
+        """
+        The constructor for the TableScan class.
+
+        :param table: (str) the name of the table to scan
+        :param batch_size: (int) the maximum number of records in each page
+        :param where: (Optional[str]) the SurrealQL condition the records have to meet, such as "age > $age"
+        :param order_by: (Optional[str]) the field to order the records by, optionally followed by ASC or DESC
+        :param vars: (Optional[Dict[str, Any]]) the variables used in the condition
+        :param start: (Any) the lowest value of the `order_by` field, or the id part of the record ID,
+                            of the records scanned (defaults to no lower bound)
+        :param end: (Any) the value of the `order_by` field, or the id part of the record ID, that the
+                          records scanned are below (defaults to no upper bound)
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size has to be at least 1, not {batch_size}")
+        self.table: str = table
+        self.batch_size: int = batch_size
+        self.where: Optional[str] = where
+        self.order_by: Optional[str] = None
+        self.descending: bool = False
+        if order_by is not None:
+            match = ORDER_PATTERN.fullmatch(order_by.strip())
+            if match is None:
+                raise ValueError(f"order_by {order_by!r} is not a field name optionally followed by ASC or DESC")
+            self.order_by = match.group(1)
+            self.descending = (match.group(2) or "ASC").upper() == "DESC"
+        self.vars: Dict[str, Any] = dict(vars) if vars is not None else {}
+        self.start: Any = start
+        self.end: Any = end
+        self.done: bool = False
+        self._after: Any = None
+        self._last: Any = None
+        self._started: bool = False
+
+    def query(self) -> Query:
+        """
+        Builds the query of the next page.
+
+        :return: (Query) the query selecting the page after the last one that was read
+        """
+        direction = "DESC" if self.descending is True else "ASC"
+        beyond = "<" if self.descending is True else ">"
+        conditions = []
+        if self.where is not None:
+            conditions.append(f"({self.where})")
+        vars = dict(self.vars)
+        vars["sblpy_table"] = self.table
+        key = "type::thing($sblpy_table, {})" if self.order_by is None else "{}"
+        key_field = "id" if self.order_by is None else self.order_by
+        if self.start is not None:
+            vars["sblpy_start"] = self.start
+            conditions.append(f"{key_field} >= {key.format('$sblpy_start')}")
+        if self.end is not None:
+            vars["sblpy_end"] = self.end
+            conditions.append(f"{key_field} < {key.format('$sblpy_end')}")
+        if self._started is True:
+            vars["sblpy_after"] = self._after
+            after = f"id {beyond} type::thing($sblpy_table, $sblpy_after)"
+            if self.order_by is None:
+                conditions.append(after)
+            else:
+                vars["sblpy_last"] = self._last
+                conditions.append(
+                    f"({self.order_by} {beyond} $sblpy_last OR ({self.order_by} = $sblpy_last AND {after}))"
+                )
+        order = f"id {direction}"
+        if self.order_by is not None:
+            order = f"{self.order_by} {direction}, {order}"
+        sql = f"SELECT *, meta::id(id) AS {CURSOR_FIELD} FROM type::table($sblpy_table)"
+        if len(conditions) > 0:
+            sql += f" WHERE {' AND '.join(conditions)}"
+        sql += f" ORDER BY {order} LIMIT {self.batch_size};"
+        return Query(sql, vars)
+
+    def advance(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Moves the cursor past a page that has been read.
+
+        :param records: (List[Dict[str, Any]]) the records of the page
+        :return: (List[Dict[str, Any]]) the records without the field selected for the cursor
+        """
+        self._started = True
+        if len(records) < self.batch_size:
+            self.done = True
+        for record in records:
+            self._after = record.pop(CURSOR_FIELD, None)
+        if len(records) > 0 and self.order_by is not None:
+            self._last = field_value(records[-1], self.order_by)
+        return records
+
+
+def bound_query(
+        table: str,
+        field: Optional[str] = None,
+        where: Optional[str] = None,
+        vars: Optional[Dict[str, Any]] = None,
+        descending: bool = False
+) -> Query:
+    """
+    Builds the query of the lowest or highest key of a table.
+
+    :param table: (str) the name of the table
+    :param field: (Optional[str]) the field that is the key, None for the id part of the record ID
+    :param where: (Optional[str]) the SurrealQL condition the records have to meet
+    :param vars: (Optional[Dict[str, Any]]) the variables used in the condition
+    :param descending: (bool) whether to select the highest key rather than the lowest
+    :return: (Query) the query selecting the key, its result is empty if no record meets the condition
+    """
+    if field is not None and FIELD_PATTERN.fullmatch(field) is None:
+        raise ValueError(f"field {field!r} is not a field name")
+    key = "meta::id(id)" if field is None else field
+    order = "id" if field is None else field
+    conditions = [] if field is None else [f"{field} != NONE"]
+    if where is not None:
+        conditions.append(f"({where})")
+    query_vars = dict(vars) if vars is not None else {}
+    query_vars["sblpy_table"] = table
+    sql = f"SELECT {key} AS {CURSOR_FIELD}, {order} FROM type::table($sblpy_table)"
+    if len(conditions) > 0:
+        sql += f" WHERE {' AND '.join(conditions)}"
+    sql += f" ORDER BY {order} {'DESC' if descending is True else 'ASC'} LIMIT 1;"
+    return Query(sql, query_vars)
+
+
+def split_range(low: Union[int, float], high: Union[int, float], parts: int) -> List[Tuple[Any, Any]]:
+    """
+    Splits the range of a numeric key into ranges of equal width.
+
+    # Notes
+    The first range has no lower bound and the last no upper bound, so records written outside of
+    `low` and `high` after they were read are still scanned.
+
+    :param low: (Union[int, float]) the lowest key
+    :param high: (Union[int, float]) the highest key
+    :param parts: (int) the number of ranges
+    :return: (List[Tuple[Any, Any]]) the start and end of each range in ascending order
+    """
+    if parts < 1:
+        raise ValueError(f"parts has to be at least 1, not {parts}")
+    width = (high - low) / parts
+    bounds: List[Any] = []
+    for part in range(1, parts):
+        bound = low + width * part
+        if isinstance(low, int) and isinstance(high, int):
+            bound = int(bound)
+        if bound > low and (len(bounds) == 0 or bound > bounds[-1]):
+            bounds.append(bound)
+    starts = [None] + bounds
+    ends = bounds + [None]
+    return list(zip(starts, ends))
@@ -0,0 +1,352 @@
+"""
+Defines the incremental decoders that yield the records of a response as they are parsed.
+
+# Notes
+A SELECT returns its rows as the result of its statement, an array inside the response. Decoding
+the response in one go builds every row before the first one can be used, so the peak memory of a
+large SELECT is the frame and every row it decodes to. The decoders here step into the array and
+decode one record at a time as the frame is read, so the rows can be handled and dropped as they
+arrive and the peak memory is the frame and the rows the caller holds on to.
+
+Only the records of the first statement are streamed. A response that does not look like the
+successful result of an array, such as an error or the result of a statement returning a single
+value, is decoded in full and handled the same way as `query`.
+"""
+import codecs
+import json
+import re
+from typing import Any, Iterator, List, Optional, Union
+
+from sblpy import cbor
+from sblpy.codec import CborCodec, Codec, JsonCodec
+from sblpy.errors import QueryError, SurrealLiteError
+
+# SurrealDB sorts the keys of a response so the records of the first statement follow its id
+JSON_RECORDS = re.compile(
+    r'\{\s*"id"\s*:\s*(?:"[^"\\]*"|-?\d+)\s*,\s*"result"\s*:\s*\[\s*\{\s*"result"\s*:\s*\['
+)
+JSON_WHITESPACE = re.compile(r"\s*")
+# A response that has not reached its records after this many characters or bytes is decoded in full
+PREFIX_LIMIT = 4096
+
+
+def unpack_records(response: dict) -> Iterator[Any]:
+    """
+    Yields the records of the first statement of a response that has been decoded in full.
+
+    :param response: (dict) the decoded response
+    :return: (Iterator[Any]) the records of the first statement, or its value if it is not an array
+    """
+    if response.get("result") is None:
+        raise QueryError(f"error querying no result: {response}")
+    statements = response["result"]
+    if statements[0].get("status") is not None and statements[0].get("status") == "ERR":
+        raise QueryError(f"error querying: {statements[0].get('result')}")
+    result = statements[0]["result"]
+    if isinstance(result, list):
+        yield from result
+    else:
+        yield result
+
+
+class RecordStream:
+    """
+    Decodes the records of the first statement of a response as its frame is fed in.
+
+    # Notes
+    This base class keeps the frame until it ends and then decodes it in full, which is what the
+    codecs without an incremental decoder fall back to. `feed` is called with each part of the frame
+    as it is read and `close` once the frame has ended, both return an iterator of the records they
+    complete which has to be consumed before the next part is fed.
+
+    Attributes:
+        codec: The codec the frame is encoded with.
+    """
+    def __init__(self, codec: Codec) -> None:
+        """
+        The constructor for the RecordStream class.
+
+        :param codec: (Codec) the codec the frame is encoded with
+        """
+        self.codec: Codec = codec
+        self._chunks: List[Union[str, bytes]] = []
+
+    def feed(self, chunk: Union[str, bytes]) -> Iterator[Any]:
+        """
+        Feeds the next part of the frame.
+
+        :param chunk: (Union[str, bytes]) the next part of the frame
+        :return: (Iterator[Any]) the records completed by the part, decoded as they are iterated over
+        """
+        self._chunks.append(chunk)
+        return iter(())
+
+    def close(self) -> Iterator[Any]:
+        """
+        Ends the frame, raising an error if the query failed.
+
+        :return: (Iterator[Any]) the records that were left
+        """
+        chunks = self._chunks
+        self._chunks = []
+        if len(chunks) == 0:
+            raise SurrealLiteError("the response ended before it started")
+        frame = chunks[0] if len(chunks) == 1 else chunks[0][:0].join(chunks)
+        return unpack_records(self.codec.decode(frame))
+
+
+class JsonRecordStream(RecordStream):
+    """
+    Decodes the records of a JSON response one at a time as its frame is fed in.
+
+    Attributes:
+        codec: The codec the frame is encoded with.
+    """
+    def __init__(self, codec: Codec) -> None:
+        """
+        The constructor for the JsonRecordStream class.
+
+        :param codec: (Codec) the codec the frame is encoded with
+        """
+        super().__init__(codec)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer: str = ""
+        self._position: int = 0
+        # "prefix" before the records are reached, "records" while they are decoded, "done" after them
+        # and "full" when the frame is decoded in full
+        self._state: str = "prefix"
+        self._separated: bool = True
+
+    def feed(self, chunk: Union[str, bytes]) -> Iterator[Any]:
+        """
+        Feeds the next part of the frame.
+
+        :param chunk: (Union[str, bytes]) the next part of the frame
+        :return: (Iterator[Any]) the records completed by the part
+        """
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            chunk = self._text.decode(bytes(chunk))
+        if self._state == "done":
+            return
+        if self._state == "full":
+            self._chunks.append(chunk)
+            return
+        if self._position == len(self._buffer):
+            self._buffer = chunk
+        else:
+            self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        if self._state == "prefix":
+            match = JSON_RECORDS.match(self._buffer)
+            if match is None:
+                if len(self._buffer) >= PREFIX_LIMIT:
+                    self._state = "full"
+                    self._chunks.append(self._buffer)
+                    self._buffer = ""
+                return
+            self._state = "records"
+            self._position = match.end()
+        yield from self._records()
+
+    def _records(self) -> Iterator[Any]:
+        """
+        Decodes the records that are complete in the buffer.
+
+        :return: (Iterator[Any]) the decoded records
+        """
+        buffer = self._buffer
+        length = len(buffer)
+        while True:
+            position = JSON_WHITESPACE.match(buffer, self._position).end()
+            if position == length:
+                self._position = position
+                return
+            character = buffer[position]
+            if character == "]":
+                self._state = "done"
+                self._buffer = ""
+                self._position = 0
+                return
+            if self._separated is False:
+                if character != ",":
+                    raise SurrealLiteError(f"unexpected {character!r} between the records of the response")
+                self._position = position + 1
+                self._separated = True
+                continue
+            try:
+                record, end = self._decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the record has not been read in full yet
+                self._position = position
+                return
+            following = JSON_WHITESPACE.match(buffer, end).end()
+            if following == length or buffer[following] not in ",]":
+                # a number cut short, such as "1." of "1.5", decodes without an error so a record is
+                # only taken once the "," or "]" after it has been read
+                self._position = position
+                return
+            self._position = end
+            self._separated = False
+            yield record
+
+    def close(self) -> Iterator[Any]:
+        """
+        Ends the frame, raising an error if the query failed.
+
+        :return: (Iterator[Any]) the records that were left
+        """
+        tail = self._text.decode(b"", final=True)
+        if self._state == "prefix":
+            self._chunks.append(self._buffer[self._position:])
+            self._state = "full"
+        if self._state == "full":
+            self._chunks.append(tail)
+            return super().close()
+        if self._state == "records":
+            self._buffer = self._buffer[self._position:] + tail + " "
+            self._position = 0
+            records = list(self._records())
+            if self._state != "done":
+                raise SurrealLiteError("the response ended part way through its records")
+            return iter(records)
+        return iter(())
+
+
+class CborRecordStream(RecordStream):
+    """
+    Decodes the records of a CBOR response one at a time as its frame is fed in.
+
+    Attributes:
+        codec: The codec the frame is encoded with.
+    """
+    def __init__(self, codec: Codec) -> None:
+        """
+        The constructor for the CborRecordStream class.
+
+        :param codec: (Codec) the codec the frame is encoded with
+        """
+        super().__init__(codec)
+        self._buffer: bytes = b""
+        self._position: int = 0
+        self._state: str = "prefix"
+        # the number of records left, None for an array of indefinite length
+        self._remaining: Optional[int] = None
+
+    def feed(self, chunk: Union[str, bytes]) -> Iterator[Any]:
+        """
+        Feeds the next part of the frame.
+
+        :param chunk: (Union[str, bytes]) the next part of the frame
+        :return: (Iterator[Any]) the records completed by the part
+        """
+        if isinstance(chunk, str):
+            raise SurrealLiteError(f"expected a binary CBOR frame but received text: {chunk[:200]}")
+        if self._state == "done":
+            return
+        if self._state == "full":
+            self._chunks.append(bytes(chunk))
+            return
+        if self._position == len(self._buffer):
+            self._buffer = bytes(chunk)
+        else:
+            self._buffer = self._buffer[self._position:] + bytes(chunk)
+        self._position = 0
+        if self._state == "prefix":
+            try:
+                position = self._prefix()
+            except cbor.CborIncompleteError:
+                if len(self._buffer) < PREFIX_LIMIT:
+                    return
+                position = None
+            except cbor.CborError:
+                position = None
+            if position is None:
+                self._state = "full"
+                self._chunks.append(self._buffer)
+                self._buffer = b""
+                return
+            self._state = "records"
+            self._position = position
+        yield from self._records()
+
+    def _prefix(self) -> Optional[int]:
+        """
+        Steps into the records of the first statement.
+
+        :return: (Optional[int]) the index of the first record, None if the response has to be decoded in full
+        """
+        data = self._buffer
+        major, length, position = cbor.decode_head(data, 0)
+        if major != 5 or length != 2:
+            return None
+        (key, _, result_key), position = cbor.decode_items(data, position, 3)
+        if key != "id" or result_key != "result":
+            return None
+        major, length, position = cbor.decode_head(data, position)
+        if major != 4 or length == 0:
+            return None
+        major, length, position = cbor.decode_head(data, position)
+        if major != 5:
+            return None
+        (key,), position = cbor.decode_items(data, position, 1)
+        if key != "result":
+            return None
+        major, length, position = cbor.decode_head(data, position)
+        if major != 4:
+            return None
+        self._remaining = length
+        return position
+
+    def _records(self) -> Iterator[Any]:
+        """
+        Decodes the records that are complete in the buffer.
+
+        :return: (Iterator[Any]) the decoded records
+        """
+        buffer = self._buffer
+        while True:
+            if self._remaining == 0 or (
+                    self._remaining is None and buffer[self._position:self._position + 1] == b"\xff"
+            ):
+                self._state = "done"
+                self._buffer = b""
+                self._position = 0
+                return
+            try:
+                (record,), end = cbor.decode_items(buffer, self._position, 1)
+            except cbor.CborIncompleteError:
+                return
+            self._position = end
+            if self._remaining is not None:
+                self._remaining -= 1
+            yield record
+
+    def close(self) -> Iterator[Any]:
+        """
+        Ends the frame, raising an error if the query failed.
+
+        :return: (Iterator[Any]) the records that were left
+        """
+        if self._state == "prefix":
+            self._chunks.append(self._buffer[self._position:])
+            self._state = "full"
+        if self._state == "full":
+            return super().close()
+        if self._state == "records":
+            raise SurrealLiteError("the response ended part way through its records")
+        return iter(())
+
+
+def open_record_stream(codec: Codec) -> RecordStream:
+    """
+    Opens the incremental decoder of a codec.
+
+    :param codec: (Codec) the codec the frame is encoded with
+    :return: (RecordStream) the decoder, one that decodes the frame in full for a codec it does not know
+    """
+    if isinstance(codec, JsonCodec):
+        return JsonRecordStream(codec)
+    if isinstance(codec, CborCodec):
+        return CborRecordStream(codec)
+    return RecordStream(codec)
@@ -0,0 +1,115 @@
+import asyncio
+from unittest import TestCase, main
+
+from sblpy.codec import get_codec
+from sblpy.pool.batcher import QueryBatcher, batchable, rename_vars
+from sblpy.query import Query
+from sblpy.response import Response
+
+CODEC = get_codec("json")
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.queries = []
+
+    async def send(self, query):
+        self.queries.append(query)
+        await asyncio.sleep(0.001)
+        if "PARSEERR" in query.sql:
+            return Response(CODEC.encode({"id": query.id, "error": {"code": -32000, "message": "parse error"}}), CODEC)
+        result = []
+        for statement in query.sql.split(";\n"):
+            statement = statement.rstrip(";")
+            if statement == "FAIL":
+                result.append({"result": "boom", "status": "ERR"})
+            else:
+                result.append({"result": statement, "status": "OK"})
+        return Response(CODEC.encode({"id": query.id, "result": result}), CODEC)
+
+
+class TestBatchable(TestCase):
+
+    def test_batchable(self):
+        self.assertTrue(batchable("CREATE user SET name = 'a;b';"))
+        self.assertTrue(batchable("UPDATE user:1 SET visits += 1"))
+        self.assertFalse(batchable("CREATE user; CREATE post;"))
+        self.assertFalse(batchable("BEGIN TRANSACTION; CREATE user; COMMIT TRANSACTION;"))
+        self.assertFalse(batchable("LET $x = 1"))
+        self.assertFalse(batchable("SELECT * FROM user -- ; DELETE user"))
+
+    def test_rename_vars(self):
+        self.assertEqual(
+            ("CREATE user SET name = $sblpy_0_name, note = '$name', auth = $auth", {"sblpy_0_name": "a"}),
+            rename_vars("CREATE user SET name = $name, note = '$name', auth = $auth", {"name": "a"}, "sblpy_0_")
+        )
+
+
+class TestQueryBatcher(TestCase):
+
+    def test_batch(self):
+        async def run_test():
+            database = FakeDatabase()
+            batcher = QueryBatcher(database.send, CODEC, window=0.01, max_statements=3)
+            responses = await asyncio.gather(*[
+                batcher.submit(Query("CREATE user SET n = $n", {"n": i})) for i in range(4)
+            ])
+            self.assertEqual(2, len(database.queries))
+            self.assertEqual(
+                "CREATE user SET n = $sblpy_0_n;\nCREATE user SET n = $sblpy_1_n;\nCREATE user SET n = $sblpy_2_n;",
+                database.queries[0].sql
+            )
+            self.assertEqual({"sblpy_0_n": 0, "sblpy_1_n": 1, "sblpy_2_n": 2}, database.queries[0].vars)
+            # the last query was sent on its own once the window passed
+            self.assertEqual("CREATE user SET n = $n", database.queries[1].sql)
+            self.assertEqual(
+                "CREATE user SET n = $sblpy_1_n",
+                responses[1]["result"][0]["result"]
+            )
+            self.assertEqual(1, batcher.batches)
+            self.assertEqual(3, batcher.batched)
+        asyncio.run(run_test())
+
+    def test_errors(self):
+        async def run_test():
+            database = FakeDatabase()
+            batcher = QueryBatcher(database.send, CODEC, window=0.01)
+            responses = await asyncio.gather(batcher.submit(Query("FAIL")), batcher.submit(Query("CREATE user")))
+            self.assertEqual([False, True], [response.ok for response in responses])
+            # a batch refused as a whole is sent again one query at a time
+            responses = await asyncio.gather(batcher.submit(Query("PARSEERR")), batcher.submit(Query("CREATE user")))
+            self.assertEqual([False, True], [response.ok for response in responses])
+            self.assertEqual(4, len(database.queries))
+        asyncio.run(run_test())
+
+    def test_abandon(self):
+        async def run_test():
+            database = FakeDatabase()
+            batcher = QueryBatcher(database.send, CODEC, window=0.02)
+            results = await asyncio.gather(
+                batcher.submit(Query("CREATE user"), timeout=0.001),
+                batcher.submit(Query("CREATE post")),
+                return_exceptions=True
+            )
+            self.assertIsInstance(results[0], asyncio.TimeoutError)
+            self.assertEqual(["CREATE post"], [query.sql for query in database.queries])
+            with self.assertRaises(asyncio.TimeoutError):
+                await batcher.submit(Query("CREATE user"), timeout=0.001)
+            await asyncio.sleep(0.03)
+            self.assertEqual(1, len(database.queries))
+        asyncio.run(run_test())
+
+    def test_flush(self):
+        async def run_test():
+            database = FakeDatabase()
+            batcher = QueryBatcher(database.send, CODEC, window=10.0)
+            pending = asyncio.ensure_future(batcher.submit(Query("CREATE user")))
+            await asyncio.sleep(0)
+            await asyncio.gather(*batcher.flush())
+            self.assertTrue((await pending).ok)
+        asyncio.run(run_test())
+
+
+if __name__ == "__main__":
+    main()
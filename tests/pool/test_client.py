@@ -0,0 +1,83 @@
+import asyncio
+import time
+from unittest import TestCase, main
+
+from sblpy.errors import ConnectionDroppedError
+from sblpy.pool.client import PooledClient
+from sblpy.pool.connection_pool import ConnectionPool
+
+
+class TestPooledClient(TestCase):
+
+    def test_retry_in_flight_is_bounded(self):
+        async def run_test():
+            pool = ConnectionPool("localhost", 8000, "root", "root", retry_in_flight=True, max_retries=2)
+            client = PooledClient(pool, 0)
+            future = asyncio.get_running_loop().create_future()
+            pool.pending_responses["request"] = future
+            item = ("request", {"id": "request", "method": "query"}, 0.0)
+            for retries in range(1, 3):
+                client.sent = {"request": (item, 0.0)}
+                client.recover_in_flight()
+                item = pool.message_queue.get_nowait()
+                self.assertEqual(retries, item[3])
+                self.assertFalse(future.done())
+            # the request dropped the connection every time it was sent so it fails
+            client.sent = {"request": (item, 0.0)}
+            client.recover_in_flight()
+            self.assertEqual(0, pool.message_queue.qsize())
+            with self.assertRaises(ConnectionDroppedError):
+                await future
+            self.assertNotIn("request", pool.pending_responses)
+            self.assertEqual(1, pool.metrics.errors["dropped"])
+        asyncio.run(run_test())
+
+    def test_back_off_after_setup_error(self):
+        async def run_test():
+            pool = ConnectionPool("localhost", 8000, "root", "root", reconnect_backoff=0.001)
+            client = PooledClient(pool, 0)
+            self.assertTrue(await client.back_off(Exception("error signing in"), "setup"))
+            self.assertTrue(await client.back_off(Exception("error signing in"), "setup"))
+            self.assertEqual(2, client.failures)
+            self.assertEqual(2, client.reconnects)
+            self.assertEqual({"setup": 2}, pool.metrics.errors)
+            # a client that is shutting down does not reconnect
+            client.closing = True
+            self.assertFalse(await client.back_off(Exception("error signing in"), "setup"))
+        asyncio.run(run_test())
+
+    def test_request_waiting_for_token_is_requeued_on_drop(self):
+        class FakeWebsocket:
+            def __init__(self):
+                self.sent = []
+
+            async def send(self, payload):
+                self.sent.append(payload)
+
+        async def run_test():
+            pool = ConnectionPool("localhost", 8000, "root", "root", rate_limit=1, rate_burst=1)
+            client = PooledClient(pool, 0)
+            websocket = FakeWebsocket()
+            for request_id in ("first", "second"):
+                pool.pending_responses[request_id] = asyncio.get_running_loop().create_future()
+                await pool.message_queue.put(
+                    (request_id, {"id": request_id, "method": "query"}, time.monotonic())
+                )
+            sender = asyncio.create_task(client.send_messages(websocket, asyncio.Semaphore(2)))
+            while pool.message_queue.qsize() > 0:
+                await asyncio.sleep(0.01)
+            # the first request took the only token, the second is waiting for the next one
+            self.assertEqual(1, len(websocket.sent))
+            self.assertEqual(["first"], list(client.sent))
+            # the connection drops while the second request waits for its token
+            sender.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await sender
+            self.assertEqual(1, pool.message_queue.qsize())
+            self.assertEqual("second", pool.message_queue.get_nowait()[0])
+            self.assertFalse(pool.pending_responses["second"].done())
+        asyncio.run(run_test())
+
+
+if __name__ == "__main__":
+    main()
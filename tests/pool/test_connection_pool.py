@@ -1,8 +1,40 @@
 import asyncio
 from unittest import TestCase, main
 
-from sblpy.pool.connection_pool import execute_pooled_query, client_pool, NUM_CLIENTS, shutdown_pool
+from sblpy.cache import QueryCache
+from sblpy.codec import get_codec
+from sblpy.pool.connection_pool import (
+    execute_pooled_query, client_pool, NUM_CLIENTS, shutdown_pool, ConnectionPool
+)
+from sblpy.pool.write_behind import WriteBehindBuffer
+from sblpy.errors import ConnectionDroppedError, PoolOverloadedError, QueryTimeoutError
 from sblpy.query import Query
+from sblpy.response import Response
+
+CODEC = get_codec("json")
+
+
+class FakeDatabase:
+    """
+    Stands in for the `_send` of a pool, a read returns the rows as they were when it was sent after `delay`.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.rows = []
+        self.reads = 0
+
+    async def send(self, query, timeout=None, server_timeout=False):
+        if query.sql.startswith("CREATE"):
+            self.rows.append({"id": len(self.rows)})
+            result = []
+            delay = 0
+        else:
+            self.reads += 1
+            result = list(self.rows)
+            delay = self.delay
+        await asyncio.sleep(delay)
+        return Response(CODEC.encode({"id": query.id, "result": [{"result": result, "status": "OK"}]}), CODEC)
 
 
 class TestConnectionPool(TestCase):
@@ -37,6 +69,342 @@ class TestConnectionPool(TestCase):
             await shutdown_pool(number_of_clients=NUM_CLIENTS)
         asyncio.run(run_test())
 
+    def test_concurrent_query_pool(self):
+        async def run_test():
+            asyncio.create_task(client_pool(
+                "localhost",
+                8000,
+                "root",
+                "root",
+                number_of_clients=2,
+                max_in_flight=10
+            ))
+            _ = await execute_pooled_query(Query("CREATE user:tobie SET name = 'Tobie';"))
+            responses = await asyncio.gather(*[
+                execute_pooled_query(Query("SELECT * FROM user;")) for _ in range(50)
+            ])
+            for response in responses:
+                self.assertEqual(
+                    [{'id': 'user:tobie', 'name': 'Tobie'}],
+                    response["result"][0]["result"]
+                )
+            _ = await execute_pooled_query(Query("DELETE user;"))
+            await shutdown_pool(number_of_clients=2)
+        asyncio.run(run_test())
+
+    def test_multiple_pools(self):
+        async def run_test():
+            async with ConnectionPool(
+                "localhost", 8000, "root", "root", namespace="one", number_of_clients=2
+            ) as pool_one, ConnectionPool(
+                "localhost", 8000, "root", "root", namespace="two", number_of_clients=2
+            ) as pool_two:
+                _ = await pool_one.execute(Query("CREATE user:tobie SET name = 'Tobie';"))
+                response_one = await pool_one.execute(Query("SELECT * FROM user;"))
+                response_two = await pool_two.execute(Query("SELECT * FROM user;"))
+                self.assertEqual(
+                    [{'id': 'user:tobie', 'name': 'Tobie'}],
+                    response_one["result"][0]["result"]
+                )
+                self.assertEqual([], response_two["result"][0]["result"])
+                _ = await pool_one.execute(Query("DELETE user;"))
+            self.assertEqual({}, pool_one.clients)
+            self.assertEqual({}, pool_one.pending_responses)
+        asyncio.run(run_test())
+
+    def test_autoscale(self):
+        async def run_test():
+            async with ConnectionPool(
+                "localhost",
+                8000,
+                "root",
+                "root",
+                number_of_clients=1,
+                min_clients=1,
+                max_clients=3,
+                max_in_flight=1,
+                scale_up_queue_depth=5,
+                scale_up_after=0.1,
+                idle_timeout=0.2
+            ) as pool:
+                _ = await asyncio.gather(*[
+                    pool.execute(Query("SLEEP 10ms; SELECT * FROM user;")) for _ in range(200)
+                ])
+                self.assertGreater(pool.active_clients, 1)
+                await asyncio.sleep(2)
+                self.assertEqual(1, pool.active_clients)
+        asyncio.run(run_test())
+
+    def test_close_while_disconnected(self):
+        async def run_test():
+            pool = ConnectionPool("localhost", 1, "root", "root", number_of_clients=2, reconnect_backoff=0.01)
+            await pool.start()
+            await asyncio.sleep(0.1)
+            for client in pool.clients.values():
+                self.assertFalse(client.connected)
+            await asyncio.wait_for(pool.close(), 1)
+            self.assertEqual({}, pool.clients)
+        asyncio.run(run_test())
+
+    def test_close_fails_queued_queries(self):
+        async def run_test():
+            pool = ConnectionPool("localhost", 1, "root", "root", number_of_clients=2, reconnect_backoff=0.01)
+            await pool.start()
+            queued = asyncio.ensure_future(pool.execute(Query("SELECT * FROM user;")))
+            await asyncio.sleep(0.1)
+            self.assertEqual(1, pool.message_queue.qsize())
+            await asyncio.wait_for(pool.close(), 1)
+            # no client is left to send the query so it fails rather than waiting forever
+            with self.assertRaises(ConnectionDroppedError):
+                await asyncio.wait_for(queued, 1)
+            self.assertEqual(0, pool.message_queue.qsize())
+            self.assertEqual({}, pool.pending_responses)
+        asyncio.run(run_test())
+
+    def test_timeout(self):
+        async def run_test():
+            async with ConnectionPool("localhost", 8000, "root", "root", number_of_clients=1) as pool:
+                with self.assertRaises(QueryTimeoutError):
+                    await pool.execute(Query("SLEEP 500ms;"), timeout=0.1)
+                self.assertEqual({}, pool.pending_responses)
+
+                response = await pool.execute(Query("SELECT * FROM user"), timeout=1.0, server_timeout=True)
+                self.assertEqual([], response["result"][0]["result"])
+        asyncio.run(run_test())
+
+    def test_overflow_fail(self):
+        async def run_test():
+            async with ConnectionPool(
+                "localhost",
+                8000,
+                "root",
+                "root",
+                number_of_clients=1,
+                max_in_flight=1,
+                max_queue_size=2,
+                overflow="fail"
+            ) as pool:
+                responses = await asyncio.gather(
+                    *[pool.execute(Query("SLEEP 50ms;")) for _ in range(10)], return_exceptions=True
+                )
+                overloaded = [i for i in responses if isinstance(i, PoolOverloadedError)]
+                self.assertGreater(len(overloaded), 0)
+                self.assertEqual({}, pool.pending_responses)
+        asyncio.run(run_test())
+
+    def test_stats(self):
+        async def run_test():
+            async with ConnectionPool("localhost", 8000, "root", "root", number_of_clients=2) as pool:
+                _ = await asyncio.gather(*[pool.execute(Query("SELECT * FROM user;")) for _ in range(10)])
+                stats = pool.stats()
+                self.assertEqual(0, stats["queue_depth"])
+                self.assertEqual(10, stats["requests"])
+                self.assertEqual(10, stats["queue_wait"]["count"])
+                self.assertEqual(
+                    10, sum(client["recv"]["count"] for client in stats["clients"].values())
+                )
+                self.assertIn("sblpy_pool_requests_total", pool.prometheus())
+        asyncio.run(run_test())
+
+    def test_query_stream(self):
+        async def run_test():
+            async with ConnectionPool("localhost", 8000, "root", "root", number_of_clients=1) as pool:
+                await pool.execute(Query("CREATE user:tobie SET name = 'Tobie';"))
+                await pool.execute(Query("CREATE user:jaime SET name = 'Jaime';"))
+                records = [record async for record in pool.query_stream(Query("SELECT * FROM user;"))]
+                self.assertEqual(
+                    [{'id': 'user:jaime', 'name': 'Jaime'}, {'id': 'user:tobie', 'name': 'Tobie'}],
+                    records
+                )
+                await pool.execute(Query("DELETE user;"))
+        asyncio.run(run_test())
+
+    def test_stream(self):
+        async def run_test():
+            async with ConnectionPool("localhost", 8000, "root", "root", number_of_clients=2) as pool:
+                await asyncio.gather(*[
+                    pool.execute(Query(f"CREATE user:{i} SET name = 'user {i}';")) for i in range(25)
+                ])
+                records = [record async for record in pool.stream("user", batch_size=10)]
+                self.assertEqual(25, len({record["id"] for record in records}))
+                await pool.execute(Query("DELETE user;"))
+        asyncio.run(run_test())
+
+    def test_parallel_scan(self):
+        async def run_test():
+            async with ConnectionPool("localhost", 8000, "root", "root", number_of_clients=4) as pool:
+                await asyncio.gather(*[
+                    pool.execute(Query(f"CREATE user:{i} SET name = 'user {i}';")) for i in range(100)
+                ])
+                records = [record async for record in pool.parallel_scan("user", batch_size=10)]
+                self.assertEqual(100, len({record["id"] for record in records}))
+                records = [
+                    record async for record in pool.parallel_scan(
+                        "user", ranges=[(None, 50), (50, None)], batch_size=10, concurrency=2, ordered=True
+                    )
+                ]
+                self.assertEqual([f"user:{i}" for i in range(100)], [record["id"] for record in records])
+                await pool.execute(Query("DELETE user;"))
+        asyncio.run(run_test())
+
+
+    def test_coalesce_reads(self):
+        async def run_test():
+            async with ConnectionPool(
+                    "localhost", 8000, "root", "root", number_of_clients=2, coalesce_reads=True
+            ) as pool:
+                responses = await asyncio.gather(*[pool.execute(Query("SELECT * FROM user;")) for _ in range(10)])
+                self.assertEqual(1, len({id(response) for response in responses}))
+                self.assertEqual(1, pool.stats()["requests"])
+                self.assertEqual(9, pool.stats()["coalesced"])
+                # writes are never shared
+                await asyncio.gather(*[pool.execute(Query("CREATE user;")) for _ in range(3)])
+                self.assertEqual(4, pool.stats()["requests"])
+                await pool.execute(Query("DELETE user;"))
+        asyncio.run(run_test())
+
+
+    def test_batch_window(self):
+        async def run_test():
+            async with ConnectionPool(
+                    "localhost", 8000, "root", "root", number_of_clients=2, batch_window=0.01
+            ) as pool:
+                responses = await asyncio.gather(*[
+                    pool.execute(Query("CREATE type::thing('user', $n) SET name = $name;", {"n": i, "name": f"user {i}"}))
+                    for i in range(20)
+                ])
+                self.assertEqual(
+                    [[{'id': f'user:{i}', 'name': f'user {i}'}] for i in range(20)],
+                    [response["result"][0]["result"] for response in responses]
+                )
+                self.assertEqual(20, pool.stats()["batched"])
+                await pool.execute(Query("DELETE user;"))
+        asyncio.run(run_test())
+
+
+    def test_bulk_insert(self):
+        async def run_test():
+            async with ConnectionPool("localhost", 8000, "root", "root", number_of_clients=2) as pool:
+                await pool.execute(Query("CREATE user:7 SET name = 'taken';"))
+                result = await pool.bulk_insert(
+                    "user", ({"id": i, "name": f"user {i}"} for i in range(100)), chunk_size=10
+                )
+                self.assertEqual(10, result.chunks)
+                self.assertEqual(90, result.inserted)
+                self.assertEqual(1, len(result.failures))
+                self.assertEqual(0, result.failures[0].offset)
+                # the chunk that failed is inserted again without the record that already existed
+                result = await pool.bulk_insert("user", result.failures[0].records, ignore=True)
+                self.assertTrue(result.ok)
+                response = await pool.execute(Query("SELECT count() FROM user GROUP ALL;"))
+                self.assertEqual([{"count": 100}], response["result"][0]["result"])
+                await pool.execute(Query("DELETE user;"))
+        asyncio.run(run_test())
+
+
+    def test_write_behind(self):
+        async def run_test():
+            async with ConnectionPool("localhost", 8000, "root", "root", number_of_clients=2) as pool:
+                flushed = []
+                async with WriteBehindBuffer(
+                        pool, interval=0.01, upsert=True, on_flush=flushed.extend,
+                        merge=lambda old, new: {"visits": old["visits"] + new["visits"]}
+                ) as buffer:
+                    for i in range(100):
+                        buffer.write(f"page:{i % 5}", {"visits": 1})
+                self.assertEqual(95, buffer.coalesced)
+                self.assertEqual(5, len(flushed))
+                response = await pool.execute(Query("SELECT * FROM page ORDER BY id;"))
+                self.assertEqual([20] * 5, [record["visits"] for record in response["result"][0]["result"]])
+                await pool.execute(Query("DELETE page;"))
+        asyncio.run(run_test())
+
+    def test_rpc_methods(self):
+        async def run_test():
+            async with ConnectionPool("localhost", 8000, "root", "root", number_of_clients=2) as pool:
+                response = await pool.insert("user", [{"id": i, "name": f"user {i}"} for i in range(10)])
+                self.assertTrue(response.ok)
+                await asyncio.gather(*[pool.merge(f"user:{i}", {"age": i}) for i in range(10)])
+                response = await pool.select("user:3")
+                self.assertEqual({"id": "user:3", "name": "user 3", "age": 3}, response.result)
+                response = await pool.create("user:3")
+                self.assertIsNotNone(response.error)
+                await pool.delete("user")
+        asyncio.run(run_test())
+
+
+
+class TestDefaultPool(TestCase):
+
+    def test_no_pool_running(self):
+        async def run_test():
+            await shutdown_pool()
+            with self.assertRaises(RuntimeError):
+                await asyncio.wait_for(execute_pooled_query(Query("SELECT * FROM user;")), 1)
+        asyncio.run(run_test())
+
+
+class TestReadsDuringWrites(TestCase):
+
+    def test_cache_skips_read_overtaken_by_write(self):
+        async def run_test():
+            cache = QueryCache()
+            pool = ConnectionPool("localhost", 8000, "root", "root", query_cache=cache)
+            database = FakeDatabase(0.05)
+            pool._send = database.send
+            read = asyncio.ensure_future(pool.execute(Query("SELECT * FROM user;")))
+            await asyncio.sleep(0.01)
+            await pool.execute(Query("CREATE user;"))
+            # the read was sent before the write and answers with the rows from before it
+            self.assertEqual([], (await read)["result"][0]["result"])
+            self.assertEqual(0, len(cache))
+            self.assertEqual(1, cache.stale)
+            response = await pool.execute(Query("SELECT * FROM user;"))
+            self.assertEqual([{"id": 0}], response["result"][0]["result"])
+        asyncio.run(run_test())
+
+    def test_coalesce_skips_flight_overtaken_by_write(self):
+        async def run_test():
+            pool = ConnectionPool("localhost", 8000, "root", "root", coalesce_reads=True)
+            database = FakeDatabase(0.05)
+            pool._send = database.send
+            before = asyncio.ensure_future(pool.execute(Query("SELECT * FROM user;")))
+            joined = asyncio.ensure_future(pool.execute(Query("SELECT * FROM user;")))
+            await asyncio.sleep(0.01)
+            await pool.execute(Query("CREATE user;"))
+            # a read sent after the write completed does not join the read sent before it
+            after = await pool.execute(Query("SELECT * FROM user;"))
+            self.assertEqual([{"id": 0}], after["result"][0]["result"])
+            self.assertEqual([], (await before)["result"][0]["result"])
+            self.assertEqual([], (await joined)["result"][0]["result"])
+            self.assertEqual(2, database.reads)
+            self.assertEqual(1, pool.metrics.coalesced)
+        asyncio.run(run_test())
+
+    def test_shared_cache_keeps_databases_apart(self):
+        async def run_test():
+            cache = QueryCache()
+            pools = []
+            for namespace in ("tenant_one", "tenant_two"):
+                pool = ConnectionPool(
+                    "localhost", 8000, "root", "root", namespace=namespace, query_cache=cache, coalesce_reads=True
+                )
+                database = FakeDatabase(0)
+                pool._send = database.send
+                pools.append((pool, database))
+            (one, one_database), (two, two_database) = pools
+            await one.execute(Query("CREATE user;"))
+            self.assertEqual([{"id": 0}], (await one.execute(Query("SELECT * FROM user;")))["result"][0]["result"])
+            # the second tenant reads its own empty table rather than the rows cached for the first
+            self.assertEqual([], (await two.execute(Query("SELECT * FROM user;")))["result"][0]["result"])
+            self.assertEqual(1, two_database.reads)
+            self.assertEqual(2, len(cache))
+            # and its writes leave the entries of the first tenant alone
+            await two.execute(Query("CREATE user;"))
+            await one.execute(Query("SELECT * FROM user;"))
+            self.assertEqual(1, one_database.reads)
+        asyncio.run(run_test())
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,53 @@
+from unittest import TestCase, main
+
+from sblpy.pool.metrics import Histogram, prometheus_histogram
+
+
+class TestHistogram(TestCase):
+
+    def test_observe(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(3.0)
+        self.assertEqual([2, 1, 1], histogram.counts)
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(3.65, histogram.sum)
+
+    def test_quantile(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+        self.assertIsNone(histogram.quantile(0.5))
+        for _ in range(98):
+            histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(2.0)
+        self.assertEqual(0.1, histogram.quantile(0.5))
+        self.assertEqual(1.0, histogram.quantile(0.99))
+        self.assertEqual(float("inf"), histogram.quantile(1.0))
+
+    def test_snapshot(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        snapshot = histogram.snapshot()
+        self.assertEqual(2, snapshot["count"])
+        self.assertEqual({"0.1": 1, "1.0": 2, "+Inf": 2}, snapshot["buckets"])
+
+    def test_prometheus_histogram(self):
+        histogram = Histogram(bounds=(0.1,))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        self.assertEqual(
+            [
+                'latency_bucket{client="0",le="0.1"} 1',
+                'latency_bucket{client="0",le="+Inf"} 2',
+                'latency_sum{client="0"} 0.55',
+                'latency_count{client="0"} 2',
+            ],
+            prometheus_histogram("latency", histogram, {"client": 0})
+        )
+
+
+if __name__ == "__main__":
+    main()
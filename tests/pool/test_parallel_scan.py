@@ -0,0 +1,60 @@
+import asyncio
+from unittest import TestCase, main
+
+from sblpy.pool.parallel_scan import merge_pages
+
+
+def source(name, pages, delay, running):
+    async def read():
+        running.append(name)
+        for page in range(pages):
+            await asyncio.sleep(delay)
+            yield [f"{name}{page}"]
+    return read
+
+
+class TestMergePages(TestCase):
+
+    def test_ordered(self):
+        async def run_test():
+            running = []
+            sources = [source(name, 3, delay, running) for name, delay in (("a", 0.02), ("b", 0.0), ("c", 0.01))]
+            pages = [page async for page in merge_pages(sources, concurrency=2, ordered=True)]
+            self.assertEqual([["a0"], ["a1"], ["a2"], ["b0"], ["b1"], ["b2"], ["c0"], ["c1"], ["c2"]], pages)
+            self.assertEqual(["a", "b", "c"], running)
+        asyncio.run(run_test())
+
+    def test_unordered(self):
+        async def run_test():
+            running = []
+            sources = [source(name, 2, delay, running) for name, delay in (("a", 0.05), ("b", 0.0))]
+            pages = [page[0] async for page in merge_pages(sources, concurrency=2)]
+            self.assertEqual(["a0", "a1", "b0", "b1"], sorted(pages))
+            # the fast range is not held back by the slow one
+            self.assertEqual(["b0", "b1"], pages[:2])
+        asyncio.run(run_test())
+
+    def test_concurrency(self):
+        async def run_test():
+            running = []
+            sources = [source(name, 2, 0.01, running) for name in "abcd"]
+            pages = merge_pages(sources, concurrency=1)
+            await pages.__anext__()
+            # the first range holds the only slot while it reads its second page
+            self.assertEqual(["a"], running)
+            await pages.aclose()
+        asyncio.run(run_test())
+
+    def test_error(self):
+        async def failing():
+            yield ["a0"]
+            raise ValueError("range failed")
+
+        async def run_test():
+            with self.assertRaises(ValueError):
+                _ = [page async for page in merge_pages([failing, source("b", 5, 0.01, [])], concurrency=2)]
+        asyncio.run(run_test())
+
+
+if __name__ == "__main__":
+    main()
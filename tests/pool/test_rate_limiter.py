@@ -0,0 +1,44 @@
+import asyncio
+import time
+from unittest import TestCase, main
+
+from sblpy.pool.rate_limiter import TokenBucket
+
+
+class TestTokenBucket(TestCase):
+
+    def test_try_acquire(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        time.sleep(0.11)
+        self.assertTrue(bucket.try_acquire())
+
+    def test_acquire(self):
+        async def run_test():
+            bucket = TokenBucket(rate=50, burst=1)
+            start = time.monotonic()
+            for _ in range(6):
+                await bucket.acquire()
+            self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        asyncio.run(run_test())
+
+    def test_release(self):
+        bucket = TokenBucket(rate=0.001, burst=1)
+        self.assertTrue(bucket.try_acquire())
+        bucket.release()
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        # a token is never put back above the capacity
+        bucket.release()
+        bucket.release()
+        self.assertEqual(1.0, bucket.tokens)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+if __name__ == "__main__":
+    main()
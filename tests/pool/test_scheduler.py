@@ -0,0 +1,99 @@
+import asyncio
+import time
+from unittest import TestCase, main
+
+from sblpy.pool.scheduler import Scheduler
+from sblpy.query import Priority
+
+
+class TestScheduler(TestCase):
+
+    def test_priority(self):
+        scheduler = Scheduler()
+        scheduler.put_nowait(("batch", None, 0), Priority.BATCH)
+        scheduler.put_nowait(("normal", None, 0), Priority.NORMAL)
+        scheduler.put_nowait(("interactive", None, 0), Priority.INTERACTIVE)
+        self.assertEqual(3, scheduler.qsize())
+        self.assertEqual(
+            ["interactive", "normal", "batch"],
+            [scheduler.get_nowait()[0] for _ in range(3)]
+        )
+        self.assertTrue(scheduler.empty())
+
+    def test_fair_share(self):
+        scheduler = Scheduler(tenant_weights={"heavy": 2.0})
+        for i in range(10):
+            scheduler.put_nowait((f"flood-{i}", None, 0), tenant="flood")
+        for i in range(4):
+            scheduler.put_nowait((f"heavy-{i}", None, 0), tenant="heavy")
+        scheduler.put_nowait(("quiet-0", None, 0), tenant="quiet")
+        served = [scheduler.get_nowait()[0] for _ in range(6)]
+        self.assertEqual(
+            ["heavy-0", "flood-0", "heavy-1", "quiet-0", "heavy-2", "flood-1"],
+            served
+        )
+
+    def test_starvation(self):
+        scheduler = Scheduler(starvation_timeout=0.05)
+        scheduler.put_nowait(("batch", None, 0), Priority.BATCH)
+        time.sleep(0.06)
+        scheduler.put_nowait(("interactive", None, 0), Priority.INTERACTIVE)
+        self.assertEqual("batch", scheduler.get_nowait()[0])
+        self.assertEqual("interactive", scheduler.get_nowait()[0])
+
+    def test_remove(self):
+        scheduler = Scheduler()
+        scheduler.put_nowait(("one", None, 0))
+        scheduler.put_nowait(("two", None, 0))
+        self.assertTrue(scheduler.remove("one"))
+        self.assertFalse(scheduler.remove("one"))
+        self.assertEqual(1, scheduler.qsize())
+        self.assertEqual("two", scheduler.get_nowait()[0])
+        with self.assertRaises(asyncio.QueueEmpty):
+            scheduler.get_nowait()
+
+    def test_control_messages_keep_arrival_order(self):
+        scheduler = Scheduler()
+        scheduler.put_nowait(("query", None, 0), Priority.BATCH)
+        scheduler.put_nowait((None, "shutdown", 0))
+        self.assertEqual("query", scheduler.get_nowait()[0])
+        self.assertEqual("shutdown", scheduler.get_nowait()[1])
+
+    def test_get_waits_for_put(self):
+        async def run_test():
+            scheduler = Scheduler()
+            getter = asyncio.create_task(scheduler.get())
+            await asyncio.sleep(0)
+            self.assertFalse(getter.done())
+            await scheduler.put(("one", None, 0))
+            self.assertEqual("one", (await getter)[0])
+        asyncio.run(run_test())
+
+    def test_bounded(self):
+        scheduler = Scheduler(maxsize=2)
+        scheduler.put_nowait(("one", None, 0))
+        scheduler.put_nowait(("two", None, 0))
+        self.assertTrue(scheduler.full())
+        with self.assertRaises(asyncio.QueueFull):
+            scheduler.put_nowait(("three", None, 0))
+        # control messages are not bounded
+        scheduler.put_nowait((None, "shutdown", 0))
+        self.assertEqual("one", scheduler.drop_oldest()[0])
+        self.assertFalse(scheduler.full())
+        self.assertEqual(2, scheduler.qsize())
+
+    def test_put_waits_for_room(self):
+        async def run_test():
+            scheduler = Scheduler(maxsize=1)
+            await scheduler.put(("one", None, 0))
+            putter = asyncio.create_task(scheduler.put(("two", None, 0)))
+            await asyncio.sleep(0)
+            self.assertFalse(putter.done())
+            self.assertEqual("one", (await scheduler.get())[0])
+            await putter
+            self.assertEqual("two", (await scheduler.get())[0])
+        asyncio.run(run_test())
+
+
+if __name__ == "__main__":
+    main()
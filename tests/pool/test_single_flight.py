@@ -0,0 +1,73 @@
+import asyncio
+from unittest import TestCase, main
+
+from sblpy.pool.single_flight import SingleFlight
+
+
+class TestSingleFlight(TestCase):
+
+    def test_shared(self):
+        async def run_test():
+            flights = SingleFlight()
+            calls = []
+
+            async def call():
+                calls.append(1)
+                await asyncio.sleep(0.01)
+                return object()
+
+            results = await asyncio.gather(*[flights.run("key", call) for _ in range(5)], flights.run("other", call))
+            self.assertEqual(2, len(calls))
+            self.assertEqual(1, len({id(result) for result in results[:5]}))
+            self.assertIsNot(results[0], results[5])
+            self.assertEqual(0, len(flights))
+            # the call is made again once the last one has finished
+            await flights.run("key", call)
+            self.assertEqual(3, len(calls))
+        asyncio.run(run_test())
+
+    def test_error(self):
+        async def run_test():
+            flights = SingleFlight()
+
+            async def call():
+                await asyncio.sleep(0.01)
+                raise ValueError("boom")
+
+            results = await asyncio.gather(*[flights.run("key", call) for _ in range(3)], return_exceptions=True)
+            self.assertEqual(["boom"] * 3, [str(result) for result in results])
+        asyncio.run(run_test())
+
+    def test_timeout(self):
+        async def run_test():
+            flights = SingleFlight()
+            cancelled = []
+
+            async def call():
+                try:
+                    await asyncio.sleep(0.05)
+                except asyncio.CancelledError:
+                    cancelled.append(1)
+                    raise
+                return "done"
+
+            results = await asyncio.gather(
+                flights.run("key", call, timeout=0.01), flights.run("key", call), return_exceptions=True
+            )
+            self.assertIsInstance(results[0], asyncio.TimeoutError)
+            self.assertEqual("done", results[1])
+            self.assertEqual([], cancelled)
+
+            # the call is cancelled once every caller has given up
+            results = await asyncio.gather(
+                flights.run("key", call, timeout=0.01), flights.run("key", call, timeout=0.01), return_exceptions=True
+            )
+            await asyncio.sleep(0)
+            self.assertEqual([asyncio.TimeoutError] * 2, [type(result) for result in results])
+            self.assertEqual([1], cancelled)
+            self.assertEqual(0, len(flights))
+        asyncio.run(run_test())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, main
+
+from sblpy.errors import PoolOverloadedError, QueryError
+from sblpy.pool.sync_pool import SyncConnectionPool
+
+
+class TestSyncConnectionPool(TestCase):
+
+    def setUp(self):
+        self.pool = SyncConnectionPool(
+            "localhost",
+            8000,
+            "root",
+            "root",
+            max_connections=3
+        )
+
+    def tearDown(self):
+        self.pool.query("DELETE user;")
+        self.pool.close()
+
+    def test_query(self):
+        self.pool.query("CREATE user:tobie SET name = 'Tobie';")
+        self.pool.query("CREATE user:jaime SET name = 'Jaime';")
+        outcome = self.pool.query("SELECT * FROM user;")
+        self.assertEqual(
+            [{'id': 'user:jaime', 'name': 'Jaime'}, {'id': 'user:tobie', 'name': 'Tobie'}],
+            outcome
+        )
+        # the same connection is reused for every query
+        self.assertEqual(1, self.pool._open)
+
+    def test_threads(self):
+        self.pool.query("CREATE user:tobie SET name = 'Tobie';")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            outcomes = list(executor.map(lambda _: self.pool.query("SELECT * FROM user;"), range(50)))
+        for outcome in outcomes:
+            self.assertEqual([{'id': 'user:tobie', 'name': 'Tobie'}], outcome)
+        self.assertLessEqual(self.pool._open, 3)
+
+    def test_checkout_timeout(self):
+        self.pool.checkout_timeout = 0.1
+        connections = [self.pool.acquire() for _ in range(3)]
+        with self.assertRaises(PoolOverloadedError):
+            self.pool.acquire()
+        for connection in connections:
+            self.pool.release(connection)
+
+    def test_evict_broken(self):
+        with self.pool.connection() as connection:
+            connection.socket.close()
+        self.assertEqual(0, self.pool._open)
+        self.assertEqual([], self.pool.query("SELECT * FROM user;"))
+
+
+    def test_keep_after_query_error(self):
+        with self.assertRaises(QueryError):
+            self.pool.query("CREATE user:tobie SET name = 1 +;")
+        # the database answered with an error so the connection is still in sync and is kept
+        self.assertEqual(1, self.pool._open)
+        self.assertEqual(1, len(self.pool._idle))
+
+    def test_evict_after_error(self):
+        with self.assertRaises(ValueError):
+            with self.pool.connection() as connection:
+                connection.pipeline().query("SELECT * FROM user;")
+                raise ValueError("interrupted")
+        self.assertEqual(0, self.pool._open)
+        # a connection with responses left to read is evicted even if the block did not raise
+        with self.pool.connection() as connection:
+            connection.pipeline().query("SELECT * FROM user;")
+        self.assertEqual(0, self.pool._open)
+        self.assertEqual([], self.pool.query("SELECT * FROM user;"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, main
+
+from sblpy.pool.connection_pool import ConnectionPool
+from sblpy.pool.threaded import ThreadedConnectionPool
+from sblpy.query import Query
+
+
+class TestThreadedConnectionPool(TestCase):
+
+    def test_execute_from_threads(self):
+        with ThreadedConnectionPool(
+            ConnectionPool("localhost", 8000, "root", "root", number_of_clients=2)
+        ) as pool:
+            pool.execute(Query("CREATE user:tobie SET name = 'Tobie';"))
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                responses = list(executor.map(
+                    lambda _: pool.execute(Query("SELECT * FROM user;")), range(50)
+                ))
+            for response in responses:
+                self.assertEqual(
+                    [{'id': 'user:tobie', 'name': 'Tobie'}],
+                    response["result"][0]["result"]
+                )
+            future = pool.submit(Query("DELETE user;"))
+            self.assertEqual("OK", future.result()["result"][0]["status"])
+        self.assertIsNone(pool.thread)
+
+    def test_start_failure(self):
+        connection_pool = ConnectionPool("localhost", 8000, "root", "root")
+
+        async def fail_to_start():
+            raise OSError("the database is unreachable")
+        connection_pool.start = fail_to_start
+        pool = ThreadedConnectionPool(connection_pool)
+        with self.assertRaises(OSError):
+            pool.start()
+        # the loop thread is not left running behind the error
+        self.assertIsNone(pool.thread)
+        self.assertIsNone(pool.loop)
+        self.assertNotIn("sblpy-pool-loop", [thread.name for thread in threading.enumerate()])
+
+    def test_not_started(self):
+        pool = ThreadedConnectionPool(ConnectionPool("localhost", 8000, "root", "root"))
+        with self.assertRaises(RuntimeError):
+            pool.execute(Query("SELECT * FROM user;"))
+
+
+if __name__ == "__main__":
+    main()
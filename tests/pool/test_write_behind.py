@@ -0,0 +1,118 @@
+import asyncio
+from unittest import TestCase, main
+
+from sblpy.cbor import RecordID
+from sblpy.codec import get_codec
+from sblpy.pool.write_behind import WriteBehindBuffer
+from sblpy.response import Response
+
+CODEC = get_codec("json")
+
+
+class FakePool:
+
+    def __init__(self, failing=(), max_size=2 ** 20):
+        self.queries = []
+        self.failing = failing
+        self.codec = CODEC
+        self.max_size = max_size
+
+    async def execute(self, query, timeout=None):
+        self.queries.append(query)
+        await asyncio.sleep(0.001)
+        result = []
+        for index, statement in enumerate(query.sql.split("\n")):
+            if query.vars[f"sblpy_id_{index}"] in self.failing:
+                result.append({"result": "boom", "status": "ERR"})
+            else:
+                result.append({"result": [], "status": "OK"})
+        return Response(CODEC.encode({"id": query.id, "result": result}), CODEC)
+
+
+class TestWriteBehindBuffer(TestCase):
+
+    def test_coalesce(self):
+        async def run_test():
+            pool = FakePool()
+            flushed = []
+            buffer = WriteBehindBuffer(pool, on_flush=flushed.extend)
+            buffer.write("user:1", {"name": "a", "age": 1})
+            buffer.write("user:2", {"name": "b"})
+            buffer.write(RecordID("user", 1), {"age": 2})
+            self.assertEqual(2, buffer.pending)
+            self.assertEqual(2, await buffer.flush())
+            self.assertEqual(1, len(pool.queries))
+            self.assertEqual(
+                "UPDATE type::thing($sblpy_table_0, $sblpy_id_0) MERGE $sblpy_data_0 RETURN NONE;\n"
+                "UPDATE type::thing($sblpy_table_1, $sblpy_id_1) MERGE $sblpy_data_1 RETURN NONE;",
+                pool.queries[0].sql
+            )
+            self.assertEqual({"name": "a", "age": 2}, pool.queries[0].vars["sblpy_data_0"])
+            self.assertEqual(["user:1", "user:2"], flushed)
+            self.assertEqual(1, buffer.coalesced)
+            self.assertEqual(0, await buffer.flush())
+        asyncio.run(run_test())
+
+    def test_merge_function(self):
+        async def run_test():
+            pool = FakePool()
+            buffer = WriteBehindBuffer(pool, merge=lambda old, new: {"count": old["count"] + new["count"]}, upsert=True)
+            for _ in range(5):
+                buffer.write("counter:1", {"count": 1})
+            await buffer.flush()
+            self.assertTrue(pool.queries[0].sql.startswith("UPSERT"))
+            self.assertEqual({"count": 5}, pool.queries[0].vars["sblpy_data_0"])
+        asyncio.run(run_test())
+
+    def test_interval_and_size(self):
+        async def run_test():
+            pool = FakePool()
+            async with WriteBehindBuffer(pool, interval=0.01, max_pending=3) as buffer:
+                buffer.write("user:1", {"n": 1})
+                await asyncio.sleep(0.03)
+                self.assertEqual(1, len(pool.queries))
+                for i in range(3):
+                    buffer.write(f"user:{i}", {"n": i})
+                await asyncio.sleep(0)
+                self.assertEqual(0, buffer.pending)
+                buffer.write("user:9", {"n": 9})
+            # closing flushes what is left
+            self.assertEqual(0, buffer.pending)
+            self.assertEqual(5, buffer.flushed)
+            with self.assertRaises(RuntimeError):
+                buffer.write("user:1", {"n": 1})
+        asyncio.run(run_test())
+
+    def test_errors(self):
+        async def run_test():
+            pool = FakePool(failing=(2,))
+            flushed = []
+            failed = []
+            buffer = WriteBehindBuffer(pool, on_flush=flushed.extend, on_error=lambda writes, error: failed.append((writes, error)))
+            buffer.write("user:1", {"n": 1})
+            buffer.write("user:2", {"n": 2})
+            self.assertEqual(1, await buffer.flush())
+            self.assertEqual(["user:1"], flushed)
+            self.assertEqual([({"user:2": {"n": 2}}, "boom")], failed)
+            self.assertEqual(1, buffer.failed)
+        asyncio.run(run_test())
+
+    def test_max_bytes(self):
+        async def run_test():
+            pool = FakePool(max_size=4096)
+            buffer = WriteBehindBuffer(pool)
+            self.assertEqual(2048, buffer.max_bytes)
+            # every merge makes the records larger, so the flush has to be split to fit in the messages
+            for i in range(10):
+                for field in range(10):
+                    buffer.write(f"user:{i}", {f"field_{field}": "x" * 20})
+            self.assertEqual(10, await buffer.flush())
+            self.assertGreater(len(pool.queries), 1)
+            for query in pool.queries:
+                self.assertLessEqual(len(query.sql) + len(CODEC.encode(query.vars)), 2048 + 1024)
+            self.assertEqual(10, sum(len(query.sql.split("\n")) for query in pool.queries))
+        asyncio.run(run_test())
+
+
+if __name__ == "__main__":
+    main()
@@ -43,6 +43,81 @@ class TestConnectionPool(TestCase):
 
         asyncio.run(run_test())
 
+    def test_persistent_query(self):
+        async def run_test():
+            async with AsyncSurrealConnection(
+                "localhost",
+                8000,
+                "root",
+                "root",
+                persistent=True
+            ) as con:
+                socket = con.socket
+                await con.query("CREATE user:tobie SET name = 'Tobie';")
+                await con.query("CREATE user:jaime SET name = 'Jaime';")
+                outcomes = await asyncio.gather(*[con.query("SELECT * FROM user;") for _ in range(20)])
+                for outcome in outcomes:
+                    self.assertEqual(
+                        [{'id': 'user:jaime', 'name': 'Jaime'}, {'id': 'user:tobie', 'name': 'Tobie'}],
+                        outcome
+                    )
+                # every query went over the same socket
+                self.assertIs(socket, con.socket)
+            self.assertIsNone(con.socket)
+
+        asyncio.run(run_test())
+
+    def test_rpc_methods(self):
+        async def run_test():
+            async with AsyncSurrealConnection("localhost", 8000, "root", "root", persistent=True) as con:
+                await con.create("user:tobie", {"name": "Tobie"})
+                await con.update("user:tobie", {"name": "Tobie", "age": 30})
+                await con.patch("user:tobie", [{"op": "replace", "path": "/age", "value": 31}])
+                self.assertEqual({'id': 'user:tobie', 'name': 'Tobie', 'age': 31}, await con.select("user:tobie"))
+                await con.delete("user")
+                self.assertEqual([], await con.select("user"))
+
+        asyncio.run(run_test())
+
+    def test_query_stream(self):
+        async def run_test():
+            con = AsyncSurrealConnection("localhost", 8000, "root", "root", persistent=True)
+            await con.query("CREATE user:tobie SET name = 'Tobie';")
+            await con.query("CREATE user:jaime SET name = 'Jaime';")
+            records = []
+            async for record in con.query_stream("SELECT * FROM user;", max_size=2**24):
+                records.append(record)
+            self.assertEqual(
+                [{'id': 'user:jaime', 'name': 'Jaime'}, {'id': 'user:tobie', 'name': 'Tobie'}],
+                records
+            )
+            await con.close()
+
+        asyncio.run(run_test())
+
+    def test_stream(self):
+        async def run_test():
+            con = AsyncSurrealConnection("localhost", 8000, "root", "root", persistent=True)
+            for i in range(25):
+                await con.query(f"CREATE user:{i} SET name = 'user {i}';")
+            records = [record async for record in con.stream("user", batch_size=10)]
+            self.assertEqual(25, len({record["id"] for record in records}))
+            await con.close()
+
+        asyncio.run(run_test())
+
+    def test_persistent_reconnect(self):
+        async def run_test():
+            con = AsyncSurrealConnection("localhost", 8000, "root", "root", persistent=True)
+            await con.query("SELECT * FROM user;")
+            await con.socket.close()
+            await asyncio.sleep(0.1)
+            self.assertIsNone(con.socket)
+            self.assertEqual([], await con.query("SELECT * FROM user;"))
+            await con.close()
+
+        asyncio.run(run_test())
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,75 @@
+import asyncio
+import base64
+import gc
+import json
+import time
+from unittest import TestCase, main
+
+from sblpy.auth import TokenCache
+from sblpy.connection import SurrealSyncConnection
+
+
+def make_token(expiry: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": expiry}).encode("utf-8")).decode("utf-8")
+    return f"header.{payload.rstrip('=')}.signature"
+
+
+class TestTokenCache(TestCase):
+
+    def test_token_expiry(self):
+        self.assertEqual(1700000000.0, TokenCache.token_expiry(make_token(1700000000)))
+        self.assertIsNone(TokenCache.token_expiry("not-a-jwt"))
+        self.assertIsNone(TokenCache.token_expiry("header.!!!.signature"))
+
+    def test_get_put(self):
+        cache = TokenCache(refresh_margin=60.0)
+        key = TokenCache.key("ws://localhost:8000/rpc", "root", "root")
+        self.assertIsNone(cache.get(key))
+        token = make_token(time.time() + 3600)
+        cache.put(key, token)
+        self.assertEqual(token, cache.get(key))
+        self.assertIsNone(cache.get(TokenCache.key("ws://localhost:8000/rpc", "root", "other")))
+        cache.invalidate(key)
+        self.assertIsNone(cache.get(key))
+
+    def test_refresh_before_expiry(self):
+        cache = TokenCache(refresh_margin=60.0)
+        key = TokenCache.key("ws://localhost:8000/rpc", "root", "root")
+        cache.put(key, make_token(time.time() + 30))
+        self.assertIsNone(cache.get(key))
+
+    def test_default_ttl(self):
+        cache = TokenCache(refresh_margin=0.0, default_ttl=0.05)
+        key = TokenCache.key("ws://localhost:8000/rpc", "root", "root")
+        cache.put(key, "opaque")
+        self.assertEqual("opaque", cache.get(key))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get(key))
+
+    def test_async_lock_per_loop(self):
+        cache = TokenCache()
+        key = TokenCache.key("ws://localhost:8000/rpc", "root", "root")
+
+        async def get_locks():
+            return cache.async_lock(key), cache.async_lock(key)
+
+        first, again = asyncio.run(get_locks())
+        self.assertIs(first, again)
+        second, _ = asyncio.run(get_locks())
+        self.assertIsNot(first, second)
+        # the locks of a loop are dropped with the loop
+        gc.collect()
+        self.assertEqual(0, len(cache._async_locks))
+
+    def test_connections_share_token(self):
+        cache = TokenCache()
+        first = SurrealSyncConnection("localhost", 8000, "root", "root", token_cache=cache)
+        second = SurrealSyncConnection("localhost", 8000, "root", "root", token_cache=cache)
+        self.assertEqual(first.token, second.token)
+        self.assertEqual([], second.query("SELECT * FROM user WHERE name = 'nobody';"))
+        first.socket.close()
+        second.socket.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import json
+from unittest import TestCase, main
+
+from sblpy.bulk import BulkInsertResult, ChunkFailure, chunk_records, insert_query
+from sblpy.query import Priority
+
+
+class TestChunkRecords(TestCase):
+
+    def test_chunk_size(self):
+        records = [{"n": i} for i in range(7)]
+        chunks = list(chunk_records(records, 3, 2 ** 20, json.dumps))
+        self.assertEqual([0, 3, 6], [offset for offset, _ in chunks])
+        self.assertEqual([3, 3, 1], [len(chunk) for _, chunk in chunks])
+        self.assertEqual(records, [record for _, chunk in chunks for record in chunk])
+
+    def test_max_bytes(self):
+        # each record is 10 characters encoded plus a separator
+        records = ({"n": "x" * 1} for _ in range(5))
+        chunks = list(chunk_records(records, 100, 25, json.dumps))
+        self.assertEqual([2, 2, 1], [len(chunk) for _, chunk in chunks])
+
+    def test_large_record(self):
+        records = [{"n": 1}, {"n": "x" * 100}, {"n": 2}]
+        chunks = list(chunk_records(records, 100, 20, json.dumps))
+        self.assertEqual([[{"n": 1}], [{"n": "x" * 100}], [{"n": 2}]], [chunk for _, chunk in chunks])
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            list(chunk_records([{}], 0, 10, json.dumps))
+
+
+class TestInsertQuery(TestCase):
+
+    def test_insert_query(self):
+        query = insert_query("user", [{"id": 1}])
+        self.assertEqual("INSERT INTO user $sblpy_records RETURN NONE;", query.sql)
+        self.assertEqual({"sblpy_records": [{"id": 1}]}, query.vars)
+        self.assertEqual(Priority.BATCH, query.priority)
+        self.assertEqual("INSERT IGNORE INTO user $sblpy_records RETURN NONE;", insert_query("user", [], True).sql)
+
+    def test_invalid_table(self):
+        with self.assertRaises(ValueError):
+            insert_query("user; REMOVE TABLE user", [])
+
+    def test_result(self):
+        result = BulkInsertResult()
+        self.assertTrue(result.ok)
+        result.failures.append(ChunkFailure(1, 3, [{"id": 3}, {"id": 4}], "already exists"))
+        self.assertFalse(result.ok)
+        self.assertEqual(2, result.failed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import time
+from unittest import TestCase, main
+
+from sblpy.cache import QueryCache, analyse, cache_scope, normalize, succeeded
+
+
+class TestAnalyse(TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(
+            "SELECT * FROM user WHERE name = 'a  b'",
+            normalize("  SELECT *\n  FROM user\tWHERE name = 'a  b';; ")
+        )
+
+    def test_reads(self):
+        self.assertEqual((frozenset({"user"}), frozenset()), analyse("SELECT * FROM user WHERE age > 18;"))
+        self.assertEqual(
+            (frozenset({"user", "post"}), frozenset()),
+            analyse("SELECT * FROM user:tobie, post; SELECT count() FROM user GROUP ALL;")
+        )
+        self.assertEqual(
+            (frozenset({"user", "likes", "post"}), frozenset()),
+            analyse("SELECT ->likes->post AS liked FROM user:tobie;")
+        )
+        self.assertEqual((frozenset({"user"}), frozenset()), analyse("SELECT * FROM user WHERE name = 'CREATE post';"))
+
+    def test_not_cacheable(self):
+        self.assertIsNone(analyse("SELECT * FROM $table;")[0])
+        self.assertIsNone(analyse("SELECT * FROM type::table($table);")[0])
+        self.assertIsNone(analyse("SELECT *, time::now() AS now FROM user;")[0])
+        self.assertIsNone(analyse("SELECT * FROM user WHERE id = $auth.id;")[0])
+        self.assertIsNone(analyse("INFO FOR DB;")[0])
+        self.assertIsNone(analyse("SELECT * FROM user; CREATE user;")[0])
+
+    def test_writes(self):
+        self.assertEqual(frozenset({"user"}), analyse("CREATE user:tobie SET name = 'Tobie';")[1])
+        self.assertEqual(
+            frozenset({"user", "post", "likes"}),
+            analyse("UPDATE user SET n += 1; DELETE FROM post; RELATE user:tobie->likes->post:1;")[1]
+        )
+        self.assertEqual(frozenset({"user"}), analyse("INSERT INTO user [{name: 'a'}];")[1])
+        self.assertIsNone(analyse("DELETE $record;")[1])
+        self.assertIsNone(analyse("DEFINE TABLE user SCHEMALESS;")[1])
+        self.assertIsNone(analyse("RETURN fn::archive();")[1])
+
+    def test_succeeded(self):
+        self.assertTrue(succeeded({"result": [{"result": [], "status": "OK"}]}))
+        self.assertFalse(succeeded({"result": [{"result": "boom", "status": "ERR"}]}))
+        self.assertFalse(succeeded({"error": {"code": -32000, "message": "boom"}}))
+
+
+class TestQueryCache(TestCase):
+
+    def test_hit_and_miss(self):
+        cache = QueryCache()
+        self.assertIsNone(cache.get("SELECT * FROM user;"))
+        self.assertTrue(cache.put("SELECT * FROM user;", None, "frame"))
+        self.assertEqual("frame", cache.get("SELECT *  FROM user"))
+        self.assertIsNone(cache.get("SELECT * FROM user;", {"age": 1}))
+        stats = cache.stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(2, stats["misses"])
+        self.assertEqual(5, stats["bytes"])
+
+    def test_not_cacheable(self):
+        cache = QueryCache()
+        self.assertFalse(cache.put("CREATE user;", None, "frame"))
+        self.assertIsNone(cache.get("CREATE user;"))
+        self.assertEqual(0, cache.stats()["misses"])
+
+    def test_eviction(self):
+        cache = QueryCache(max_bytes=10)
+        cache.put("SELECT * FROM a;", None, "1111")
+        cache.put("SELECT * FROM b;", None, "2222")
+        cache.get("SELECT * FROM a;")
+        cache.put("SELECT * FROM c;", None, "3333")
+        self.assertIsNone(cache.get("SELECT * FROM b;"))
+        self.assertEqual("1111", cache.get("SELECT * FROM a;"))
+        self.assertEqual("3333", cache.get("SELECT * FROM c;"))
+        self.assertEqual(1, cache.evictions)
+        self.assertFalse(cache.put("SELECT * FROM d;", None, "x" * 11))
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=60.0, table_ttls={"session": 0.0})
+        cache.put("SELECT * FROM user;", None, "frame")
+        cache.put("SELECT * FROM user, session;", None, "frame")
+        time.sleep(0.01)
+        self.assertEqual("frame", cache.get("SELECT * FROM user;"))
+        self.assertIsNone(cache.get("SELECT * FROM user, session;"))
+        self.assertEqual(1, len(cache))
+
+    def test_observe(self):
+        cache = QueryCache()
+        cache.put("SELECT * FROM user;", None, "frame")
+        cache.put("SELECT * FROM post;", None, "frame")
+        cache.observe("SELECT * FROM post;")
+        cache.observe("UPDATE user SET name = 'Tobie';")
+        self.assertIsNone(cache.get("SELECT * FROM user;"))
+        self.assertEqual("frame", cache.get("SELECT * FROM post;"))
+        cache.observe("DELETE $record;")
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.stats()["bytes"])
+        self.assertEqual(2, cache.invalidations)
+
+    def test_write_during_read(self):
+        cache = QueryCache()
+        generation = cache.generation("SELECT * FROM user;")
+        # a write to another table does not make the read stale
+        cache.observe("CREATE post;")
+        self.assertEqual(generation, cache.generation("SELECT * FROM user;"))
+        # the write completes while the read is still in flight, with nothing cached to drop yet
+        cache.observe("CREATE user;")
+        self.assertFalse(cache.put("SELECT * FROM user;", None, "before the write", generation))
+        self.assertIsNone(cache.get("SELECT * FROM user;"))
+        self.assertEqual(1, cache.stale)
+        self.assertTrue(cache.put("SELECT * FROM user;", None, "after the write", cache.generation("SELECT * FROM user;")))
+        # a write the tables of which cannot be worked out moves every table on
+        generation = cache.generation("SELECT * FROM post;")
+        cache.observe("DELETE $record;")
+        self.assertFalse(cache.put("SELECT * FROM post;", None, "frame", generation))
+
+    def test_scopes(self):
+        cache = QueryCache()
+        tenant_one = cache_scope("ws://localhost:8000/rpc", "tenant_one", "app")
+        tenant_two = cache_scope("ws://localhost:8000/rpc", "tenant_two", "app")
+        cache.put("SELECT * FROM user;", None, "rows of one", scope=tenant_one)
+        # the same query in another database is not answered with the rows of the first
+        self.assertIsNone(cache.get("SELECT * FROM user;", scope=tenant_two))
+        cache.put("SELECT * FROM user;", None, "rows of two", scope=tenant_two)
+        self.assertEqual("rows of one", cache.get("SELECT * FROM user;", scope=tenant_one))
+        # a write to a table in one database leaves the table of the same name in the other alone
+        generation = cache.generation("SELECT * FROM user;", tenant_two)
+        cache.observe("CREATE user;", tenant_one)
+        self.assertIsNone(cache.get("SELECT * FROM user;", scope=tenant_one))
+        self.assertEqual("rows of two", cache.get("SELECT * FROM user;", scope=tenant_two))
+        self.assertEqual(generation, cache.generation("SELECT * FROM user;", tenant_two))
+        cache.observe("DELETE $record;", tenant_two)
+        self.assertEqual(0, len(cache))
+        # invalidating without a scope drops the tables of every scope
+        cache.put("SELECT * FROM user;", None, "rows of one", scope=tenant_one)
+        cache.put("SELECT * FROM user;", None, "rows of two", scope=tenant_two)
+        cache.invalidate(["user"])
+        self.assertEqual(0, len(cache))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import TestCase, main
+
+from sblpy.cbor import (
+    BoundExcluded, BoundIncluded, CborError, Duration, GeometryPoint, Range, RecordID, Table, TaggedValue,
+    decode, encode
+)
+
+
+class TestCbor(TestCase):
+
+    def test_rfc_vectors(self):
+        vectors = [
+            (0, "00"),
+            (23, "17"),
+            (24, "1818"),
+            (1000, "1903e8"),
+            (1000000000000, "1b000000e8d4a51000"),
+            (18446744073709551616, "c249010000000000000000"),
+            (-1, "20"),
+            (-1000, "3903e7"),
+            (1.1, "fb3ff199999999999a"),
+            (False, "f4"),
+            (True, "f5"),
+            (None, "f6"),
+            (b"\x01\x02\x03\x04", "4401020304"),
+            ("IETF", "6449455446"),
+            ("ü", "62c3bc"),
+            ([1, [2, 3], [4, 5]], "8301820203820405"),
+            ({"a": 1, "b": [2, 3]}, "a26161016162820203"),
+        ]
+        for value, encoded in vectors:
+            self.assertEqual(encoded, encode(value).hex())
+            self.assertEqual(value, decode(bytes.fromhex(encoded)))
+
+    def test_decode_only_forms(self):
+        # half and single precision floats and indefinite lengths are never encoded but can be received
+        self.assertEqual(1.5, decode(bytes.fromhex("f93e00")))
+        self.assertEqual(100000.0, decode(bytes.fromhex("fa47c35000")))
+        self.assertEqual([1, [2, 3], [4, 5]], decode(bytes.fromhex("9f018202039f0405ffff")))
+        self.assertEqual({"a": 1}, decode(bytes.fromhex("bf616101ff")))
+        self.assertEqual("streaming", decode(bytes.fromhex("7f657374726561646d696e67ff")))
+        self.assertEqual(None, decode(bytes.fromhex("f7")))
+
+    def test_surreal_types(self):
+        values = [
+            RecordID("user", "tobie"),
+            RecordID("user", [1, "a"]),
+            Table("user"),
+            Duration(90, 5),
+            uuid.UUID("e5d2b4a4-50f2-4a6b-bf84-48ae6f2f2d8a"),
+            Decimal("1.50"),
+            datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+            Range(BoundIncluded(1), BoundExcluded(10)),
+            GeometryPoint(-0.118092, 51.509865),
+            TaggedValue(94, [GeometryPoint(1.0, 2.0)]),
+        ]
+        for value in values:
+            self.assertEqual(value, decode(encode(value)))
+
+    def test_surreal_tags(self):
+        # NONE
+        self.assertIsNone(decode(bytes.fromhex("c6f6")))
+        # a record ID with a numeric ID
+        self.assertEqual(RecordID("user", 1), decode(bytes.fromhex("c882647573657201")))
+        # a string datetime with nanoseconds
+        self.assertEqual(
+            datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc),
+            decode(encode(TaggedValue(0, "2024-01-02T03:04:05.123456789Z")))
+        )
+        self.assertEqual(Duration.parse("1h30m"), decode(encode(TaggedValue(13, "1h30m"))))
+        self.assertEqual(
+            uuid.UUID("e5d2b4a4-50f2-4a6b-bf84-48ae6f2f2d8a"),
+            decode(encode(TaggedValue(9, "e5d2b4a4-50f2-4a6b-bf84-48ae6f2f2d8a")))
+        )
+
+    def test_naive_datetime_is_utc(self):
+        self.assertEqual(
+            datetime(2024, 1, 1, tzinfo=timezone.utc),
+            decode(encode(datetime(2024, 1, 1)))
+        )
+
+    def test_duration(self):
+        self.assertEqual(Duration(5405, 0), Duration.parse("1h30m5s"))
+        self.assertEqual("1h30m5s", str(Duration.parse("1h30m5s")))
+        self.assertEqual("1ms500µs", str(Duration.parse("1500us")))
+        self.assertEqual(Duration(1, 500000000), Duration.from_timedelta(timedelta(seconds=1.5)))
+        self.assertEqual(timedelta(seconds=1.5), Duration(1, 500000000).to_timedelta())
+        with self.assertRaises(ValueError):
+            Duration.parse("1 hour")
+
+    def test_record_id(self):
+        self.assertEqual("user:tobie", str(RecordID("user", "tobie")))
+        self.assertEqual(RecordID("user", "tobie"), RecordID.parse("user:tobie"))
+        self.assertEqual(hash(RecordID("user", "tobie")), hash(RecordID.parse("user:tobie")))
+
+    def test_errors(self):
+        with self.assertRaises(CborError):
+            encode(object())
+        with self.assertRaises(CborError):
+            decode(bytes.fromhex("6449"))
+        with self.assertRaises(CborError):
+            decode(bytes.fromhex("0000"))
+
+
+if __name__ == "__main__":
+    main()
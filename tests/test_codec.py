@@ -0,0 +1,58 @@
+from unittest import TestCase, main
+
+from sblpy.cbor import RecordID
+from sblpy.codec import CborCodec, JsonCodec, available_json_backends, get_codec
+
+
+class TestCodec(TestCase):
+
+    def test_get_codec(self):
+        self.assertIsInstance(get_codec(), JsonCodec)
+        self.assertIsInstance(get_codec("json"), JsonCodec)
+        self.assertIsInstance(get_codec("cbor"), CborCodec)
+        with self.assertRaises(ValueError):
+            get_codec("msgpack")
+        codec = JsonCodec("json")
+        self.assertIs(codec, get_codec(codec))
+        self.assertEqual(available_json_backends()[0], get_codec("json").backend)
+
+    def test_json_backends(self):
+        self.assertEqual("json", available_json_backends()[-1])
+        with self.assertRaises(ValueError):
+            JsonCodec("ujson")
+        for backend in available_json_backends():
+            with self.subTest(backend=backend):
+                codec = JsonCodec(backend)
+                message = {"id": "1", "method": "query", "params": ["SELECT * FROM user;", {"name": "Jürgen"}]}
+                encoded = codec.encode(message)
+                self.assertIsInstance(encoded, str)
+                self.assertIn("Jürgen", encoded)
+                self.assertEqual(message, codec.decode(encoded))
+                self.assertEqual(message, codec.decode(encoded.encode("utf-8")))
+                # values the fast backends reject fall back to the standard library
+                self.assertIn("1180591620717411303424", codec.encode({"big": 2 ** 70, 1: "one"}))
+                self.assertIn("one", codec.encode({"big": 2 ** 70, 1: "one"}))
+                self.assertEqual(float("inf"), codec.decode('{"a": Infinity}')["a"])
+
+    def test_json(self):
+        codec = JsonCodec("json")
+        message = {"id": "1", "method": "query", "params": ["SELECT * FROM user;", {"name": "Jürgen"}]}
+        encoded = codec.encode(message)
+        self.assertIsInstance(encoded, str)
+        self.assertIn("Jürgen", encoded)
+        self.assertEqual(message, codec.decode(encoded))
+        self.assertIsNone(codec.subprotocols)
+
+    def test_cbor(self):
+        codec = CborCodec()
+        message = {"id": "1", "method": "query", "params": ["SELECT * FROM $id;", {"id": RecordID("user", "tobie")}]}
+        encoded = codec.encode(message)
+        self.assertIsInstance(encoded, bytes)
+        self.assertEqual(message, codec.decode(encoded))
+        self.assertEqual(["cbor"], codec.subprotocols)
+        with self.assertRaises(Exception):
+            codec.decode('{"id": "1"}')
+
+
+if __name__ == "__main__":
+    main()
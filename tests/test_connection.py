@@ -1,7 +1,11 @@
 from typing import List
 from unittest import TestCase, main
 
+from sblpy.cache import QueryCache
+from sblpy.cbor import RecordID
 from sblpy.connection import SurrealSyncConnection
+from sblpy.errors import SurrealLiteError
+from sblpy.query import Query
 
 
 class TestSurrealSyncConnection(TestCase):
@@ -102,6 +106,126 @@ class TestSurrealSyncConnection(TestCase):
             outcome
         )
 
+    def test_query_many(self):
+        self.queries = ["DELETE user;"]
+        outcome = self.connection.query_many(
+            [f"CREATE user:{i} SET name = 'user {i}';" for i in range(50)]
+            + [Query("SELECT * FROM user WHERE name = $name;", {"name": "user 7"})],
+            window=8
+        )
+        self.assertEqual(51, len(outcome))
+        self.assertEqual([{'id': 'user:0', 'name': 'user 0'}], outcome[0])
+        self.assertEqual([{'id': 'user:7', 'name': 'user 7'}], outcome[50])
+
+    def test_pipeline(self):
+        self.queries = ["DELETE user;"]
+        with self.connection.pipeline(window=2) as pipeline:
+            pipeline.query("CREATE user:tobie SET name = 'Tobie';")
+            pipeline.query("CREATE user:jaime SET name = $name;", {"name": "Jaime"})
+        self.assertEqual(
+            [[{'id': 'user:tobie', 'name': 'Tobie'}], [{'id': 'user:jaime', 'name': 'Jaime'}]],
+            pipeline.results
+        )
+
+    def test_pipeline_error(self):
+        self.queries = ["DELETE user;"]
+        self.connection.query("CREATE user:tobie SET name = 'Tobie';")
+        pipeline = self.connection.pipeline(window=2)
+        pipeline.query("CREATE user:tobie SET name = 'Tobie';")
+        pipeline.query("CREATE user:jaime SET name = 'Jaime';")
+        with self.assertRaises(Exception) as context:
+            pipeline.execute()
+        self.assertEqual(
+            "error querying: Database record `user:tobie` already exists",
+            str(context.exception)
+        )
+        # all the responses were read before the error was raised so the connection is still in sync
+        self.assertEqual(2, len(self.connection.query("SELECT * FROM user;")))
+
+    def test_pipeline_same_query_twice(self):
+        self.queries = ["DELETE user;"]
+        query = Query("SELECT * FROM user;")
+        pipeline = self.connection.pipeline(window=2)
+        pipeline.add(query)
+        pipeline.query("CREATE user:tobie SET name = 'Tobie';")
+        pipeline.add(query)
+        self.assertEqual(3, len(pipeline.execute()))
+
+    def test_abandoned_pipeline(self):
+        self.queries = ["DELETE user;"]
+        pipeline = self.connection.pipeline(window=10)
+        for i in range(5):
+            pipeline.query(f"CREATE user:{i} SET name = 'user {i}';")
+        self.assertEqual(5, len(self.connection.unanswered))
+        # the responses of the abandoned pipeline are not taken for the response of the next query
+        outcome = self.connection.query("SELECT * FROM user WHERE name = 'user 3';")
+        self.assertEqual([{'id': 'user:3', 'name': 'user 3'}], outcome)
+        self.assertEqual(0, len(self.connection.unanswered))
+        with self.assertRaises(SurrealLiteError):
+            pipeline.execute()
+
+    def test_query_stream(self):
+        self.queries = ["DELETE user;"]
+        self.connection.query_many([f"CREATE user:{i} SET name = 'user {i}';" for i in range(10)])
+        records = list(self.connection.query_stream("SELECT * FROM user ORDER BY name;", max_size=2 ** 24))
+        self.assertEqual(10, len(records))
+        self.assertEqual({'id': 'user:0', 'name': 'user 0'}, records[0])
+        # stopping early leaves the connection in sync
+        stream = self.connection.query_stream("SELECT * FROM user;")
+        next(stream)
+        stream.close()
+        self.assertEqual(10, len(self.connection.query("SELECT * FROM user;")))
+
+    def test_stream(self):
+        self.queries = ["DELETE user;"]
+        self.connection.query_many([f"CREATE user:{i} SET name = 'user {i}', age = {i % 5};" for i in range(25)])
+        records = list(self.connection.stream("user", batch_size=10))
+        self.assertEqual(25, len(records))
+        self.assertEqual(25, len({record["id"] for record in records}))
+        records = list(self.connection.stream(
+            "user", batch_size=4, where="age > $age", order_by="age DESC", vars={"age": 2}
+        ))
+        self.assertEqual(10, len(records))
+        self.assertEqual([4] * 5 + [3] * 5, [record["age"] for record in records])
+
+    def test_query_cache(self):
+        self.queries = ["DELETE user;"]
+        cache = QueryCache()
+        self.connection.query_cache = cache
+        self.connection.query("CREATE user:tobie SET name = 'Tobie';")
+        self.assertEqual(1, len(self.connection.query("SELECT * FROM user;")))
+        self.assertEqual(1, len(self.connection.query("SELECT * FROM user;")))
+        self.assertEqual(1, cache.hits)
+        # the write drops the cached select so the new record is read
+        self.connection.query("CREATE user:jaime SET name = 'Jaime';")
+        self.assertEqual(2, len(self.connection.query("SELECT * FROM user;")))
+        self.assertEqual(1, cache.invalidations)
+
+    def test_rpc_methods(self):
+        self.queries = ["DELETE user;"]
+        cache = QueryCache()
+        self.connection.query_cache = cache
+        self.assertEqual({'id': 'user:tobie', 'name': 'Tobie'}, self.connection.create("user:tobie", {"name": "Tobie"}))
+        self.connection.insert("user", [{"id": "jaime", "name": "Jaime"}, {"id": "mary", "name": "Mary"}])
+        self.assertEqual(3, len(self.connection.query("SELECT * FROM user;")))
+        self.connection.merge("user:tobie", {"age": 30})
+        self.assertEqual({'id': 'user:tobie', 'name': 'Tobie', 'age': 30}, self.connection.select("user:tobie"))
+        self.connection.delete("user:mary")
+        # the writes dropped the cached select
+        self.assertEqual(2, len(self.connection.query("SELECT * FROM user;")))
+        with self.assertRaises(Exception):
+            self.connection.create("user:tobie", {"name": "Tobie"})
+
+    def test_cbor_protocol(self):
+        self.queries = ["DELETE user;"]
+        connection = SurrealSyncConnection("localhost", 8000, "root", "root", protocol="cbor")
+        connection.query("CREATE user:tobie SET name = 'Tobie';")
+        outcome = connection.query("SELECT * FROM $id;", {"id": RecordID("user", "tobie")})
+        self.assertEqual([{'id': RecordID("user", "tobie"), 'name': 'Tobie'}], outcome)
+        # record IDs given as strings are sent as record IDs
+        self.assertEqual({'id': RecordID("user", "tobie"), 'name': 'Tobie'}, connection.select("user:tobie"))
+        connection.socket.close()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,40 @@
+from unittest import TestCase, main
+
+from sblpy.query import Priority, Query
+
+
+class TestQuery(TestCase):
+
+    def test_with_timeout(self):
+        query = Query("SELECT * FROM user;  \n", {"age": 1}, Priority.BATCH, "tenant")
+        timed = query.with_timeout(1.5)
+        self.assertEqual("SELECT * FROM user TIMEOUT 1500ms;", timed.sql)
+        self.assertEqual({"age": 1}, timed.vars)
+        self.assertEqual(Priority.BATCH, timed.priority)
+        self.assertEqual("tenant", timed.tenant)
+        self.assertEqual("SELECT * FROM user TIMEOUT 1ms;", Query("SELECT * FROM user").with_timeout(0.0001).sql)
+
+    def test_with_timeout_trailing_comment(self):
+        self.assertEqual(
+            "SELECT * FROM user TIMEOUT 2000ms;",
+            Query("SELECT * FROM user; -- every user\n").with_timeout(2).sql
+        )
+        self.assertEqual(
+            "SELECT * FROM user WHERE name = 'a -- b' TIMEOUT 2000ms;",
+            Query("SELECT * FROM user WHERE name = 'a -- b' /* by name */ ;").with_timeout(2).sql
+        )
+
+    def test_with_timeout_already_set(self):
+        query = Query("SELECT * FROM user TIMEOUT 5s;")
+        self.assertIs(query, query.with_timeout(1))
+        query = Query("SELECT * FROM user timeout $limit; // set by the caller")
+        self.assertIs(query, query.with_timeout(1))
+        # a TIMEOUT in a string is not a clause
+        self.assertEqual(
+            "SELECT * FROM log WHERE message = 'TIMEOUT 5s' TIMEOUT 1000ms;",
+            Query("SELECT * FROM log WHERE message = 'TIMEOUT 5s';").with_timeout(1).sql
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import json
+from unittest import TestCase, main
+
+from sblpy.codec import CborCodec, JsonCodec
+from sblpy.response import Response
+
+
+class CountingCodec(JsonCodec):
+
+    def __init__(self):
+        super().__init__("json")
+        self.decoded = 0
+
+    def decode(self, data):
+        self.decoded += 1
+        return super().decode(data)
+
+
+class TestResponse(TestCase):
+
+    def setUp(self):
+        self.statements = [{"result": [{"id": "user:tobie", "name": "Tobie"}], "status": "OK", "time": "1ms"}]
+        self.frame = json.dumps({"id": "abc", "result": self.statements}, separators=(",", ":"))
+
+    def test_lazy_result(self):
+        codec = CountingCodec()
+        response = Response(self.frame, codec)
+        self.assertEqual("abc", response.id)
+        self.assertTrue(response.ok)
+        self.assertIsNone(response.error)
+        self.assertEqual(0, codec.decoded)
+        self.assertEqual(self.statements, response["result"])
+        self.assertEqual([{"id": "user:tobie", "name": "Tobie"}], response["result"][0]["result"])
+        self.assertEqual(["OK"], response.statuses)
+        self.assertEqual(1, codec.decoded)
+
+    def test_mapping(self):
+        response = Response(self.frame, JsonCodec("json"))
+        self.assertEqual({"id": "abc", "result": self.statements}, response)
+        self.assertEqual({"id": "abc", "result": self.statements}, dict(response))
+        self.assertEqual("abc", response.get("id"))
+        self.assertIsNone(response.get("error"))
+        self.assertNotIn("error", response)
+
+    def test_to_dict(self):
+        response = Response(self.frame, JsonCodec("json"))
+        decoded = response.to_dict()
+        self.assertIsInstance(decoded, dict)
+        self.assertEqual({"id": "abc", "result": self.statements}, decoded)
+        self.assertEqual(json.loads(self.frame), json.loads(json.dumps(decoded)))
+        # the dictionary is the caller's own, changing it leaves the response as it was
+        decoded["result"][0]["status"] = "ERR"
+        self.assertEqual("OK", response["result"][0]["status"])
+        self.assertIsNot(decoded, response.to_dict())
+
+    def test_raw(self):
+        response = Response(self.frame, JsonCodec("json"))
+        self.assertEqual(self.frame.encode("utf-8"), response.raw)
+        self.assertEqual(json.dumps(self.statements, separators=(",", ":")).encode("utf-8"), response.raw_result)
+
+    def test_statement_error(self):
+        statements = [
+            {"result": [], "status": "OK", "time": "1ms"},
+            {"result": "Database record `user:tobie` already exists", "status": "ERR", "time": "1ms"}
+        ]
+        response = Response(json.dumps({"id": "abc", "result": statements}), JsonCodec("json"))
+        self.assertFalse(response.ok)
+        self.assertEqual(["Database record `user:tobie` already exists"], response.errors)
+        self.assertEqual(["OK", "ERR"], response.statuses)
+
+    def test_request_error(self):
+        frame = json.dumps({"error": {"code": -32000, "message": "Parse error"}, "id": "abc"})
+        response = Response(frame, JsonCodec("json"))
+        self.assertEqual("abc", response.id)
+        self.assertFalse(response.ok)
+        self.assertEqual({"code": -32000, "message": "Parse error"}, response.error)
+        self.assertIsNone(response.result)
+        self.assertEqual({"code": -32000, "message": "Parse error"}, response["error"])
+
+    def test_cbor(self):
+        codec = CborCodec()
+        frame = codec.encode({"id": "abc", "result": self.statements})
+        response = Response(frame, codec)
+        self.assertEqual("abc", response.id)
+        self.assertTrue(response.ok)
+        self.assertEqual(frame, response.raw)
+        self.assertEqual(codec.encode(self.statements), response.raw_result)
+        self.assertEqual(self.statements, response["result"])
+
+
+if __name__ == "__main__":
+    main()
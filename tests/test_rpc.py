@@ -0,0 +1,104 @@
+from unittest import TestCase, main
+
+from sblpy.cbor import RecordID, Table
+from sblpy.query import Priority
+from sblpy.rpc import RpcCall, RpcMethods, encode_thing, record_key, thing_table, unpack_result
+
+
+class RecordingMethods(RpcMethods):
+
+    def __init__(self):
+        self.calls = []
+
+    def call(self, rpc):
+        self.calls.append(rpc)
+        return rpc.method
+
+
+class TestThings(TestCase):
+
+    def test_record_key(self):
+        self.assertEqual(("user", 1), record_key("user:1"))
+        self.assertEqual(("user", "tobie"), record_key("user:tobie"))
+        self.assertEqual(("user", "1"), record_key("user:⟨1⟩"))
+        self.assertEqual(("user", 1), record_key(RecordID("user", 1)))
+        with self.assertRaises(ValueError):
+            record_key("user")
+
+    def test_thing_table(self):
+        self.assertEqual("user", thing_table("user"))
+        self.assertEqual("user", thing_table("user:tobie"))
+        self.assertEqual("user", thing_table(RecordID("user", 1)))
+        self.assertEqual("user", thing_table(Table("user")))
+
+    def test_encode_thing_cbor(self):
+        self.assertEqual(RecordID("user", 1), encode_thing("user:1", "cbor"))
+        self.assertEqual(RecordID("user", "tobie"), encode_thing("user:tobie", "cbor"))
+        self.assertEqual(Table("user"), encode_thing("user", "cbor"))
+        self.assertEqual(RecordID("user", 2), encode_thing(RecordID("user", 2), "cbor"))
+
+    def test_encode_thing_json(self):
+        self.assertEqual("user:1", encode_thing("user:1", "json"))
+        self.assertEqual("user:tobie", encode_thing(RecordID("user", "tobie"), "json"))
+        self.assertEqual("user", encode_thing(Table("user"), "json"))
+
+
+class TestRpcCall(TestCase):
+
+    def test_query_params(self):
+        call = RpcCall("merge", ["user:1", {"age": 2}], Priority.INTERACTIVE, "tenant")
+        self.assertEqual(
+            {"id": call.id, "method": "merge", "params": ["user:1", {"age": 2}]},
+            call.query_params
+        )
+        self.assertEqual("user", call.table)
+        self.assertEqual(True, call.writes)
+        self.assertEqual(False, RpcCall("select", ["user"]).writes)
+
+    def test_for_protocol(self):
+        call = RpcCall("update", ["user:1", {"age": 2}], Priority.INTERACTIVE, "tenant")
+        encoded = call.for_protocol("cbor")
+        self.assertEqual([RecordID("user", 1), {"age": 2}], encoded.params)
+        self.assertEqual(call.id, encoded.id)
+        self.assertEqual(Priority.INTERACTIVE, encoded.priority)
+        self.assertEqual("tenant", encoded.tenant)
+        # the call passed in is left as it is
+        self.assertEqual(["user:1", {"age": 2}], call.params)
+
+    def test_unpack_result(self):
+        self.assertEqual([{"id": "user:1"}], unpack_result({"id": "1", "result": [{"id": "user:1"}]}, "select"))
+        self.assertEqual(None, unpack_result({"id": "1", "result": None}, "select"))
+        with self.assertRaises(Exception) as context:
+            unpack_result({"id": "1", "error": {"code": -32000, "message": "boom"}}, "create")
+        self.assertEqual("error calling create: boom", str(context.exception))
+
+
+class TestRpcMethods(TestCase):
+
+    def test_params(self):
+        methods = RecordingMethods()
+        self.assertEqual("select", methods.select("user:1"))
+        methods.create("user")
+        methods.create("user", {"name": "Tobie"})
+        methods.insert("user", [{"id": 1}, {"id": 2}])
+        methods.update("user:1", {"name": "Jaime"})
+        methods.merge("user:1", {"age": 2})
+        methods.patch("user:1", [{"op": "replace", "path": "/age", "value": 3}], True)
+        methods.delete("user")
+        self.assertEqual(
+            [
+                ("select", ["user:1"]),
+                ("create", ["user"]),
+                ("create", ["user", {"name": "Tobie"}]),
+                ("insert", ["user", [{"id": 1}, {"id": 2}]]),
+                ("update", ["user:1", {"name": "Jaime"}]),
+                ("merge", ["user:1", {"age": 2}]),
+                ("patch", ["user:1", [{"op": "replace", "path": "/age", "value": 3}], True]),
+                ("delete", ["user"]),
+            ],
+            [(call.method, call.params) for call in methods.calls]
+        )
+
+
+if __name__ == "__main__":
+    main()
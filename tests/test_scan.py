@@ -0,0 +1,91 @@
+from unittest import TestCase, main
+
+from sblpy.scan import CURSOR_FIELD, TableScan, bound_query, field_value, split_range
+
+
+class TestTableScan(TestCase):
+
+    def test_first_page(self):
+        query = TableScan("user", batch_size=2).query()
+        self.assertEqual(
+            f"SELECT *, meta::id(id) AS {CURSOR_FIELD} FROM type::table($sblpy_table) ORDER BY id ASC LIMIT 2;",
+            query.sql
+        )
+        self.assertEqual({"sblpy_table": "user"}, query.vars)
+
+    def test_next_page(self):
+        scan = TableScan("user", batch_size=2, where="age > $age", vars={"age": 18})
+        records = scan.advance([
+            {"id": "user:1", "age": 20, CURSOR_FIELD: 1},
+            {"id": "user:2", "age": 30, CURSOR_FIELD: 2},
+        ])
+        self.assertEqual([{"id": "user:1", "age": 20}, {"id": "user:2", "age": 30}], records)
+        self.assertFalse(scan.done)
+        query = scan.query()
+        self.assertEqual(
+            "SELECT *, meta::id(id) AS sblpy_cursor FROM type::table($sblpy_table) "
+            "WHERE (age > $age) AND id > type::thing($sblpy_table, $sblpy_after) ORDER BY id ASC LIMIT 2;",
+            query.sql
+        )
+        self.assertEqual({"age": 18, "sblpy_table": "user", "sblpy_after": 2}, query.vars)
+        scan.advance([{"id": "user:3", "age": 40, CURSOR_FIELD: 3}])
+        self.assertTrue(scan.done)
+
+    def test_order_by(self):
+        scan = TableScan("user", batch_size=1, order_by="profile.joined DESC")
+        self.assertTrue(scan.descending)
+        scan.advance([{"id": "user:1", "profile": {"joined": 5}, CURSOR_FIELD: 1}])
+        query = scan.query()
+        self.assertEqual(
+            "SELECT *, meta::id(id) AS sblpy_cursor FROM type::table($sblpy_table) "
+            "WHERE (profile.joined < $sblpy_last OR (profile.joined = $sblpy_last "
+            "AND id < type::thing($sblpy_table, $sblpy_after))) ORDER BY profile.joined DESC, id DESC LIMIT 1;",
+            query.sql
+        )
+        self.assertEqual({"sblpy_table": "user", "sblpy_after": 1, "sblpy_last": 5}, query.vars)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            TableScan("user", order_by="name; DELETE user")
+        with self.assertRaises(ValueError):
+            TableScan("user", batch_size=0)
+
+    def test_range(self):
+        query = TableScan("user", batch_size=2, start=10, end=20).query()
+        self.assertEqual(
+            "SELECT *, meta::id(id) AS sblpy_cursor FROM type::table($sblpy_table) "
+            "WHERE id >= type::thing($sblpy_table, $sblpy_start) AND id < type::thing($sblpy_table, $sblpy_end) "
+            "ORDER BY id ASC LIMIT 2;",
+            query.sql
+        )
+        self.assertEqual({"sblpy_table": "user", "sblpy_start": 10, "sblpy_end": 20}, query.vars)
+        query = TableScan("user", batch_size=2, order_by="age", start=18).query()
+        self.assertEqual(
+            "SELECT *, meta::id(id) AS sblpy_cursor FROM type::table($sblpy_table) "
+            "WHERE age >= $sblpy_start ORDER BY age ASC, id ASC LIMIT 2;",
+            query.sql
+        )
+
+    def test_split_range(self):
+        self.assertEqual([(None, 25), (25, 50), (50, 75), (75, None)], split_range(0, 100, 4))
+        self.assertEqual([(None, 0.5), (0.5, None)], split_range(0.0, 1.0, 2))
+        self.assertEqual([(None, None)], split_range(5, 5, 3))
+        self.assertEqual([(None, 1), (1, None)], split_range(0, 2, 5))
+
+    def test_bound_query(self):
+        self.assertEqual(
+            "SELECT meta::id(id) AS sblpy_cursor, id FROM type::table($sblpy_table) ORDER BY id DESC LIMIT 1;",
+            bound_query("user", descending=True).sql
+        )
+        self.assertEqual(
+            "SELECT age AS sblpy_cursor, age FROM type::table($sblpy_table) WHERE age != NONE ORDER BY age ASC LIMIT 1;",
+            bound_query("user", field="age").sql
+        )
+
+    def test_field_value(self):
+        self.assertEqual(5, field_value({"a": {"b": 5}}, "a.b"))
+        self.assertIsNone(field_value({"a": 1}, "a.b"))
+
+
+if __name__ == "__main__":
+    main()
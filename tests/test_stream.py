@@ -0,0 +1,93 @@
+import json
+from unittest import TestCase, main
+
+from sblpy.cbor import RecordID, encode
+from sblpy.codec import CborCodec, Codec, JsonCodec
+from sblpy.errors import SurrealLiteError
+from sblpy.response import Response
+from sblpy.stream import CborRecordStream, JsonRecordStream, RecordStream, open_record_stream
+
+
+def read(stream, frame, size):
+    records = []
+    for start in range(0, len(frame), size):
+        records.extend(stream.feed(frame[start:start + size]))
+    records.extend(stream.close())
+    return records
+
+
+class TestRecordStream(TestCase):
+
+    def setUp(self):
+        self.records = [
+            {"id": f"user:{i}", "name": f"üser {i}", "score": i * 1.5, "tags": ["a", "b"]} for i in range(200)
+        ] + [10, 2.5e-3, "text", None, True]
+        self.message = {
+            "id": "abc",
+            "result": [
+                {"result": self.records, "status": "OK", "time": "1ms"},
+                {"result": [], "status": "OK", "time": "1ms"},
+            ]
+        }
+
+    def test_open_record_stream(self):
+        self.assertIsInstance(open_record_stream(JsonCodec("json")), JsonRecordStream)
+        self.assertIsInstance(open_record_stream(CborCodec()), CborRecordStream)
+        self.assertIs(RecordStream, type(open_record_stream(Codec())))
+
+    def test_json_parts(self):
+        frame = json.dumps(self.message, separators=(",", ":"), ensure_ascii=False)
+        for size in (1, 2, 7, 64, len(frame)):
+            self.assertEqual(self.records, read(JsonRecordStream(JsonCodec("json")), frame, size))
+            self.assertEqual(self.records, read(JsonRecordStream(JsonCodec("json")), frame.encode("utf-8"), size))
+
+    def test_json_records_before_close(self):
+        frame = json.dumps(self.message, separators=(",", ":"))
+        stream = JsonRecordStream(JsonCodec("json"))
+        # the records are decoded as the frame is fed in rather than when it ends
+        self.assertEqual(self.records, list(stream.feed(frame)))
+        self.assertEqual([], list(stream.close()))
+
+    def test_cbor_parts(self):
+        records = [{"id": RecordID("user", i), "name": f"üser {i}"} for i in range(200)]
+        self.message["result"][0]["result"] = records
+        frame = encode(self.message)
+        for size in (1, 3, 64, len(frame)):
+            self.assertEqual(records, read(CborRecordStream(CborCodec()), frame, size))
+
+    def test_cbor_indefinite_length(self):
+        # {"id": "a", "result": [{"result": [_ 1, 2], ...}]} with the records in an indefinite length array
+        frame = bytes.fromhex("a2626964616166726573756c7481a166726573756c749f0102ff")
+        self.assertEqual([1, 2], read(CborRecordStream(CborCodec()), frame, 1))
+
+    def test_full_decode(self):
+        for codec, encoder in ((JsonCodec("json"), json.dumps), (CborCodec(), encode)):
+            single = encoder({"id": "abc", "result": [{"result": 5, "status": "OK", "time": "1ms"}]})
+            self.assertEqual([5], read(open_record_stream(codec), single, 4))
+            # keys that are not sorted cannot be streamed and are decoded when the frame ends
+            unsorted = encoder({"result": [{"status": "OK", "time": "1ms", "result": [1, 2]}], "id": "abc"})
+            self.assertEqual([1, 2], read(open_record_stream(codec), unsorted, 4))
+
+    def test_errors(self):
+        for codec, encoder in ((JsonCodec("json"), json.dumps), (CborCodec(), encode)):
+            failed = encoder({"id": "abc", "result": [{"result": "boom", "status": "ERR", "time": "1ms"}]})
+            with self.assertRaises(Exception) as context:
+                read(open_record_stream(codec), failed, 4)
+            self.assertEqual("error querying: boom", str(context.exception))
+            cut = encoder(self.message)[:-200]
+            with self.assertRaises(SurrealLiteError):
+                read(open_record_stream(codec), cut, 64)
+
+    def test_response_records(self):
+        frame = json.dumps(self.message, separators=(",", ":"))
+        self.assertEqual(self.records, list(Response(frame, JsonCodec("json")).records()))
+        response = Response(frame, JsonCodec("json"))
+        _ = response.result
+        self.assertEqual(self.records, list(response.records()))
+        error = json.dumps({"error": {"code": -32000, "message": "Parse error"}, "id": "abc"})
+        with self.assertRaises(Exception):
+            list(Response(error, JsonCodec("json")).records())
+
+
+if __name__ == "__main__":
+    main()